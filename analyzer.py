@@ -0,0 +1,245 @@
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from models.event_filter import EventFilter
+from models.filter_set import FilterSet
+from models.run_stats import RunStats
+from models.scan_result import ScanResult
+from parsers.binary_scanner import BinaryScanner
+from parsers.block_scanner import BlockIndexScanner
+from parsers.compact_store import CompactScanner, CompactStore
+from parsers.events_parser import EventsParser
+from parsers.gzip_index import READ_BLOCK_SIZE
+from parsers.log_parser import LogParser
+from parsers.parallel_scanner import ParallelScanner
+from parsers.scan_cache import CachedScanner
+from parsers.stats_scanner import StatsScanner
+
+def describe_filter(filter_obj: EventFilter) -> str:
+    filter_desc = f"Event: {filter_obj.event_type}"
+
+    if filter_obj.level:
+        filter_desc += f" level [{filter_obj.level}]"
+
+    if filter_obj.pattern:
+        filter_desc += f" pattern [{filter_obj.pattern.pattern}]"
+
+    if filter_obj.top is not None:
+        filter_desc += f" top [{filter_obj.top} by {filter_obj.group_by}]"
+
+    if filter_obj.distinct is not None:
+        filter_desc += f" distinct [{filter_obj.distinct}]"
+
+    return filter_desc
+
+class FilterResult:
+    """One filter of an AnalysisResult: the filter, its match count, lines and time series"""
+
+    def __init__(self, index: int, filter_obj: EventFilter, scan_result: ScanResult):
+        self.index = index
+        self.filter = filter_obj
+        self.matches = scan_result.counts[index]
+        # The --top/--distinct aggregates, None for other filters
+        self.sketch = scan_result.sketches[index]
+        self._scan_result = scan_result
+
+    @property
+    def description(self) -> str:
+        return describe_filter(self.filter)
+
+    # Whether only matches are counted (--count, --top or --distinct), so there are no lines
+    @property
+    def count_only(self) -> bool:
+        return self.filter.count or self.filter.aggregated
+
+    # (key, count, error) of the --top most frequent --group-by keys, most
+    # frequent first; each count is at most error above the true count
+    def top(self) -> List[Tuple[str, int, int]]:
+        if self.sketch is None or self.sketch.top is None:
+            return []
+        return self.sketch.top.top(self.filter.top)
+
+    # Estimated number of distinct --distinct keys, None without --distinct
+    def distinct(self) -> Optional[int]:
+        if self.sketch is None or self.sketch.distinct is None:
+            return None
+        return self.sketch.distinct.estimate()
+
+    # The kept matching lines, formatted like the log lines they came from
+    def lines(self) -> Iterator[str]:
+        return self._scan_result.matches(self.index)
+
+    # (bucket start epoch, count) of the non-empty time buckets; empty without a bucket width
+    def series(self) -> List[Tuple[int, int]]:
+        histogram = self._scan_result.histogram
+        return histogram.series(self.index) if histogram is not None else []
+
+    # The filter, its match count and any --top/--distinct aggregates,
+    # without lines or series
+    def to_dict(self) -> Dict:
+        result = {
+            'index': self.index,
+            'filter': self.description,
+            'event_type': self.filter.event_type,
+            'level': self.filter.level,
+            'pattern': self.filter.pattern.pattern if self.filter.pattern else None,
+            'count_only': self.count_only,
+            'matches': self.matches,
+        }
+        sketch = self.sketch
+        if sketch is not None and sketch.top is not None:
+            result['top'] = {
+                'group_by': self.filter.group_by,
+                'max_error': sketch.top.max_error,
+                'keys': [{'key': key, 'count': count, 'error': error}
+                         for key, count, error in self.top()],
+            }
+        if sketch is not None and sketch.distinct is not None:
+            result['distinct'] = {
+                'group': self.filter.distinct,
+                'estimate': self.distinct(),
+                'relative_error': round(sketch.distinct.relative_error, 4),
+            }
+        return result
+
+class AnalysisResult:
+    """The results of one analysis, one FilterResult per filter in events-file order
+
+    Matching lines may be held in spill files (stream=True), which are
+    removed by close(); use the result as a context manager.
+    """
+
+    def __init__(self, scan_result: ScanResult, pruned_files: int = 0):
+        self.scan_result = scan_result
+        self.filters = [FilterResult(index, filter_obj, scan_result)
+                        for index, filter_obj in enumerate(scan_result.filter_set.filters)]
+        self.pruned_files = pruned_files
+
+    @property
+    def total_entries(self) -> int:
+        return self.scan_result.total_entries
+
+    # Width of the time buckets in seconds, None without a bucket width
+    @property
+    def bucket_seconds(self) -> Optional[int]:
+        histogram = self.scan_result.histogram
+        return histogram.width if histogram is not None else None
+
+    def __iter__(self) -> Iterator[FilterResult]:
+        return iter(self.filters)
+
+    def __len__(self) -> int:
+        return len(self.filters)
+
+    def __getitem__(self, index: int) -> FilterResult:
+        return self.filters[index]
+
+    def close(self) -> None:
+        self.scan_result.close()
+
+    def __enter__(self) -> 'AnalysisResult':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+class Analyzer:
+    """Scans a log folder (or a compact store) with a set of filters, for use as a library
+
+        with Analyzer('/logs', 'events.txt', workers=4).run(from_time) as result:
+            for filter_result in result:
+                print(filter_result.description, filter_result.matches)
+
+    filters is an events file path, a FilterSet or a list of EventFilters.
+    The other options are those of main.py (chunk_size and block_size in
+    bytes), and the scanner is picked the same way. An Analyzer can be run
+    any number of times; each run reads the folder again.
+    """
+
+    def __init__(self, log_dir: str, filters: Union[str, FilterSet, Sequence[EventFilter]],
+                 seek: bool = False, gz_index: bool = False, binary: bool = False,
+                 workers: int = 1, chunk_size: int = 64 * 1024 * 1024,
+                 cache_dir: Optional[str] = None, max_lines: Optional[int] = None,
+                 stream: bool = False, spill_dir: Optional[str] = None,
+                 bucket: Optional[int] = None, decompress_threads: int = 1,
+                 recursive: bool = False, include: Optional[List[str]] = None,
+                 exclude: Optional[List[str]] = None, prune: bool = False,
+                 read_ahead: int = 0, block_size: int = READ_BLOCK_SIZE,
+                 merge_by_time: bool = False, reorder_window: int = 0,
+                 block_index: bool = False, stats: Optional[RunStats] = None):
+        if isinstance(filters, str):
+            filters = EventsParser(filters).parse_filter_set()
+        self.filter_set = filters if isinstance(filters, FilterSet) else FilterSet(list(filters))
+        self.log_dir = log_dir
+        self.log_parser = LogParser(log_dir, seek=seek, gz_index=gz_index,
+                                    event_types=self.filter_set.event_types,
+                                    decompress_threads=decompress_threads, recursive=recursive,
+                                    include=include, exclude=exclude, prune=prune,
+                                    read_ahead=read_ahead, block_size=block_size,
+                                    merge_by_time=merge_by_time, reorder_window=reorder_window)
+        self.binary = binary
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.cache_dir = cache_dir
+        self.max_lines = max_lines
+        self.stream = stream
+        self.spill_dir = spill_dir
+        self.bucket = bucket
+        # Skip blocks no filter can match using per-file block indexes
+        self.block_index = block_index
+        # Filled in with timings (and per-file figures for a serial scan) when given
+        self.stats = stats
+
+    # Whether log_dir is a compact store rather than a folder of log files
+    @property
+    def is_compact_store(self) -> bool:
+        return CompactStore.is_store(self.log_dir)
+
+    def run(self, from_time: Optional[datetime] = None,
+            to_time: Optional[datetime] = None) -> AnalysisResult:
+        scan_result = ScanResult(self.filter_set, self.max_lines, self.stream, self.spill_dir,
+                                 self.bucket)
+        try:
+            if self.is_compact_store:
+                with CompactStore(self.log_dir) as store:
+                    self._scan(CompactScanner(store, self.filter_set), scan_result, from_time, to_time)
+                return AnalysisResult(scan_result)
+            self._scan(self._scanner(), scan_result, from_time, to_time)
+        except BaseException:
+            scan_result.close()
+            raise
+        return AnalysisResult(scan_result, self.log_parser.pruned_files)
+
+    # The scanner for the chosen options; None streams parse_all_logs
+    # through ScanResult.collect
+    def _scanner(self):
+        log_parser, filter_set = self.log_parser, self.filter_set
+        if self.cache_dir:
+            return CachedScanner(log_parser, filter_set, self.cache_dir)
+        if self.workers > 1:
+            return ParallelScanner(log_parser, filter_set, self.workers, self.chunk_size,
+                                   binary=self.binary)
+        if self.block_index:
+            return BlockIndexScanner(log_parser, filter_set)
+        # Per-file statistics need the files read one after another, as text
+        if self.stats is not None and not (log_parser.merge_by_time or self.binary):
+            return StatsScanner(log_parser, filter_set, self.stats)
+        if self.binary:
+            return BinaryScanner(log_parser, filter_set)
+        return None
+
+    def _scan(self, scanner, scan_result: ScanResult, from_time: Optional[datetime],
+              to_time: Optional[datetime]) -> None:
+        # StatsScanner times its own stages
+        if self.stats is None or isinstance(scanner, StatsScanner):
+            self._run_scanner(scanner, scan_result, from_time, to_time)
+            return
+        with self.stats.stage('scan'):
+            self._run_scanner(scanner, scan_result, from_time, to_time)
+        self.stats.entries = scan_result.total_entries
+
+    def _run_scanner(self, scanner, scan_result: ScanResult, from_time: Optional[datetime],
+                     to_time: Optional[datetime]) -> None:
+        if scanner is None:
+            scan_result.collect(self.log_parser.parse_all_logs(from_time, to_time))
+        else:
+            scanner.scan(scan_result, from_time, to_time)
@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import gzip
+import os
+import random
+
+# Message templates per event type, in the style of sample.log. Each is
+# (level, message template, pattern matching it); {n} is an integer, {f} a
+# decimal, {ip} an address, {id} a device UUID.
+TEMPLATES: Dict[str, List[Tuple[str, str, str]]] = {
+    'TELEMETRY': [
+        ('INFO', 'Iteration time: {f} sec', r'^Iteration time:\s\d+\.\d+\ssec$'),
+        ('INFO', 'system status check completed', r'^system status check completed$'),
+    ],
+    'DEVICE': [
+        ('WARNING', 'detected high temperature of device {id}: {n}C',
+         r'^detected high temperature of device\s[a-f0-9\-]{36}:\s\d+C$'),
+        ('WARNING', 'low memory warning: {n}% usage', r'^low memory warning:\s\d+%\susage$'),
+        ('WARNING', 'disk space low: {n}% full', r'^disk space low:\s\d+%\sfull$'),
+        ('WARNING', 'network latency high: {n}ms', r'^network latency high:\s\d+ms$'),
+        ('WARNING', 'CPU usage elevated: {n}%', r'^CPU usage elevated:\s\d+%$'),
+        ('WARNING', 'fan speed below threshold: {n} RPM', r'^fan speed below threshold:\s\d+\sRPM$'),
+        ('INFO', 'system status check completed', r'^system status check completed$'),
+    ],
+    'GNMI': [
+        ('ERROR', 'unresponsive telemetry at endpoint http://{ip}/csv/xcset/low_freq_debug',
+         r'^unresponsive telemetry at endpoint\s.+$'),
+        ('ERROR', 'connection timeout at endpoint http://{ip}', r'^connection timeout at endpoint\s.+$'),
+        ('ERROR', 'authentication failed for endpoint http://{ip}', r'^authentication failed for endpoint\s.+$'),
+        ('ERROR', 'network unreachable: http://{ip}', r'^network unreachable:\s.+$'),
+        ('WARNING', 'retry attempt {n}/5 for endpoint detection',
+         r'^retry attempt \d+/\d+ for endpoint detection$'),
+    ],
+    # Event types that no generated filter asks for
+    'AUDIT': [
+        ('INFO', 'user session {n} opened from {ip}', r'^user session \d+ opened'),
+        ('INFO', 'configuration reloaded', r'^configuration reloaded$'),
+    ],
+}
+
+DEFAULT_MIX = {'TELEMETRY': 0.4, 'DEVICE': 0.3, 'GNMI': 0.2, 'AUDIT': 0.1}
+
+# Fraction of generated lines that are truncated, so they fail to parse
+DEFAULT_MALFORMED_RATIO = 0.001
+
+# Event types generated filters are drawn from
+FILTERED_EVENT_TYPES = ('TELEMETRY', 'DEVICE', 'GNMI')
+
+ORDERS = ('ordered', 'jittered', 'shuffled')
+
+START_TIME = datetime(2025, 6, 1)
+
+def _message(template: str, rng: random.Random) -> str:
+    if '{' not in template:
+        return template
+    return template.format(
+        n=rng.randint(1, 9999),
+        f=f"{rng.randint(0, 2000)}.{rng.randint(0, 999)}",
+        ip=f"192.168.{rng.randint(0, 255)}.{rng.randint(1, 254)}:{rng.randint(9000, 9100)}",
+        id=f"{rng.getrandbits(32):08x}-{rng.getrandbits(16):04x}-{rng.getrandbits(16):04x}-"
+           f"{rng.getrandbits(16):04x}-{rng.getrandbits(48):012x}",
+    )
+
+# count increasing timestamps, 0 to 2 seconds apart
+def _timestamps(count: int, rng: random.Random) -> List[datetime]:
+    timestamps = []
+    offset = 0
+    for _ in range(count):
+        offset += rng.randint(0, 2)
+        timestamps.append(START_TIME + timedelta(seconds=offset))
+    return timestamps
+
+# Reorder a file's increasing timestamps in place
+def _reorder(timestamps: List[datetime], order: str, rng: random.Random) -> None:
+    if order == 'jittered':
+        # Out of order within small windows, as with several writer threads
+        for start in range(0, len(timestamps), 8):
+            window = timestamps[start:start + 8]
+            rng.shuffle(window)
+            timestamps[start:start + 8] = window
+    elif order == 'shuffled':
+        rng.shuffle(timestamps)
+
+def generate_logs(out_dir: str, lines: int = 100_000, files: int = 4, gz_ratio: float = 0.25,
+                  mix: Optional[Dict[str, float]] = None, order: str = 'ordered',
+                  malformed_ratio: float = DEFAULT_MALFORMED_RATIO, seed: int = 0) -> List[str]:
+    """Write a reproducible log folder and return the paths of its files
+
+    The same arguments always give byte-identical files (gzip headers carry
+    no timestamp). Lines are split evenly over the files in time order, as
+    rotated logs would be, and files are compressed so that about gz_ratio of
+    them are .log.gz. mix weights the event types of TEMPLATES; order is one
+    of ORDERS and applies to each file's timestamps.
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Unknown timestamp order: {order}")
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    event_types = [event_type for event_type in mix if event_type in TEMPLATES]
+    weights = [mix[event_type] for event_type in event_types]
+    if not event_types:
+        raise ValueError("The event type mix names no known event type")
+    if files < 1:
+        raise ValueError("At least one log file is needed")
+
+    os.makedirs(out_dir, exist_ok=True)
+    timestamps = _timestamps(lines, rng)
+    per_file = -(-lines // files)
+    paths = []
+    for file_index in range(files):
+        file_times = timestamps[file_index * per_file:(file_index + 1) * per_file]
+        _reorder(file_times, order, rng)
+
+        chosen = rng.choices(event_types, weights, k=len(file_times))
+        output = []
+        for timestamp, event_type in zip(file_times, chosen):
+            if rng.random() < malformed_ratio:
+                output.append(f"{timestamp.isoformat()} truncated\n")
+                continue
+            level, template, _ = rng.choice(TEMPLATES[event_type])
+            output.append(f"{timestamp.isoformat()} {level} {event_type} {_message(template, rng)}\n")
+        data = ''.join(output).encode('utf-8')
+
+        compressed = int((file_index + 1) * gz_ratio) > int(file_index * gz_ratio)
+        path = os.path.join(out_dir, f"bench{file_index:03d}.log" + ('.gz' if compressed else ''))
+        with open(path, 'wb') as log_file:
+            log_file.write(gzip.compress(data, mtime=0) if compressed else data)
+        paths.append(path)
+    return paths
+
+def generate_events(path: str, filters: int = 23, pattern_ratio: float = 0.75,
+                    count_ratio: float = 0.25, seed: int = 0) -> str:
+    """Write a reproducible events file with the given number of filters
+
+    About pattern_ratio of the filters carry a --pattern taken from
+    TEMPLATES, and about count_ratio of them are --count filters; the rest
+    select by event type and level only.
+    """
+    rng = random.Random(seed)
+    lines = ["# Generated benchmark filters"]
+    for _ in range(filters):
+        event_type = rng.choice(FILTERED_EVENT_TYPES)
+        level, _, pattern = rng.choice(TEMPLATES[event_type])
+        parts = [event_type]
+        if rng.random() < count_ratio:
+            parts.append('--count')
+        if rng.random() < pattern_ratio:
+            parts.extend(['--pattern', pattern])
+        if len(parts) == 1 or rng.random() < 0.5:
+            parts.extend(['--level', level])
+        lines.append(' '.join(parts))
+    with open(path, 'w', encoding='utf-8') as events_file:
+        events_file.write('\n'.join(lines) + '\n')
+    return path
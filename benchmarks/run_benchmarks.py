@@ -0,0 +1,311 @@
+"""Benchmark the log analyzer stage by stage on generated logs
+
+    python -m benchmarks.run_benchmarks --lines 200000 --output before.json
+    python -m benchmarks.run_benchmarks --lines 200000 --compare before.json
+
+Logs and filters come from benchmarks.generator with a fixed seed, so two
+runs with the same options measure the same input. Each stage is timed
+(best of --repeat runs) and then run once more under tracemalloc for its
+peak Python memory, which keeps tracing overhead out of the timings.
+"""
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import gc
+import gzip
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import (DEFAULT_MALFORMED_RATIO, DEFAULT_MIX, ORDERS, TEMPLATES,
+                                  generate_events, generate_logs)
+from main import display_results, process_entries
+from models.log_entry import LogEntry
+from models.scan_result import ScanResult
+from parsers.binary_scanner import BinaryScanner
+from parsers.events_parser import EventsParser
+from parsers.log_parser import LogParser
+
+RESULTS_VERSION = 1
+
+# Percent by which lines/sec may drop, or peak memory grow, before a warning
+DEFAULT_THRESHOLD = 10.0
+
+class Stages:
+    """The measured stages over one generated log folder
+
+    read, parse, match and output each take the previous stage's output,
+    prepared up front, so every stage is measured on its own. end_to_end and
+    end_to_end_binary run the whole pipeline as main.py does.
+    """
+
+    def __init__(self, log_dir: str, events_file: str):
+        self.log_dir = log_dir
+        self.filter_set = EventsParser(events_file).parse_filter_set()
+        self.log_parser = LogParser(log_dir, event_types=self.filter_set.event_types)
+        self.files = LogParser(log_dir)._get_log_files()
+        self.lines: List[str] = []
+        self.entries: List[LogEntry] = []
+        self.matched: List[Tuple[LogEntry, List[int]]] = []
+
+    def prepare(self) -> None:
+        self.lines = self.read()
+        self.entries = self.parse()
+        self.matched = self.match()
+
+    def read(self) -> List[str]:
+        lines = []
+        for file_path in self.files:
+            opener = gzip.open if file_path.endswith('.gz') else open
+            with opener(file_path, 'rt', encoding='utf-8') as log_file:
+                lines.extend(log_file)
+        return lines
+
+    def parse(self) -> List[LogEntry]:
+        from_line, event_types = LogEntry.from_line, self.filter_set.event_types
+        return [entry for entry in (from_line(line, event_types) for line in self.lines) if entry]
+
+    def match(self) -> List[Tuple[LogEntry, List[int]]]:
+        match = self.filter_set.match
+        return [(entry, indexes) for entry, indexes in ((entry, match(entry)) for entry in self.entries)
+                if indexes]
+
+    def output(self) -> None:
+        with ScanResult(self.filter_set) as scan_result, _quiet():
+            for entry, indexes in self.matched:
+                line = None
+                for index in indexes:
+                    if line is None and scan_result.wants_lines(index):
+                        line = entry.format_line()
+                    scan_result.add_match(index, line, message=entry.message)
+            display_results(scan_result)
+
+    def end_to_end(self) -> None:
+        with _quiet():
+            process_entries(self.log_parser.parse_all_logs(), self.filter_set)
+
+    def end_to_end_binary(self) -> None:
+        with ScanResult(self.filter_set) as scan_result, _quiet():
+            BinaryScanner(self.log_parser, self.filter_set).scan(scan_result)
+            display_results(scan_result)
+
+    # Stage name -> (function, number of items it processes)
+    def stages(self) -> Dict[str, Tuple[Callable[[], object], int]]:
+        return {
+            'read': (self.read, len(self.lines)),
+            'parse': (self.parse, len(self.lines)),
+            'match': (self.match, len(self.entries)),
+            'output': (self.output, len(self.matched)),
+            'end_to_end': (self.end_to_end, len(self.lines)),
+            'end_to_end_binary': (self.end_to_end_binary, len(self.lines)),
+        }
+
+@contextmanager
+def _quiet():
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        yield
+
+def _best_time(function: Callable[[], object], repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _peak_memory(function: Callable[[], object]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(config: Dict, repeat: int = 3, memory: bool = True,
+                   only: Optional[List[str]] = None, data_dir: Optional[str] = None) -> Dict:
+    """Generate the input described by config, measure every stage and return the results"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_dir = data_dir or os.path.join(temp_dir, 'logs')
+        generate_logs(log_dir, config['lines'], config['files'], config['gz_ratio'],
+                      mix=config.get('mix'), order=config['order'],
+                      malformed_ratio=config.get('malformed_ratio', DEFAULT_MALFORMED_RATIO),
+                      seed=config['seed'])
+        events_file = generate_events(os.path.join(temp_dir, 'events.txt'), config['filters'],
+                                      config['pattern_ratio'], seed=config['seed'])
+
+        benchmark = Stages(log_dir, events_file)
+        benchmark.prepare()
+        results = {}
+        for name, (function, items) in benchmark.stages().items():
+            if only and name not in only:
+                continue
+            seconds = _best_time(function, repeat)
+            results[name] = {
+                'items': items,
+                'seconds': round(seconds, 6),
+                'lines_per_sec': round(items / seconds, 1) if seconds else None,
+                'peak_bytes': _peak_memory(function) if memory else None,
+            }
+
+    return {
+        'version': RESULTS_VERSION,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': dict(config, repeat=repeat),
+        'stages': results,
+    }
+
+def compare(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Warnings for stages that got slower or bigger than baseline by more than threshold percent"""
+    warnings = []
+    base_config = {key: value for key, value in baseline.get('config', {}).items() if key != 'repeat'}
+    config = {key: value for key, value in current['config'].items() if key != 'repeat'}
+    if base_config != config:
+        warnings.append("Baseline was generated with different options; results are not comparable")
+
+    for name, result in current['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if base is None:
+            continue
+        if base.get('lines_per_sec') and result['lines_per_sec'] is not None:
+            change = (result['lines_per_sec'] / base['lines_per_sec'] - 1) * 100
+            if change < -threshold:
+                warnings.append(f"{name}: lines/sec dropped {-change:.1f}% "
+                                f"({base['lines_per_sec']:,.0f} -> {result['lines_per_sec']:,.0f})")
+        if base.get('peak_bytes') and result['peak_bytes'] is not None:
+            change = (result['peak_bytes'] / base['peak_bytes'] - 1) * 100
+            if change > threshold:
+                warnings.append(f"{name}: peak memory grew {change:.1f}% "
+                                f"({base['peak_bytes']:,} -> {result['peak_bytes']:,} bytes)")
+    return warnings
+
+def format_results(results: Dict, baseline: Optional[Dict] = None) -> str:
+    rows = [f"{'stage':<20}{'items':>10}{'seconds':>10}{'lines/sec':>14}{'peak MB':>10}{'vs base':>9}"]
+    for name, result in results['stages'].items():
+        peak = result['peak_bytes']
+        base = (baseline or {}).get('stages', {}).get(name)
+        versus = ''
+        if base and base.get('lines_per_sec') and result['lines_per_sec']:
+            versus = f"{(result['lines_per_sec'] / base['lines_per_sec'] - 1) * 100:+.1f}%"
+        rows.append(f"{name:<20}{result['items']:>10}{result['seconds']:>10.3f}"
+                    f"{result['lines_per_sec'] or 0:>14,.0f}"
+                    f"{peak / (1024 * 1024) if peak is not None else 0:>10.1f}{versus:>9}")
+    return '\n'.join(rows)
+
+# --mix value: comma-separated EVENT_TYPE=WEIGHT pairs
+def _parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for pair in value.split(','):
+        event_type, _, weight = pair.partition('=')
+        event_type = event_type.strip()
+        if event_type not in TEMPLATES:
+            raise argparse.ArgumentTypeError(
+                f"unknown event type {event_type!r} (known: {', '.join(TEMPLATES)})")
+        try:
+            mix[event_type] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad weight for {event_type}: {weight!r}")
+        if mix[event_type] < 0:
+            raise argparse.ArgumentTypeError(f"weight for {event_type} must not be negative")
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("at least one weight must be positive")
+    return mix
+
+def _create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run_benchmarks',
+        description="Measure lines/sec and peak memory of each stage on generated logs"
+    )
+    parser.add_argument('--lines', type=int, default=200_000, help='Log lines to generate (default: 200000)')
+    parser.add_argument('--files', type=int, default=4, help='Log files to split them over (default: 4)')
+    parser.add_argument('--gz-ratio', type=float, default=0.25,
+                        help='Fraction of the files written as .log.gz (default: 0.25)')
+    parser.add_argument('--order', choices=ORDERS, default='ordered',
+                        help='Timestamp order within each file (default: ordered)')
+    parser.add_argument('--mix', type=_parse_mix,
+                        help='Event type weights as TYPE=WEIGHT,... (default: '
+                             + ','.join(f'{event_type}={weight}' for event_type, weight in DEFAULT_MIX.items())
+                             + ')')
+    parser.add_argument('--malformed-ratio', type=float, default=DEFAULT_MALFORMED_RATIO,
+                        help=f'Fraction of the lines written truncated (default: {DEFAULT_MALFORMED_RATIO})')
+    parser.add_argument('--filters', type=int, default=23, help='Filters in the events file (default: 23)')
+    parser.add_argument('--pattern-ratio', type=float, default=0.75,
+                        help='Fraction of the filters with a --pattern (default: 0.75)')
+    parser.add_argument('--seed', type=int, default=0, help='Generator seed (default: 0)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per stage, best is kept (default: 3)')
+    parser.add_argument('--stage', action='append', dest='stages',
+                        help='Only run this stage (repeatable)')
+    parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc pass')
+    parser.add_argument('--data-dir', help='Generate the logs here and keep them, instead of a temp dir')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--compare', help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'Percent change that counts as a regression (default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help='Exit with status 1 when a regression is found')
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = _create_parser()
+    args = parser.parse_args(argv)
+    if args.lines <= 0 or args.files <= 0 or args.repeat <= 0:
+        parser.error("--lines, --files and --repeat must be positive")
+    if not all(0 <= ratio <= 1 for ratio in (args.gz_ratio, args.pattern_ratio, args.malformed_ratio)):
+        parser.error("--gz-ratio, --pattern-ratio and --malformed-ratio must be between 0 and 1")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+
+    config = {
+        'lines': args.lines,
+        'files': args.files,
+        'gz_ratio': args.gz_ratio,
+        'order': args.order,
+        'mix': args.mix or dict(DEFAULT_MIX),
+        'malformed_ratio': args.malformed_ratio,
+        'filters': args.filters,
+        'pattern_ratio': args.pattern_ratio,
+        'seed': args.seed,
+    }
+    results = run_benchmarks(config, args.repeat, not args.no_memory, args.stages, args.data_dir)
+    print(format_results(results, baseline))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+            output_file.write('\n')
+        print(f"\nResults written to: {args.output}")
+
+    if baseline is not None:
+        warnings = compare(baseline, results, args.threshold)
+        for warning in warnings:
+            print(f"WARNING: {warning}", file=sys.stderr)
+        if warnings and args.fail_on_regression:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,10 +2,18 @@ import argparse
 from datetime import datetime
 from typing import Optional
 import os 
+import re
+
+# Seconds per --bucket unit
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
 
 class CLI:
     def __init__(self):
         self.parser = self._create_parser()
+        self.index_parser = self._create_index_parser()
+        self.compact_parser = self._create_compact_parser()
+        self.merge_parser = self._create_merge_parser()
+        self.serve_parser = self._create_serve_parser()
         
     def _create_parser(self) -> argparse.ArgumentParser:
         parser = argparse.ArgumentParser(
@@ -16,6 +24,22 @@ Examples:
     python main.py --log-dir /logs --events-file events.txt
     python main.py --log-dir /logs --events-file events.txt --from 2025-06-01T14:00:00
     python main.py --log-dir /logs --events-file events.txt --from 2025-06-01T14:00:00 --to 2025-06-01T16:00:00
+    python main.py --log-dir /logs --events-file events.txt --stream --max-lines 100
+    python main.py --log-dir /logs --events-file events.txt --workers 8
+    python main.py --log-dir /logs --events-file events.txt --binary
+    python main.py --log-dir /logs --events-file events.txt --cache-dir ~/.cache/loganalyzer
+    python main.py --log-dir /logs --events-file events.txt --follow --max-lines 20
+    python main.py --log-dir /logs --events-file events.txt --bucket 5m --bucket-format csv
+    python main.py --log-dir /logs --events-file events.txt --stats json --profile run.prof
+    python main.py --log-dir /logs --events-file events.txt --output ndjson > results.ndjson
+    python main.py --log-dir /archive --events-file events.txt --recursive --exclude 'tmp' --from 2025-06-01T14:00:00 --prune
+    python main.py index --log-dir /logs
+    python main.py index --log-dir /archive --recursive --spans
+    python main.py compact --log-dir /logs --out /logs-compact
+    python main.py --log-dir /logs-compact --events-file events.txt
+    python main.py scan --log-dir /logs --events-file events.txt --emit-partial host1.bin
+    python main.py merge host1.bin host2.bin host3.bin
+    python main.py serve --log-dir /logs --memory-mb 2048
         """
         )
         
@@ -44,8 +68,422 @@ Examples:
             help='End time filter (YYYY-MM-DDTHH:MM:SS format)'
         )
         
+        self._add_discovery_arguments(parser)
+        
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Skip log files whose time span lies outside --from/--to, as recorded by '
+                 '"index --spans" or read from the first and last lines of ordered files'
+        )
+        
+        parser.add_argument(
+            '--seek',
+            action='store_true',
+            help='Binary-search timestamp-ordered uncompressed files for --from/--to '
+                 'instead of reading them from the start. Files found out of order are '
+                 'scanned in full, but disorder far from the sampled lines can go unnoticed, '
+                 'leaving entries of the window out'
+        )
+        
+        parser.add_argument(
+            '--gz-index',
+            action='store_true',
+            help='Use sidecar seek indexes for .gz files, building them on first read'
+        )
+        
+        parser.add_argument(
+            '--read-ahead',
+            type=int,
+            default=0,
+            metavar='BLOCKS',
+            help='Read up to this many blocks ahead on a background thread, across file '
+                 'boundaries, while lines are parsed and matched (default: 0, off)'
+        )
+        
+        parser.add_argument(
+            '--block-size',
+            type=int,
+            default=1024,
+            metavar='KB',
+            help='Size of the blocks log files are read in, in KB (default: 1024)'
+        )
+        
+        parser.add_argument(
+            '--merge-by-time',
+            action='store_true',
+            help='Merge the entries of all log files by timestamp, so matching lines come '
+                 'out in time order rather than file by file'
+        )
+        
+        parser.add_argument(
+            '--reorder-window',
+            type=int,
+            default=0,
+            metavar='LINES',
+            help='With --merge-by-time, sort each file\'s entries within a window of this '
+                 'many lines first, for files that are only locally out of order (default: 0)'
+        )
+        
+        parser.add_argument(
+            '--block-index',
+            action='store_true',
+            help='Skip blocks of 64k lines that no filter can match, using sidecar block '
+                 'indexes of event types, levels and message tokens (built on first read)'
+        )
+        
+        parser.add_argument(
+            '--decompress-threads',
+            type=int,
+            default=1,
+            help='Threads decompressing compressed logs while they are parsed: 0 decompresses '
+                 'inline, more than 1 also decodes multi-member .gz files in parallel (default: 1)'
+        )
+        
+        parser.add_argument(
+            '--binary',
+            action='store_true',
+            help='Scan log files as bytes and decode only matching lines '
+                 '(gzip indexes are used but not built)'
+        )
+        
+        parser.add_argument(
+            '--follow',
+            action='store_true',
+            help='Keep polling the folder after the first report and print updated '
+                 'counts and new matching lines as log files grow'
+        )
+        
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds between --follow polls (default: 1.0)'
+        )
+        
+        parser.add_argument(
+            '--cache-dir',
+            help='Keep per-file checkpoints in this directory so later runs only read '
+                 'what was appended since (scans serially in text mode)'
+        )
+        
+        parser.add_argument(
+            '--max-lines', '--head',
+            dest='max_lines',
+            type=int,
+            help='Stop collecting matching lines for a filter after N matches'
+        )
+        
+        parser.add_argument(
+            '--stream',
+            action='store_true',
+            help='Spill matching lines to temp files instead of keeping them in memory'
+        )
+        
+        parser.add_argument(
+            '--spill-dir',
+            help='Directory for --stream spill files (implies --stream, default: system temp dir)'
+        )
+        
+        parser.add_argument(
+            '--output',
+            choices=['text', 'json', 'ndjson'],
+            default='text',
+            help='Result format on stdout: the text report, one JSON document, or one JSON '
+                 'record per line; with json and ndjson, progress messages go to stderr '
+                 '(default: text)'
+        )
+        
+        parser.add_argument(
+            '--bucket',
+            help='Also count each filter\'s matches per time bucket of this width, '
+                 'e.g. 30s, 5m, 1h or 1d (buckets are aligned to the epoch)'
+        )
+        
+        parser.add_argument(
+            '--emit-partial',
+            metavar='FILE',
+            help='Write the result as a partial result file for "main.py merge" instead of '
+                 'printing the report'
+        )
+        
+        parser.add_argument(
+            '--bucket-format',
+            choices=['text', 'csv', 'json'],
+            default='text',
+            help='Format of the --bucket time series (default: text, printed under each filter)'
+        )
+        
+        parser.add_argument(
+            '--bucket-file',
+            help='Write the --bucket time series to this file instead of stdout'
+        )
+        
+        parser.add_argument(
+            '--stats',
+            nargs='?',
+            const='text',
+            choices=['text', 'json'],
+            help='Print timings and counters of the run to stderr when it ends, as text '
+                 '(default) or json; per-file and per-filter figures need a serial scan'
+        )
+        
+        parser.add_argument(
+            '--profile',
+            metavar='FILE',
+            help='Run under cProfile and write the profile to FILE (read it with pstats)'
+        )
+        
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker processes used to scan log files (0 = all cores, default: 1)'
+        )
+        
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=64,
+            help='With --workers, split uncompressed files larger than this many MB '
+                 'into chunks scanned in parallel (0 = never split, default: 64)'
+        )
+        
+        return parser
+    
+    def _create_index_parser(self) -> argparse.ArgumentParser:
+        parser = argparse.ArgumentParser(
+            prog='main.py index',
+            description="Build sidecar seek indexes for the .gz log files in a folder, "
+                        "and optionally a manifest of every log file's time span and "
+                        "block indexes for --block-index"
+        )
+        
+        parser.add_argument(
+            '--log-dir',
+            required=True,
+            help='Path to a folder containing log files'
+        )
+        
+        self._add_discovery_arguments(parser)
+        
+        parser.add_argument(
+            '--spans',
+            action='store_true',
+            help='Also record the time span of every log file, for --prune'
+        )
+        
+        parser.add_argument(
+            '--blocks',
+            action='store_true',
+            help='Also build the block index of every log file, for --block-index'
+        )
+        
+        parser.add_argument(
+            '--checkpoint-mb',
+            type=int,
+            default=4,
+            help='Uncompressed MB between index checkpoints (default: 4)'
+        )
+        
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild indexes that are still current'
+        )
+        
+        return parser
+    
+    def _create_compact_parser(self) -> argparse.ArgumentParser:
+        parser = argparse.ArgumentParser(
+            prog='main.py compact',
+            description="Convert the log files in a folder into a columnar compact store, "
+                        "which can then be passed as --log-dir"
+        )
+        
+        parser.add_argument(
+            '--log-dir',
+            required=True,
+            help='Path to a folder containing log files'
+        )
+        
+        parser.add_argument(
+            '--out',
+            required=True,
+            help='Folder to write the compact store to'
+        )
+        
+        self._add_discovery_arguments(parser)
+        
+        return parser
+    
+    def _create_merge_parser(self) -> argparse.ArgumentParser:
+        parser = argparse.ArgumentParser(
+            prog='main.py merge',
+            description="Combine partial results written with --emit-partial (for example on "
+                        "several hosts) into one report"
+        )
+        
+        parser.add_argument(
+            'partials',
+            nargs='+',
+            metavar='PARTIAL',
+            help='Partial result files, all built with the same events file'
+        )
+        
+        parser.add_argument(
+            '--max-lines', '--head',
+            dest='max_lines',
+            type=int,
+            help='Print at most N matching lines per filter'
+        )
+        
+        parser.add_argument(
+            '--output',
+            choices=['text', 'json', 'ndjson'],
+            default='text',
+            help='Result format on stdout (default: text)'
+        )
+        
+        parser.add_argument(
+            '--bucket-format',
+            choices=['text', 'csv', 'json'],
+            default='text',
+            help='Format of the time series of partials built with --bucket (default: text)'
+        )
+        
+        parser.add_argument(
+            '--bucket-file',
+            help='Write the time series to this file instead of stdout'
+        )
+        
+        parser.add_argument(
+            '--emit-partial',
+            metavar='FILE',
+            help='Write the merged result as another partial result file instead of printing it'
+        )
+        
+        return parser
+    
+    def _create_serve_parser(self) -> argparse.ArgumentParser:
+        parser = argparse.ArgumentParser(
+            prog='main.py serve',
+            description="Keep the log files of a folder parsed in memory and answer filter "
+                        "queries over localhost HTTP or a Unix socket"
+        )
+        
+        parser.add_argument(
+            '--log-dir',
+            required=True,
+            help='Path to a folder containing log files'
+        )
+        
+        self._add_discovery_arguments(parser)
+        
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8765,
+            help='Port to listen on at 127.0.0.1 (default: 8765)'
+        )
+        
+        parser.add_argument(
+            '--socket',
+            help='Listen on this Unix socket instead of a port'
+        )
+        
+        parser.add_argument(
+            '--memory-mb',
+            type=int,
+            default=1024,
+            help='Memory for parsed log files and cached results; the least recently used '
+                 'files are dropped beyond it (default: 1024)'
+        )
+        
+        parser.add_argument(
+            '--refresh-interval',
+            type=float,
+            default=5.0,
+            help='Seconds between checks for changed log files, 0 to only check on each '
+                 'query (default: 5)'
+        )
+        
         return parser
     
+    # Options choosing which files under --log-dir are read
+    def _add_discovery_arguments(self, parser: argparse.ArgumentParser) -> None:
+        parser.add_argument(
+            '--recursive',
+            action='store_true',
+            help='Also read log files in subdirectories of --log-dir'
+        )
+        
+        parser.add_argument(
+            '--include',
+            action='append',
+            metavar='GLOB',
+            help='Only read log files matching this glob (repeatable); globs with a "/" '
+                 'match the path under --log-dir, others the file name'
+        )
+        
+        parser.add_argument(
+            '--exclude',
+            action='append',
+            metavar='GLOB',
+            help='Skip log files and subdirectories matching this glob (repeatable)'
+        )
+    
+    def parse_compact_args(self, args=None):
+        parsed_args = self.compact_parser.parse_args(args)
+        
+        if not os.path.isdir(parsed_args.log_dir):
+            self.compact_parser.error(f"Log directory is not a directory: '{parsed_args.log_dir}'")
+        
+        if os.path.exists(parsed_args.out) and not os.path.isdir(parsed_args.out):
+            self.compact_parser.error(f"Output path is not a directory: '{parsed_args.out}'")
+        
+        return parsed_args
+    
+    def parse_merge_args(self, args=None):
+        parsed_args = self.merge_parser.parse_args(args)
+        
+        for partial in parsed_args.partials:
+            if not os.path.isfile(partial):
+                self.merge_parser.error(f"Partial result file does not exist: '{partial}'")
+        
+        if parsed_args.max_lines is not None and parsed_args.max_lines < 0:
+            self.merge_parser.error("Error: --max-lines must not be negative")
+        
+        return parsed_args
+    
+    def parse_serve_args(self, args=None):
+        parsed_args = self.serve_parser.parse_args(args)
+        
+        if not os.path.isdir(parsed_args.log_dir):
+            self.serve_parser.error(f"Log directory is not a directory: '{parsed_args.log_dir}'")
+        
+        if not 0 < parsed_args.port < 65536:
+            self.serve_parser.error("Error: --port must be between 1 and 65535")
+        
+        if parsed_args.memory_mb <= 0:
+            self.serve_parser.error("Error: --memory-mb must be positive")
+        
+        if parsed_args.refresh_interval < 0:
+            self.serve_parser.error("Error: --refresh-interval must not be negative")
+        
+        return parsed_args
+    
+    def parse_index_args(self, args=None):
+        parsed_args = self.index_parser.parse_args(args)
+        
+        if not os.path.isdir(parsed_args.log_dir):
+            self.index_parser.error(f"Log directory is not a directory: '{parsed_args.log_dir}'")
+        
+        if parsed_args.checkpoint_mb <= 0:
+            self.index_parser.error("Error: --checkpoint-mb must be positive")
+        
+        return parsed_args
+    
     def parse_args(self, args=None):
         parsed_args = self.parser.parse_args(args)
         
@@ -79,9 +517,99 @@ Examples:
             parsed_args.from_time >= parsed_args.to_time):
             self.parser.error("Error: --from time must be earlier than --to time")
         
+        if parsed_args.max_lines is not None and parsed_args.max_lines < 0:
+            self.parser.error("Error: --max-lines must not be negative")
+        
+        if parsed_args.workers < 0:
+            self.parser.error("Error: --workers must not be negative")
+        
+        if parsed_args.chunk_size < 0:
+            self.parser.error("Error: --chunk-size must not be negative")
+        
+        if parsed_args.decompress_threads < 0:
+            self.parser.error("Error: --decompress-threads must not be negative")
+        
+        if parsed_args.read_ahead < 0:
+            self.parser.error("Error: --read-ahead must not be negative")
+        
+        if parsed_args.block_size <= 0:
+            self.parser.error("Error: --block-size must be positive")
+        
+        if parsed_args.reorder_window < 0:
+            self.parser.error("Error: --reorder-window must not be negative")
+        
+        if parsed_args.reorder_window and not parsed_args.merge_by_time:
+            self.parser.error("Error: --reorder-window needs --merge-by-time")
+        
+        if parsed_args.workers == 0:
+            parsed_args.workers = os.cpu_count() or 1
+        
+        if parsed_args.spill_dir and not os.path.isdir(parsed_args.spill_dir):
+            self.parser.error(f"Spill directory is not a directory: '{parsed_args.spill_dir}'")
+        
+        if parsed_args.cache_dir:
+            if os.path.exists(parsed_args.cache_dir) and not os.path.isdir(parsed_args.cache_dir):
+                self.parser.error(f"Cache directory is not a directory: '{parsed_args.cache_dir}'")
+            if parsed_args.workers > 1 or parsed_args.binary:
+                self.parser.error("Error: --cache-dir cannot be combined with --workers or --binary")
+        
+        if parsed_args.poll_interval <= 0:
+            self.parser.error("Error: --poll-interval must be positive")
+        
+        if parsed_args.follow and (parsed_args.workers > 1 or parsed_args.binary
+                                   or parsed_args.cache_dir):
+            self.parser.error("Error: --follow cannot be combined with --workers, --binary or --cache-dir")
+        
+        if parsed_args.stats and parsed_args.follow:
+            self.parser.error("Error: --stats cannot be combined with --follow")
+        
+        if parsed_args.output != 'text' and parsed_args.follow:
+            self.parser.error("Error: --output json and ndjson cannot be combined with --follow")
+        
+        if parsed_args.emit_partial and (parsed_args.follow or parsed_args.output != 'text'):
+            self.parser.error("Error: --emit-partial cannot be combined with --follow or --output")
+        
+        if parsed_args.read_ahead and parsed_args.workers > 1:
+            self.parser.error("Error: --read-ahead cannot be combined with --workers")
+        
+        if parsed_args.merge_by_time and (parsed_args.workers > 1 or parsed_args.binary
+                                          or parsed_args.cache_dir or parsed_args.follow
+                                          or parsed_args.read_ahead):
+            self.parser.error("Error: --merge-by-time cannot be combined with --workers, "
+                              "--binary, --cache-dir, --follow or --read-ahead")
+        
+        if parsed_args.block_index and (parsed_args.workers > 1 or parsed_args.binary
+                                        or parsed_args.cache_dir or parsed_args.follow
+                                        or parsed_args.read_ahead or parsed_args.merge_by_time):
+            self.parser.error("Error: --block-index cannot be combined with --workers, --binary, "
+                              "--cache-dir, --follow, --read-ahead or --merge-by-time")
+        
+        if parsed_args.prune and (parsed_args.follow or parsed_args.cache_dir):
+            self.parser.error("Error: --prune cannot be combined with --follow or --cache-dir")
+        
+        if parsed_args.bucket:
+            try:
+                parsed_args.bucket = self._parse_duration(parsed_args.bucket)
+            except ValueError as e:
+                self.parser.error(f"Invalid --bucket width: {e}")
+            if parsed_args.follow:
+                self.parser.error("Error: --bucket cannot be combined with --follow")
+        elif parsed_args.bucket_file or parsed_args.bucket_format != 'text':
+            self.parser.error("Error: --bucket-format and --bucket-file need --bucket")
+        else:
+            parsed_args.bucket = None
+        
         return parsed_args
         
-    def _parse_datetime(self, datetime_str: str) -> datetime:
+    @staticmethod
+    def _parse_duration(duration_str: str) -> int:
+        match = re.fullmatch(r'(\d+)([smhd])', duration_str.strip())
+        if not match or int(match.group(1)) == 0:
+            raise ValueError(f"Expected a positive number followed by s, m, h or d, got: {duration_str}")
+        return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+        
+    @staticmethod
+    def _parse_datetime(datetime_str: str) -> datetime:
         try:
             return datetime.fromisoformat(datetime_str)
         except ValueError:
@@ -1,81 +1,315 @@
+from contextlib import nullcontext, redirect_stdout
+import cProfile
+import csv
+import json
+import os
+import sys
+from analyzer import AnalysisResult, Analyzer, describe_filter
 from cli import CLI
 from parsers.events_parser import EventsParser
-from parsers.log_parser import LogParser
+from parsers.compact_store import CompactWriter
+from parsers.log_follower import LogFollower
+from parsers.log_index import LogIndex
+from parsers.log_parser import LogParser, LogReadError
+from models.filter_set import FilterSet
+from models.partial_result import PartialError, PartialResult
+from models.run_stats import RunStats
+from models.scan_result import ScanResult
+from models.timestamp import from_epoch
+from server import make_server, start_refresher
+from writers import WRITERS, TextWriter, sketch_lines
 
 def main():
     # Parse cli args
     cli = CLI()
-    args = cli.parse_args()
+    if sys.argv[1:2] == ['index']:
+        build_indexes(cli.parse_index_args(sys.argv[2:]))
+        return
+    if sys.argv[1:2] == ['compact']:
+        compact_logs(cli.parse_compact_args(sys.argv[2:]))
+        return
+    if sys.argv[1:2] == ['merge']:
+        merge_partials(cli.parse_merge_args(sys.argv[2:]))
+        return
+    if sys.argv[1:2] == ['serve']:
+        serve_logs(cli.parse_serve_args(sys.argv[2:]))
+        return
+    
+    # "scan" names the default command explicitly
+    args = cli.parse_args(sys.argv[2:] if sys.argv[1:2] == ['scan'] else None)
+    
+    if not args.profile:
+        analyze(args)
+        return
+    
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        analyze(args)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f"Profile written to: {args.profile}", file=sys.stderr)
+    
+def analyze(args):
+    # Structured output keeps stdout for the results; progress goes to stderr
+    output = sys.stdout
+    structured = args.output != 'text'
+    with redirect_stdout(sys.stderr) if structured else nullcontext():
+        # Load event filters from config files
+        print(f"Loading event filters from: {args.events_file}")
+        events_parser = EventsParser(args.events_file)
+        filters = events_parser.parse_filter_set()
+        
+        if not filters:
+            print("No valid event filters found")
+            return
+        
+        print(f"Loaded {len(filters)} event filters")
+        stats = RunStats(len(filters)) if args.stats else None
+        analyzer = Analyzer(args.log_dir, filters, seek=args.seek, gz_index=args.gz_index,
+                            binary=args.binary, workers=args.workers,
+                            chunk_size=args.chunk_size * 1024 * 1024, cache_dir=args.cache_dir,
+                            max_lines=args.max_lines, stream=args.stream, spill_dir=args.spill_dir,
+                            bucket=args.bucket, decompress_threads=args.decompress_threads,
+                            recursive=args.recursive, include=args.include, exclude=args.exclude,
+                            prune=args.prune, read_ahead=args.read_ahead,
+                            block_size=args.block_size * 1024,
+                            merge_by_time=args.merge_by_time,
+                            reorder_window=args.reorder_window, block_index=args.block_index,
+                            stats=stats)
+        
+        if analyzer.is_compact_store:
+            print(f"Reading compact store: {args.log_dir}\n")
+        else:
+            print(f"Parsing log files from: {args.log_dir}\n")
+            if args.follow:
+                follow_logs(analyzer.log_parser, filters, args)
+                return
+        
+        try:
+            result = analyzer.run(args.from_time, args.to_time)
+        except LogReadError as e:
+            sys.exit(f"Error: {e}")
     
-    # Load event filters from config files
-    print(f"Loading event filters from: {args.events_file}")
-    events_parser = EventsParser(args.events_file)
-    filters = events_parser.parse_events()
+    with result:
+        with stats.stage('output') if stats is not None else nullcontext():
+            if args.emit_partial:
+                PartialResult.from_scan_result(result.scan_result).write(args.emit_partial)
+                print(f"Wrote the partial result of {result.total_entries} entries to: "
+                      f"{args.emit_partial}")
+            else:
+                report_results(result.scan_result, args.bucket_format, args.bucket_file,
+                               args.output, output)
+            output.flush()
+    if stats is not None:
+        display_stats(stats, filters, args.stats)
     
-    if not filters:
-        print("No valid event filters found")
+    if args.prune and (args.from_time or args.to_time) and not analyzer.is_compact_store:
+        print(f"Pruned {result.pruned_files} log files outside the time window",
+              file=sys.stderr if structured else output)
+    
+def build_indexes(args):
+    log_parser = LogParser(args.log_dir, gz_index=True,
+                           gz_checkpoint_every=args.checkpoint_mb * 1024 * 1024,
+                           recursive=args.recursive, include=args.include, exclude=args.exclude)
+    built = log_parser.build_gzip_indexes(force=args.force)
+    print(f"Built {built} gzip index files in: {args.log_dir}")
+    if args.spans:
+        spans = log_parser.build_span_manifest(force=args.force)
+        print(f"Recorded the time span of {spans} log files in: {args.log_dir}")
+    if args.blocks:
+        blocks = log_parser.build_block_indexes(force=args.force)
+        print(f"Built {blocks} block index files in: {args.log_dir}")
+    
+def merge_partials(args):
+    try:
+        merged = PartialResult.merge([PartialResult.read(path) for path in args.partials])
+    except PartialError as e:
+        sys.exit(f"Error: {e}")
+    
+    if args.emit_partial:
+        merged.write(args.emit_partial)
+        print(f"Merged {len(args.partials)} partial results into: {args.emit_partial}")
         return
     
-    print(f"Loaded {len(filters)} event filters")
+    with merged.to_scan_result(args.max_lines) as scan_result:
+        report_results(scan_result, args.bucket_format, args.bucket_file, args.output)
     
-    print(f"Parsing log files from: {args.log_dir}\n")
-    log_parser = LogParser(args.log_dir)
-    log_entries = log_parser.parse_all_logs(args.from_time, args.to_time)
+def serve_logs(args):
+    log_parser = LogParser(args.log_dir, recursive=args.recursive, include=args.include,
+                           exclude=args.exclude)
+    log_index = LogIndex(log_parser, args.memory_mb * 1024 * 1024)
+    print(f"Loading log files from: {args.log_dir}")
+    log_index.refresh(load=True)
+    status = log_index.status()
+    print(f"Loaded {status['entries']} entries from {status['loaded_files']} files "
+          f"({status['memory_bytes'] / (1024 * 1024):.1f} MB)")
     
-    process_entries(log_entries, filters)
+    server = make_server(log_index, args.port, args.socket)
+    stop_refresh = start_refresher(log_index, args.refresh_interval) if args.refresh_interval else None
+    print(f"Serving queries on {args.socket or f'http://127.0.0.1:{args.port}'} (Ctrl+C to stop)")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stop_refresh is not None:
+            stop_refresh.set()
+        server.server_close()
+        if args.socket:
+            os.unlink(args.socket)
     
-def process_entries(log_entries, filters):
-    # Results per filter 
-    results = {}
+def compact_logs(args):
+    writer = CompactWriter(args.out)
+    writer.add_all(LogParser(args.log_dir, recursive=args.recursive, include=args.include,
+                             exclude=args.exclude).parse_all_logs())
+    writer.close()
+    print(f"Compacted {writer.rows} entries from: {args.log_dir} into: {args.out}")
     
-    for filter_obj in filters:
-        filter_key = f"{filter_obj.event_type}_{hash(str(filter_obj))}"
-        results[filter_key] = {
-            'filter': filter_obj,
-            'matches': [],
-            'count': 0
-        } 
+def follow_logs(log_parser, filters, args):
+    follower = LogFollower(log_parser, filters, args.poll_interval, args.max_lines,
+                           args.stream, args.spill_dir)
     
-    total_entries = 0 
-    for entry in log_entries:
-        total_entries += 1
-        
-        for filter_obj in filters:
-            if filter_obj.matches(entry):
-                filter_key = f"{filter_obj.event_type}_{hash(str(filter_obj))}"
-                results[filter_key]['matches'].append(entry)
-                results[filter_key]['count'] += 1
-                
-    display_results(results, total_entries)
-    
-def display_results(results, total_entries):
+    def report(scan_result, first):
+        if first:
+            display_results(scan_result)
+            print(f"Following {args.log_dir} (Ctrl+C to stop)\n")
+        else:
+            display_updates(scan_result, follower.totals, follower.sketches)
+        sys.stdout.flush()
+    
+    try:
+        follower.follow(report, args.from_time, args.to_time)
+    except KeyboardInterrupt:
+        pass
+    
+def process_entries(log_entries, filters, max_lines=None, stream=False, spill_dir=None,
+                    bucket=None, bucket_format='text', bucket_file=None):
+    filter_set = filters if isinstance(filters, FilterSet) else FilterSet(filters)
+    
+    # Results per filter, indexed by the filter's position in the FilterSet
+    with ScanResult(filter_set, max_lines, stream, spill_dir, bucket) as scan_result:
+        scan_result.collect(log_entries)
+        report_results(scan_result, bucket_format, bucket_file)
+    
+def report_results(scan_result, bucket_format='text', bucket_file=None, output_format='text',
+                   output=None):
+    """Write the results in the chosen format, with the time series in theirs"""
+    
+    output = output or sys.stdout
+    result = AnalysisResult(scan_result)
+    histogram = scan_result.histogram
+    if output_format != 'text':
+        # Structured output carries the series itself
+        WRITERS[output_format](output).write(result)
+    else:
+        inline = histogram is not None and bucket_format == 'text' and not bucket_file
+        TextWriter(output, series=inline).write(result)
+        if histogram is not None and not inline and not bucket_file:
+            write_histogram(scan_result, bucket_format, output)
+    
+    if histogram is not None and bucket_file:
+        with open(bucket_file, 'w', encoding='utf-8', newline='') as series_file:
+            write_histogram(scan_result, bucket_format, series_file)
+    
+def display_results(scan_result, series=False):
     """Display the matching results according to specification"""
     
-    for filter_key, result in results.items():
-        filter_obj = result['filter']
-        matches = result['matches']
-        count = result['count']
+    TextWriter(sys.stdout, series=series).write(AnalysisResult(scan_result))
         
-        # Build filter description
-        filter_desc = f"Event: {filter_obj.event_type}"
+def write_histogram(scan_result, bucket_format, output):
+    """Write every filter's non-empty time buckets as text, CSV or JSON"""
+    
+    histogram = scan_result.histogram
+    filters = scan_result.filter_set.filters
+    if bucket_format == 'json':
+        json.dump({
+            'bucket_seconds': histogram.width,
+            'filters': [{
+                'filter': describe_filter(filter_obj),
+                'count': filter_obj.count,
+                'series': [[from_epoch(start).isoformat(), bucket_count]
+                           for start, bucket_count in histogram.series(index)],
+            } for index, filter_obj in enumerate(filters)],
+        }, output, indent=2)
+        output.write('\n')
+    elif bucket_format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(['filter_index', 'filter', 'bucket_start', 'count'])
+        for index, filter_obj in enumerate(filters):
+            for start, bucket_count in histogram.series(index):
+                writer.writerow([index, describe_filter(filter_obj),
+                                 from_epoch(start).isoformat(), bucket_count])
+    else:
+        for index, filter_obj in enumerate(filters):
+            output.write(f"{describe_filter(filter_obj)} — matches per {histogram.width}s bucket:\n")
+            for start, bucket_count in histogram.series(index):
+                output.write(f"{from_epoch(start).isoformat()} {bucket_count}\n")
+            output.write('\n')
         
-        if filter_obj.level:
-            filter_desc += f" level [{filter_obj.level}]"
+def display_updates(scan_result, totals, sketches=None):
+    """Display the filters that matched new lines since the last poll"""
+    
+    filter_set = scan_result.filter_set
+    for index, filter_obj in enumerate(filter_set.filters):
+        count = scan_result.counts[index]
+        if not count:
+            continue
         
-        if filter_obj.pattern:
-            filter_desc += f" pattern [{filter_obj.pattern.pattern}]"
+        filter_desc = describe_filter(filter_obj)
         
-        if filter_obj.count:
-            filter_desc += f" count — matches: {count} entries"
-            print(filter_desc)
+        if filter_obj.count or filter_obj.aggregated:
+            print(filter_desc + f" count — matches: {totals[index]} entries (+{count})")
+            if sketches is not None and sketches[index] is not None:
+                for line in sketch_lines(filter_obj, sketches[index]):
+                    print(line)
         else:
-            filter_desc += " — matching log lines:"
-            print(filter_desc)
-            for match in matches:
-                timestamp_str = match.timestamp.strftime('%Y-%m-%dT%H:%M:%S')
-                print(f"{timestamp_str} {match.level} {match.event_type} {match.message}")
+            print(filter_desc + " — new matching log lines:")
+            for line in scan_result.matches(index):
+                print(line)
+        
+        print()
         
-        print()  # Empty line between results
+def display_stats(stats, filter_set, stats_format='text', output=None):
+    """Write the --stats report, to stderr by default"""
+    
+    output = output or sys.stderr
+    report = stats.to_dict()
+    for filter_report, filter_obj in zip(report['filters'], filter_set.filters):
+        filter_report['filter'] = describe_filter(filter_obj)
+    
+    if stats_format == 'json':
+        json.dump(report, output, indent=2)
+        output.write('\n')
+        return
+    
+    total = report['total_seconds']
+    print("Run statistics:", file=output)
+    for name, seconds in report['stages'].items():
+        print(f"  {name:<14}{seconds:>10.3f}s {seconds / total * 100 if total else 0:>5.1f}%", file=output)
+    print(f"  {'total':<14}{total:>10.3f}s", file=output)
+    
+    rate = report['lines_per_sec']
+    rss = report['peak_rss_bytes']
+    rate_text = f"{rate:,.0f} lines/sec" if rate is not None else "unknown lines/sec"
+    print(f"Lines: {report['lines']}, entries scanned: {report['entries']}, {rate_text}", file=output)
+    print(f"Peak RSS: {rss / (1024 * 1024):.1f} MB" if rss is not None else "Peak RSS: unknown",
+          file=output)
+    
+    if report['files']:
+        print("Files:", file=output)
+        for file_report in report['files']:
+            print(f"  {file_report['path']}: {file_report['size']} bytes on disk, "
+                  f"{file_report['bytes']} read, {file_report['lines']} lines, "
+                  f"{file_report['rejected']} rejected, {file_report['skipped']} skipped, "
+                  f"{file_report['out_of_range']} out of range, "
+                  f"read/decompress {file_report['read_seconds']:.3f}s", file=output)
+        print("Filters:", file=output)
+        for filter_report in report['filters']:
+            print(f"  {filter_report['filter']}: {filter_report['evaluations']} evaluations, "
+                  f"{filter_report['matches']} matches, {filter_report['seconds']:.3f}s", file=output)
         
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,12 +2,18 @@ from dataclasses import dataclass
 from typing import Optional
 import re
 
+# Keys reported for --group-by without --top
+DEFAULT_TOP = 10
+
 @dataclass(frozen=True)
 class EventFilter:
     event_type: str                         # Required
     count: bool = False                     # Optional: --count flag
     level: Optional[str] = None             # Optional: --level INFO/WARNING/ERROR
     pattern: Optional[re.Pattern] = None    # Optional: --pattern regex
+    top: Optional[int] = None               # Optional: --top N most frequent --group-by keys
+    group_by: Optional[str] = None          # Optional: --group-by GROUP of the pattern
+    distinct: Optional[str] = None          # Optional: --distinct GROUP of the pattern
     
     # Parse an events configuration line into an EventFilter
     @classmethod
@@ -25,6 +31,9 @@ class EventFilter:
         count = False
         level = None
         pattern = None
+        top = None
+        group_by = None
+        distinct = None
         
         i = 1
         while i < len(parts):
@@ -34,6 +43,18 @@ class EventFilter:
             elif parts[i] == '--level' and i + 1 < len(parts):
                 level = parts[i + 1]
                 i += 2
+            elif parts[i] == '--top' and i + 1 < len(parts):
+                if not parts[i + 1].isdigit() or int(parts[i + 1]) < 1:
+                    print(f"Warning: --top for {event_type} must be a positive number, ignoring filter")
+                    return None
+                top = int(parts[i + 1])
+                i += 2
+            elif parts[i] == '--group-by' and i + 1 < len(parts):
+                group_by = parts[i + 1]
+                i += 2
+            elif parts[i] == '--distinct' and i + 1 < len(parts):
+                distinct = parts[i + 1]
+                i += 2
             elif parts[i] == '--pattern' and i + 1 < len(parts):
                 # Find the end of the pattern (before next -- flag or end of line)
                 pattern_parts = []
@@ -57,7 +78,23 @@ class EventFilter:
             print(f"Warning: Filter for {event_type} has no criteria, ignoring")
             return None
         
-        return cls(event_type, count, level, pattern)
+        if top is not None and group_by is None:
+            print(f"Warning: --top for {event_type} needs --group-by, ignoring filter")
+            return None
+        if group_by is not None and top is None:
+            top = DEFAULT_TOP
+        for group in (group_by, distinct):
+            if group is not None and not _has_group(pattern, group):
+                print(f"Warning: '{group}' is not a group of the --pattern for {event_type}, "
+                      f"ignoring filter")
+                return None
+        
+        return cls(event_type, count, level, pattern, top, group_by, distinct)
+    
+    # Whether matches feed --top/--distinct sketches instead of being kept as lines
+    @property
+    def aggregated(self) -> bool:
+        return self.top is not None or self.distinct is not None
      
     # Check if a LogEntry matches this filter
     def matches(self, log_entry) -> bool:
@@ -74,3 +111,11 @@ class EventFilter:
                 return False
         
         return True
+
+# Whether group (a number or a name) is a capture group of pattern
+def _has_group(pattern: Optional[re.Pattern], group: str) -> bool:
+    if pattern is None:
+        return False
+    if group.isdigit():
+        return 1 <= int(group) <= pattern.groups
+    return group in pattern.groupindex
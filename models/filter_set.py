@@ -0,0 +1,201 @@
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import re
+from models.event_filter import EventFilter
+from models.pattern_matcher import PatternMatcher
+
+# (filters with no pattern, matcher for the filters with one)
+Bucket = Tuple[List[int], Optional[PatternMatcher]]
+
+# (filters with no pattern, bytes matcher for ASCII messages, the same
+# patterns as str for other messages, str matcher for patterns with no bytes
+# equivalent)
+ByteBucket = Tuple[List[int], Optional[PatternMatcher], Optional[PatternMatcher],
+                   Optional[PatternMatcher]]
+
+# str patterns' \s also matches the ASCII separators \x1c-\x1f, bytes ones do not
+_SPACE = r'\s\x1c-\x1f'
+
+# Pattern source with \s and \S widened to match str semantics, or None if
+# that cannot be done by rewriting (\S inside a character class)
+def _widen_spaces(source: str) -> Optional[str]:
+    parts = []
+    in_class = False
+    position, length = 0, len(source)
+    while position < length:
+        char = source[position]
+        if char == '\\' and position + 1 < length:
+            escaped = source[position + 1]
+            if escaped == 's':
+                parts.append(_SPACE if in_class else f'[{_SPACE}]')
+            elif escaped == 'S':
+                if in_class:
+                    return None
+                parts.append(f'[^{_SPACE}]')
+            else:
+                parts.append(source[position:position + 2])
+            position += 2
+            continue
+        parts.append(char)
+        position += 1
+        if char == '[' and not in_class:
+            in_class = True
+            # A leading '^' negates and a ']' right after it is literal
+            if source.startswith('^', position):
+                parts.append('^')
+                position += 1
+            if source.startswith(']', position):
+                parts.append(']')
+                position += 1
+        elif char == ']' and in_class:
+            in_class = False
+    return ''.join(parts)
+
+# A bytes pattern that matches ASCII text exactly like a str pattern, or None
+def _bytes_pattern(pattern: re.Pattern) -> Optional[re.Pattern]:
+    if not pattern.pattern.isascii() or pattern.flags & re.VERBOSE:
+        return None
+    source = _widen_spaces(pattern.pattern)
+    if source is None:
+        return None
+    try:
+        return re.compile(source.encode('ascii'), pattern.flags & ~re.UNICODE)
+    except re.error:
+        return None
+
+class FilterSet:
+    """Compiled set of EventFilters indexed by event_type and level
+
+    Each filter gets a stable id (its position in the events file), so results
+    can be keyed without hashing the filter on every match.
+    """
+
+    def __init__(self, filters: List[EventFilter]):
+        self.filters = list(filters)
+        self.filter_ids = [f"{filter_obj.event_type}_{index}"
+                           for index, filter_obj in enumerate(self.filters)]
+
+        # event_type -> level (None means any level) -> filter indexes
+        self._index: Dict[str, Dict[Optional[str], List[int]]] = {}
+        for index, filter_obj in enumerate(self.filters):
+            by_level = self._index.setdefault(filter_obj.event_type, {})
+            by_level.setdefault(filter_obj.level, []).append(index)
+
+        # Flatten each (event_type, level) bucket into filters that match on
+        # event_type/level alone plus a PatternMatcher for the --pattern ones
+        self._dispatch: Dict[str, Tuple[Bucket, Dict[str, Bucket]]] = {}
+        for event_type, by_level in self._index.items():
+            any_level = self._compile_bucket(by_level.get(None, []))
+            per_level = {level: self._compile_bucket(indexes)
+                         for level, indexes in by_level.items() if level is not None}
+            self._dispatch[event_type] = (any_level, per_level)
+
+        # Same dispatch keyed on encoded event types and levels, built on the
+        # first match_bytes call
+        self._byte_dispatch: Optional[Dict[bytes, Tuple[ByteBucket, Dict[bytes, ByteBucket]]]] = None
+
+    def _compile_bucket(self, indexes: List[int]) -> Bucket:
+        plain = [index for index in indexes if self.filters[index].pattern is None]
+        patterns = [(index, self.filters[index].pattern) for index in indexes
+                    if self.filters[index].pattern is not None]
+        return plain, (PatternMatcher(patterns) if patterns else None)
+
+    def _compile_byte_bucket(self, indexes: List[int]) -> ByteBucket:
+        plain = [index for index in indexes if self.filters[index].pattern is None]
+        byte_patterns, text_patterns, other_patterns = [], [], []
+        for index in indexes:
+            pattern = self.filters[index].pattern
+            if pattern is None:
+                continue
+            byte_pattern = _bytes_pattern(pattern)
+            if byte_pattern is None:
+                other_patterns.append((index, pattern))
+            else:
+                byte_patterns.append((index, byte_pattern))
+                text_patterns.append((index, pattern))
+        return (plain,
+                PatternMatcher(byte_patterns) if byte_patterns else None,
+                PatternMatcher(text_patterns) if text_patterns else None,
+                PatternMatcher(other_patterns) if other_patterns else None)
+
+    def _compile_byte_dispatch(self) -> None:
+        self._byte_dispatch = {}
+        for event_type, by_level in self._index.items():
+            any_level = self._compile_byte_bucket(by_level.get(None, []))
+            per_level = {level.encode('utf-8'): self._compile_byte_bucket(indexes)
+                         for level, indexes in by_level.items() if level is not None}
+            self._byte_dispatch[event_type.encode('utf-8')] = (any_level, per_level)
+
+    @property
+    def event_types(self) -> frozenset:
+        return frozenset(self._dispatch)
+
+    @property
+    def event_types_bytes(self) -> frozenset:
+        return frozenset(event_type.encode('utf-8') for event_type in self._dispatch)
+
+    # Digest of everything that affects matching, for keying cached results
+    @property
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256()
+        for filter_obj in self.filters:
+            pattern = filter_obj.pattern
+            key = (filter_obj.event_type, filter_obj.level, filter_obj.count,
+                   pattern.pattern if pattern is not None else None,
+                   pattern.flags if pattern is not None else None)
+            if filter_obj.aggregated:
+                key += (filter_obj.top, filter_obj.group_by, filter_obj.distinct)
+            digest.update(repr(key).encode('utf-8'))
+        return digest.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.filters)
+
+    # Return the indexes of all filters matching a LogEntry
+    def match(self, log_entry) -> List[int]:
+        dispatch = self._dispatch.get(log_entry.event_type)
+        if dispatch is None:
+            return []
+
+        any_level, per_level = dispatch
+        hits = self._match_bucket(any_level, log_entry)
+        level_bucket = per_level.get(log_entry.level)
+        if level_bucket is not None:
+            hits.extend(self._match_bucket(level_bucket, log_entry))
+        return hits
+
+    @staticmethod
+    def _match_bucket(bucket: Bucket, log_entry) -> List[int]:
+        plain, matcher = bucket
+        if matcher is None:
+            return list(plain)
+        return plain + matcher.match(log_entry.message)
+
+    # Return the indexes of all filters matching a raw line's fields. ASCII
+    # messages are matched as bytes; others are decoded first.
+    def match_bytes(self, event_type: bytes, level: bytes, message: bytes) -> List[int]:
+        if self._byte_dispatch is None:
+            self._compile_byte_dispatch()
+        dispatch = self._byte_dispatch.get(event_type)
+        if dispatch is None:
+            return []
+
+        any_level, per_level = dispatch
+        hits = self._match_byte_bucket(any_level, message)
+        level_bucket = per_level.get(level)
+        if level_bucket is not None:
+            hits.extend(self._match_byte_bucket(level_bucket, message))
+        return hits
+
+    @staticmethod
+    def _match_byte_bucket(bucket: ByteBucket, message: bytes) -> List[int]:
+        plain, byte_matcher, text_matcher, other_matcher = bucket
+        hits = list(plain)
+        if byte_matcher is not None:
+            if message.isascii():
+                hits.extend(byte_matcher.match(message))
+            else:
+                hits.extend(text_matcher.match(message.decode('utf-8', 'replace')))
+        if other_matcher is not None:
+            hits.extend(other_matcher.match(message.decode('utf-8', 'replace')))
+        return hits
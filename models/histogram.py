@@ -0,0 +1,77 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+from models.timestamp import Epoch
+
+try:
+    import numpy
+except ImportError:  # Batches are binned with collections.Counter instead
+    numpy = None
+
+class Histogram:
+    """Per-filter match counts in fixed-width time buckets
+
+    Buckets are aligned to the epoch, so a 5 minute bucket always starts at
+    a multiple of 5 minutes, and are keyed by their number (epoch // width).
+    Match timestamps are buffered per filter and binned a batch at a time,
+    vectorized with numpy when it is installed.
+    """
+
+    BATCH_SIZE = 8192
+
+    def __init__(self, filter_count: int, width: int):
+        self.width = width
+        self._bins: List[Dict[int, int]] = [{} for _ in range(filter_count)]
+        # Lists append faster than array('d'), which converts every int epoch
+        self._buffers: List[List[Epoch]] = [[] for _ in range(filter_count)]
+
+    def add(self, index: int, epoch: Epoch) -> None:
+        buffer = self._buffers[index]
+        buffer.append(epoch)
+        if len(buffer) >= self.BATCH_SIZE:
+            self._flush(index)
+
+    # Add a batch of match timestamps (a sequence or numpy array) at once
+    def add_many(self, index: int, epochs) -> None:
+        self._bin(index, epochs)
+
+    # Add count matches that all happened at epoch
+    def add_count(self, index: int, epoch: Epoch, count: int) -> None:
+        bins = self._bins[index]
+        bucket = int(epoch // self.width)
+        bins[bucket] = bins.get(bucket, 0) + count
+
+    def _flush(self, index: int) -> None:
+        buffer = self._buffers[index]
+        if buffer:
+            self._bin(index, buffer)
+            self._buffers[index] = []
+
+    def _bin(self, index: int, epochs) -> None:
+        if len(epochs) == 0:
+            return
+        bins = self._bins[index]
+        if numpy is not None:
+            buckets = numpy.floor_divide(numpy.asarray(epochs, dtype=numpy.float64), self.width)
+            keys, counts = numpy.unique(buckets.astype(numpy.int64), return_counts=True)
+            pairs: Iterable[Tuple[int, int]] = zip(keys.tolist(), counts.tolist())
+        else:
+            width = self.width
+            pairs = Counter([int(epoch // width) for epoch in epochs]).items()
+        for bucket, count in pairs:
+            bins[bucket] = bins.get(bucket, 0) + count
+
+    # Sorted (bucket start epoch, count) pairs of a filter's non-empty buckets
+    def series(self, index: int) -> List[Tuple[int, int]]:
+        self._flush(index)
+        return [(bucket * self.width, count) for bucket, count in sorted(self._bins[index].items())]
+
+    # Picklable bins of every filter, for sending between processes
+    def export(self) -> List[Dict[int, int]]:
+        for index in range(len(self._bins)):
+            self._flush(index)
+        return [dict(bins) for bins in self._bins]
+
+    def merge(self, exported: List[Dict[int, int]]) -> None:
+        for bins, other in zip(self._bins, exported):
+            for bucket, count in other.items():
+                bins[bucket] = bins.get(bucket, 0) + count
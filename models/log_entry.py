@@ -1,36 +1,95 @@
-from dataclasses import dataclass
-from datetime import datetime 
-from typing import Optional
+from datetime import datetime
+from typing import AbstractSet, Optional
+import sys
+from models.timestamp import MINUTE_CACHE, SECONDS, Epoch, parse_timestamp, to_epoch
+
+_intern = sys.intern
 
-@dataclass(frozen=True)
 class LogEntry:
-    timestamp: datetime
-    level: str
-    event_type: str 
-    message: str
-    
+    # Compact, slotted entry. level and event_type are interned (there are only
+    # a handful of distinct values), and the timestamp is kept as epoch seconds
+    # plus its original text; the datetime is only built when a caller asks
+    # for it.
+    __slots__ = ('epoch', 'level', 'event_type', 'message', '_timestamp', '_timestamp_text')
+
+    def __init__(self, timestamp: Optional[datetime], level: str, event_type: str,
+                 message: str, timestamp_text: Optional[str] = None,
+                 epoch: Optional[Epoch] = None):
+        self._timestamp = timestamp
+        self._timestamp_text = timestamp_text
+        self.epoch = epoch if epoch is not None else to_epoch(timestamp)
+        self.level = _intern(level)
+        self.event_type = _intern(event_type)
+        self.message = message
+
+    @property
+    def timestamp(self) -> datetime:
+        if self._timestamp is None:
+            self._timestamp = datetime.fromisoformat(self._timestamp_text)
+        return self._timestamp
+
+    @property
+    def timestamp_text(self) -> str:
+        if self._timestamp_text is None:
+            self._timestamp_text = self._timestamp.strftime('%Y-%m-%dT%H:%M:%S')
+        return self._timestamp_text
+
     @classmethod
-    def from_line(cls, line: str) -> Optional['LogEntry']:
-        # Parse log line into LogEntry object 
+    def from_line(cls, line: str,
+                  event_types: Optional[AbstractSet[str]] = None) -> Optional['LogEntry']:
+        # Parse log line into LogEntry object. With event_types given, lines of
+        # any other event type are dropped before the timestamp is decoded or
+        # an entry is allocated.
         line = line.strip()
-        
+
         if not line:
             return None
-        
+
         # Split the line into 4 parts max - last one is the message
         parts = line.split(' ', 3)
-        
+
         if len(parts) < 4:
-            return None # Invalid line format 
-        try:
-            timestamp_str = parts[0]
-            timestamp = datetime.fromisoformat(timestamp_str)
-            
-            level = parts[1]
-            event_type = parts[2]
-            message = parts[3]
-        
-            return cls(timestamp, level, event_type, message)
-        except(ValueError, IndexError):
+            return None # Invalid line format
+
+        timestamp_str, level, event_type, message = parts
+        if event_types is not None and event_type not in event_types:
             return None
-    
\ No newline at end of file
+
+        # Inlined fast path of parse_timestamp for YYYY-MM-DDTHH:MM:SS
+        second = SECONDS.get(timestamp_str[17:])
+        minute = MINUTE_CACHE.get(timestamp_str[:17]) if second is not None else None
+        if minute is not None:
+            epoch = minute + second
+        else:
+            try:
+                epoch = parse_timestamp(timestamp_str)
+            except ValueError:
+                return None
+
+        entry = cls.__new__(cls)
+        entry.epoch = epoch
+        entry.level = _intern(level)
+        entry.event_type = _intern(event_type)
+        entry.message = message
+        entry._timestamp = None
+        entry._timestamp_text = timestamp_str
+        return entry
+
+    # Format the entry as an output line, reusing the original timestamp text
+    def format_line(self) -> str:
+        return f"{self.timestamp_text} {self.level} {self.event_type} {self.message}"
+
+    def _key(self):
+        return (self.epoch, self.level, self.event_type, self.message)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, LogEntry):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def __repr__(self) -> str:
+        return (f"LogEntry(timestamp={self.timestamp_text!r}, level={self.level!r}, "
+                f"event_type={self.event_type!r}, message={self.message!r})")
@@ -0,0 +1,170 @@
+from typing import Dict, Optional, Sequence
+import heapq
+import json
+import re
+import struct
+import zlib
+from models.event_filter import EventFilter
+from models.filter_set import FilterSet
+from models.scan_result import ScanResult
+from models.sketches import FilterSketch, sketch_from_json, sketch_to_json
+from models.timestamp import Epoch, parse_timestamp
+
+# A partial result file: magic, format version, then zlib-compressed JSON
+PARTIAL_MAGIC = b'LOGPART\0'
+PARTIAL_VERSION = 1
+_HEADER = struct.Struct('>8sH')
+
+class PartialError(ValueError):
+    """A partial result file that cannot be read, or partials that cannot be merged"""
+
+class PartialResult:
+    """The result of one scan in a form that can be shipped and merged elsewhere
+
+    Holds the filter definitions with their fingerprint, the entry total,
+    per-filter counts, the kept matching lines, the time series and the
+    --top/--distinct sketches. Merging is associative: counts and buckets
+    add up, sketches merge, and the partials' lines are merged by the
+    timestamp they start with, lines of equal timestamps keeping partial
+    order and then their order within the partial. Merging one partial
+    thus gives the lines in the order its scan reported them. Partials of
+    different filter sets or bucket widths are rejected.
+    """
+
+    def __init__(self, filter_set: FilterSet, partial: Dict, bucket_seconds: Optional[int] = None):
+        self.filter_set = filter_set
+        # In ScanResult.export_partial form
+        self.partial = partial
+        self.bucket_seconds = bucket_seconds
+
+    @property
+    def fingerprint(self) -> str:
+        return self.filter_set.fingerprint
+
+    @classmethod
+    def from_scan_result(cls, scan_result: ScanResult) -> 'PartialResult':
+        histogram = scan_result.histogram
+        return cls(scan_result.filter_set, scan_result.export_partial(),
+                   histogram.width if histogram is not None else None)
+
+    # Combine partials of the same filter set into one
+    @classmethod
+    def merge(cls, partials: Sequence['PartialResult']) -> 'PartialResult':
+        if not partials:
+            raise PartialError("No partial results to merge")
+        first = partials[0]
+        for other in partials[1:]:
+            if other.fingerprint != first.fingerprint:
+                raise PartialError("Partial results were built from different filter sets")
+            if other.bucket_seconds != first.bucket_seconds:
+                raise PartialError("Partial results have different --bucket widths")
+
+        filter_set = first.filter_set
+        merged = {
+            'total_entries': sum(other.partial['total_entries'] for other in partials),
+            'counts': [sum(counts) for counts in zip(*(other.partial['counts'] for other in partials))],
+            'lines': [],
+            'histogram': None,
+            'sketches': [],
+        }
+        for index in range(len(filter_set)):
+            filter_lines = [other.partial['lines'][index] for other in partials]
+            merged['lines'].append(None if filter_lines[0] is None
+                                   else list(heapq.merge(*filter_lines, key=_line_epoch)))
+
+        if first.bucket_seconds is not None:
+            merged['histogram'] = [{} for _ in range(len(filter_set))]
+            for other in partials:
+                for bins, other_bins in zip(merged['histogram'], other.partial['histogram']):
+                    for bucket, count in other_bins.items():
+                        bins[bucket] = bins.get(bucket, 0) + count
+
+        for index, filter_obj in enumerate(filter_set.filters):
+            if not filter_obj.aggregated:
+                merged['sketches'].append(None)
+                continue
+            sketch = FilterSketch(filter_obj)
+            for other in partials:
+                sketch.merge(other.partial['sketches'][index])
+            merged['sketches'].append(sketch.export())
+        return cls(filter_set, merged, first.bucket_seconds)
+
+    # A ScanResult holding this partial, for the usual reports
+    def to_scan_result(self, max_lines: Optional[int] = None, stream: bool = False,
+                       spill_dir: Optional[str] = None) -> ScanResult:
+        scan_result = ScanResult(self.filter_set, max_lines, stream, spill_dir, self.bucket_seconds)
+        scan_result.merge_partial(self.partial)
+        return scan_result
+
+    def write(self, path: str) -> None:
+        partial = self.partial
+        document = {
+            'fingerprint': self.fingerprint,
+            'filters': [_filter_to_json(filter_obj) for filter_obj in self.filter_set.filters],
+            'bucket_seconds': self.bucket_seconds,
+            'total_entries': partial['total_entries'],
+            'counts': partial['counts'],
+            'lines': partial['lines'],
+            'histogram': ([sorted(bins.items()) for bins in partial['histogram']]
+                          if partial['histogram'] is not None else None),
+            'sketches': [sketch_to_json(sketch) for sketch in partial['sketches']],
+        }
+        with open(path, 'wb') as partial_file:
+            partial_file.write(_HEADER.pack(PARTIAL_MAGIC, PARTIAL_VERSION))
+            partial_file.write(zlib.compress(json.dumps(document).encode('utf-8')))
+
+    @classmethod
+    def read(cls, path: str) -> 'PartialResult':
+        try:
+            with open(path, 'rb') as partial_file:
+                data = partial_file.read()
+        except (IOError, OSError) as e:
+            raise PartialError(f"Could not read partial result {path}: {e}")
+        if len(data) < _HEADER.size:
+            raise PartialError(f"Not a partial result file: {path}")
+        magic, version = _HEADER.unpack_from(data)
+        if magic != PARTIAL_MAGIC:
+            raise PartialError(f"Not a partial result file: {path}")
+        if version != PARTIAL_VERSION:
+            raise PartialError(f"Unsupported partial result version {version} in {path} "
+                               f"(expected {PARTIAL_VERSION})")
+        try:
+            document = json.loads(zlib.decompress(data[_HEADER.size:]).decode('utf-8'))
+            filter_set = FilterSet([_filter_from_json(record) for record in document['filters']])
+            histogram = document['histogram']
+            partial = {
+                'total_entries': document['total_entries'],
+                'counts': document['counts'],
+                'lines': document['lines'],
+                'histogram': ([dict(bins) for bins in histogram]
+                              if histogram is not None else None),
+                'sketches': [sketch_from_json(sketch) for sketch in document['sketches']],
+            }
+        except (zlib.error, ValueError, KeyError, TypeError, re.error) as e:
+            raise PartialError(f"Corrupt partial result {path}: {e}")
+        if filter_set.fingerprint != document['fingerprint']:
+            raise PartialError(f"Corrupt partial result {path}: filters do not match their fingerprint")
+        return cls(filter_set, partial, document['bucket_seconds'])
+
+# Epoch of the timestamp an output line starts with
+def _line_epoch(line: str) -> Epoch:
+    return parse_timestamp(line.split(' ', 1)[0])
+
+def _filter_to_json(filter_obj: EventFilter) -> Dict:
+    pattern = filter_obj.pattern
+    return {
+        'event_type': filter_obj.event_type,
+        'count': filter_obj.count,
+        'level': filter_obj.level,
+        'pattern': pattern.pattern if pattern is not None else None,
+        'flags': pattern.flags if pattern is not None else None,
+        'top': filter_obj.top,
+        'group_by': filter_obj.group_by,
+        'distinct': filter_obj.distinct,
+    }
+
+def _filter_from_json(record: Dict) -> EventFilter:
+    pattern = record['pattern']
+    return EventFilter(record['event_type'], record['count'], record['level'],
+                       re.compile(pattern, record['flags']) if pattern is not None else None,
+                       record['top'], record['group_by'], record['distinct'])
@@ -0,0 +1,262 @@
+from typing import AnyStr, Dict, List, Optional, Tuple
+import re
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse, sre_constants
+
+def extract_literals(pattern: re.Pattern) -> Tuple[AnyStr, List[AnyStr]]:
+    """Return (anchored_prefix, required_literals) for a compiled pattern
+
+    anchored_prefix is the literal text the pattern requires at the start of
+    the string (empty if none). required_literals are substrings that every
+    match must contain. Both are conservative: an empty result just means no
+    screen. Bytes patterns give bytes literals.
+    """
+    if isinstance(pattern.pattern, bytes):
+        prefix, literals = _extract_literals(pattern)
+        return prefix.encode('latin-1'), [literal.encode('latin-1') for literal in literals]
+    return _extract_literals(pattern)
+
+def _extract_literals(pattern: re.Pattern) -> Tuple[str, List[str]]:
+    if pattern.flags & (re.IGNORECASE | re.MULTILINE | re.VERBOSE):
+        return '', []
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (re.error, TypeError, ValueError):
+        return '', []
+
+    items = list(parsed)
+    prefix = ''
+    if items and items[0][0] is sre_constants.AT and items[0][1] in (
+            sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING):
+        chars = []
+        for op, arg in items[1:]:
+            if op is not sre_constants.LITERAL:
+                break
+            chars.append(chr(arg))
+        prefix = ''.join(chars)
+
+    literals: List[str] = []
+    _collect_literals(items, literals)
+    literals = [literal for literal in literals if literal != prefix]
+    literals.sort(key=len, reverse=True)
+    return prefix, literals
+
+# Walk a parsed sequence, collecting runs of literal characters that are
+# required for any match
+def _collect_literals(items, literals: List[str]) -> None:
+    run: List[str] = []
+
+    def flush():
+        if run:
+            literals.append(''.join(run))
+            run.clear()
+
+    for op, arg in items:
+        if op is sre_constants.LITERAL:
+            run.append(chr(arg))
+        elif op is sre_constants.SUBPATTERN:
+            flush()
+            _group, add_flags, del_flags, sub_items = arg
+            if not add_flags and not del_flags:
+                _collect_literals(sub_items, literals)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            flush()
+            min_count, _max_count, sub_items = arg
+            if min_count >= 1:
+                _collect_literals(sub_items, literals)
+        else:
+            flush()
+    flush()
+
+# What bounds a required literal on one side: nothing known, a word
+# boundary (\b), or the start or end of the string
+UNBOUNDED, WORD_BOUNDARY, STRING_EDGE = '', 'boundary', 'edge'
+
+def extract_bounded_literals(pattern: re.Pattern) -> List[Tuple[str, str, str]]:
+    """Return (literal, left, right) for runs of literal text every match contains
+
+    left and right tell what the pattern puts right before and after the
+    run: UNBOUNDED, WORD_BOUNDARY or STRING_EDGE. Conservative like
+    extract_literals: str patterns only, and none for flags that change
+    what literals, anchors or word boundaries mean.
+    """
+    if (isinstance(pattern.pattern, bytes)
+            or pattern.flags & (re.IGNORECASE | re.MULTILINE | re.VERBOSE | re.ASCII)):
+        return []
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (re.error, TypeError, ValueError):
+        return []
+    literals: List[Tuple[str, str, str]] = []
+    _collect_bounded_literals(list(parsed), literals)
+    return literals
+
+def _bound(op, arg, starts: bool) -> str:
+    if op is not sre_constants.AT:
+        return UNBOUNDED
+    if arg is sre_constants.AT_BOUNDARY:
+        return WORD_BOUNDARY
+    edges = ((sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING) if starts
+             else (sre_constants.AT_END, sre_constants.AT_END_STRING))
+    return STRING_EDGE if arg in edges else UNBOUNDED
+
+# _collect_literals, also noting the anchors next to each run in the same sequence
+def _collect_bounded_literals(items, literals: List[Tuple[str, str, str]]) -> None:
+    run: List[str] = []
+    left = UNBOUNDED
+    previous = None
+    for op, arg in items:
+        if op is sre_constants.LITERAL:
+            if not run:
+                left = _bound(*previous, starts=True) if previous is not None else UNBOUNDED
+            run.append(chr(arg))
+        else:
+            if run:
+                literals.append((''.join(run), left, _bound(op, arg, starts=False)))
+                run = []
+            if op is sre_constants.SUBPATTERN:
+                _group, add_flags, del_flags, sub_items = arg
+                if not add_flags and not del_flags:
+                    _collect_bounded_literals(sub_items, literals)
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                min_count, _max_count, sub_items = arg
+                if min_count >= 1:
+                    _collect_bounded_literals(sub_items, literals)
+        previous = (op, arg)
+    if run:
+        literals.append((''.join(run), left, UNBOUNDED))
+
+def _has_group_references(pattern: re.Pattern) -> bool:
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except (re.error, TypeError, ValueError):
+        return True
+    return _contains_op(parsed, (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS))
+
+def _contains_op(items, ops) -> bool:
+    return any(op in ops or _arg_contains_op(arg, ops) for op, arg in items)
+
+def _arg_contains_op(arg, ops) -> bool:
+    if isinstance(arg, sre_parse.SubPattern):
+        return _contains_op(arg, ops)
+    if isinstance(arg, (list, tuple)):
+        return any(_arg_contains_op(item, ops) for item in arg)
+    return False
+
+class PatternMatcher:
+    """Matches one message against many regex patterns in few scans
+
+    Works on str or bytes patterns (all of one kind) and messages. Patterns
+    anchored with a literal prefix are dispatched by a dict lookup on the
+    start of the message. The others are screened by their longest
+    required literal, and all of those literals are found in one pass of a
+    combined lookahead alternation. Patterns without literals share one
+    combined alternation as a reject screen. A pattern's own regex only runs
+    once its screen passes, so the reported matches are exactly those of
+    pattern.search().
+    """
+
+    # Below this many literal-screened patterns, plain 'in' checks are cheaper
+    # than a combined literal scan
+    LITERAL_SCAN_MIN = 3
+
+    def __init__(self, patterns: List[Tuple[int, re.Pattern]]):
+        self._prefix_length = 0
+        self._anchored: Dict[str, List[Tuple[int, re.Pattern, str, List[str]]]] = {}
+        self._screened: Dict[str, List[Tuple[int, re.Pattern, List[str]]]] = {}
+        self._literal_scan: Optional[re.Pattern] = None
+        self._contained: Dict[str, List[str]] = {}
+        self._bare: List[Tuple[int, re.Pattern]] = []
+        self._combined: Optional[re.Pattern] = None
+
+        anchored = []
+        for filter_index, pattern in patterns:
+            prefix, literals = extract_literals(pattern)
+            if prefix:
+                anchored.append((filter_index, pattern, prefix, literals))
+            elif literals:
+                key, rest = literals[0], literals[1:]
+                self._screened.setdefault(key, []).append((filter_index, pattern, rest))
+            else:
+                self._bare.append((filter_index, pattern))
+
+        if anchored:
+            self._prefix_length = min(len(prefix) for _, _, prefix, _ in anchored)
+            for entry in anchored:
+                key = entry[2][:self._prefix_length]
+                self._anchored.setdefault(key, []).append(entry)
+
+        if sum(len(entries) for entries in self._screened.values()) >= self.LITERAL_SCAN_MIN:
+            keys = sorted(self._screened, key=len, reverse=True)
+            self._literal_scan = re.compile(
+                _join(keys, "(?=(", "|", "))", transform=re.escape))
+            # The scan reports only the longest literal starting at a position,
+            # so a found literal also implies every key literal inside it
+            self._contained = {key: [other for other in keys if other in key]
+                               for key in keys}
+
+        groupless = [pattern for _, pattern in self._bare if not _has_group_references(pattern)]
+        if len(groupless) > 1 and len(groupless) == len(self._bare):
+            self._combined = self._compile_combined(groupless)
+
+    @staticmethod
+    def _compile_combined(patterns: List[re.Pattern]) -> Optional[re.Pattern]:
+        flags = {pattern.flags for pattern in patterns}
+        if len(flags) != 1:
+            return None
+        flags = flags.pop()
+        try:
+            combined = re.compile(_join([p.pattern for p in patterns], "(?:", ")|(?:", ")"), flags)
+        except (re.error, TypeError, ValueError):
+            return None
+        # Inline global flags inside one pattern would leak into the others
+        if combined.flags != flags:
+            return None
+        return combined
+
+    def __len__(self) -> int:
+        return (sum(len(entries) for entries in self._anchored.values())
+                + sum(len(entries) for entries in self._screened.values())
+                + len(self._bare))
+
+    # Return the filter indexes of all patterns that match the message
+    def match(self, message: str) -> List[int]:
+        hits = []
+
+        if self._anchored:
+            for filter_index, pattern, prefix, literals in self._anchored.get(
+                    message[:self._prefix_length], ()):
+                if (message.startswith(prefix)
+                        and all(literal in message for literal in literals)
+                        and pattern.search(message)):
+                    hits.append(filter_index)
+
+        if self._screened:
+            if self._literal_scan is not None:
+                found = set()
+                for scan_match in self._literal_scan.finditer(message):
+                    found.update(self._contained[scan_match.group(1)])
+            else:
+                found = [key for key in self._screened if key in message]
+            for key in found:
+                for filter_index, pattern, literals in self._screened[key]:
+                    if all(literal in message for literal in literals) and pattern.search(message):
+                        hits.append(filter_index)
+
+        if self._bare and (self._combined is None or self._combined.search(message)):
+            hits.extend(filter_index for filter_index, pattern in self._bare
+                        if pattern.search(message))
+
+        return hits
+
+# Join str or bytes parts with str separators converted to the parts' type
+def _join(parts: List[AnyStr], prefix: str, separator: str, suffix: str, transform=None) -> AnyStr:
+    if transform is not None:
+        parts = [transform(part) for part in parts]
+    if parts and isinstance(parts[0], bytes):
+        prefix, separator, suffix = prefix.encode(), separator.encode(), suffix.encode()
+    return prefix + separator.join(parts) + suffix
@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak RSS is reported as unknown
+    resource = None
+
+class FileStats:
+    """What reading one log file cost"""
+
+    __slots__ = ('path', 'size', 'bytes', 'lines', 'rejected', 'skipped', 'out_of_range',
+                 'read_seconds')
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        # Bytes on disk, and bytes read after decompression
+        self.size = size
+        self.bytes = 0
+        self.lines = 0
+        # Lines that are not log entries (too few fields or a bad timestamp)
+        self.rejected = 0
+        # Entries of an event type no filter asks for
+        self.skipped = 0
+        # Entries outside --from/--to
+        self.out_of_range = 0
+        # Time spent reading and decompressing
+        self.read_seconds = 0.0
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class FilterStats:
+    """How often one filter was tested, how often it matched, and what testing cost"""
+
+    __slots__ = ('evaluations', 'matches', 'seconds')
+
+    def __init__(self):
+        self.evaluations = 0
+        self.matches = 0
+        self.seconds = 0.0
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+# Peak resident set size of this process in bytes, None where unknown
+def peak_rss() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class RunStats:
+    """Timings and counters of one run, for --stats
+
+    Stages are timed by whoever runs them; per-file and per-filter figures
+    are only filled in by StatsScanner. Nothing here is touched unless
+    --stats is given.
+    """
+
+    def __init__(self, filter_count: int = 0):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.files: List[FileStats] = []
+        self.filters = [FilterStats() for _ in range(filter_count)]
+        self.entries = 0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @property
+    def lines(self) -> int:
+        return sum(file_stats.lines for file_stats in self.files)
+
+    def to_dict(self) -> Dict:
+        total = time.perf_counter() - self.started
+        # Without per-file figures the entries scanned are the best measure
+        lines = self.lines if self.files else self.entries
+        return {
+            'total_seconds': total,
+            'stages': dict(self.stages),
+            'lines': lines,
+            'entries': self.entries,
+            'lines_per_sec': lines / total if total > 0 else None,
+            'peak_rss_bytes': peak_rss(),
+            'files': [file_stats.to_dict() for file_stats in self.files],
+            'filters': [filter_stats.to_dict() for filter_stats in self.filters],
+        }
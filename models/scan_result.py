@@ -0,0 +1,230 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+import os
+import tempfile
+from models.histogram import Histogram
+from models.sketches import FilterSketch
+from models.timestamp import Epoch
+
+class MemoryMatchStore:
+    """Keeps matching output lines in a list"""
+
+    def __init__(self):
+        self._lines: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def append(self, line: str) -> None:
+        self._lines.append(line)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._lines)
+
+    # The kept lines, for a partial result
+    def export(self) -> List[str]:
+        return list(self._lines)
+
+    def close(self) -> None:
+        self._lines = []
+
+class SpillMatchStore:
+    """Writes matching output lines to an anonymous temp file
+
+    Only the line count is kept in memory, so peak memory does not grow with
+    the number of matches. The file is created on the first append. With
+    named=True the file has a name, so export can hand it to another
+    process instead of the lines.
+    """
+
+    def __init__(self, spill_dir: Optional[str] = None, named: bool = False):
+        self.spill_dir = spill_dir
+        self.named = named
+        self._file = None
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, line: str) -> None:
+        if self._file is None:
+            if self.named:
+                self._file = tempfile.NamedTemporaryFile(mode='w+', encoding='utf-8', newline='\n',
+                                                         dir=self.spill_dir, prefix='loganalyzer-',
+                                                         suffix='.lines', delete=False)
+            else:
+                self._file = tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='\n',
+                                                    dir=self.spill_dir, prefix='loganalyzer-')
+        self._file.write(line)
+        self._file.write('\n')
+        self._length += 1
+
+    def __iter__(self) -> Iterator[str]:
+        if self._file is None:
+            return
+        self._file.flush()
+        self._file.seek(0)
+        for line in self._file:
+            yield line[:-1]
+        self._file.seek(0, 2)
+
+    # The kept lines, for a partial result; a named file is handed over by
+    # path instead, and is then the receiver's to delete
+    def export(self) -> Union[List[str], str]:
+        if not self.named or self._file is None:
+            return list(self)
+        path = self._file.name
+        self._file.close()
+        self._file = None
+        self._length = 0
+        return path
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            if self.named:
+                os.unlink(self._file.name)
+            self._file = None
+
+class ScanResult:
+    """Per-filter counts and matching output lines for one scan
+
+    Matches are only collected for non-count filters, and at most max_lines
+    of them per filter. With stream=True they are spilled to temp files
+    instead of being held in memory; with named_spill=True as well, the
+    spill files are handed over by path in export_partial, for results built
+    in a worker process. With bucket (seconds) set, every
+    filter's matches are also counted per time bucket in a Histogram.
+    Filters with --top/--distinct keep no lines; the message of each
+    matching entry is added to the filter's FilterSketch instead.
+    """
+
+    def __init__(self, filter_set, max_lines: Optional[int] = None,
+                 stream: bool = False, spill_dir: Optional[str] = None,
+                 bucket: Optional[int] = None, named_spill: bool = False):
+        self.filter_set = filter_set
+        self.max_lines = max_lines
+        self.stream = stream or spill_dir is not None
+        self.spill_dir = spill_dir
+        self.total_entries = 0
+        self.counts = [0] * len(filter_set)
+        self.histogram = Histogram(len(filter_set), bucket) if bucket else None
+
+        self.sketches: List[Optional[FilterSketch]] = [
+            FilterSketch(filter_obj) if filter_obj.aggregated else None
+            for filter_obj in filter_set.filters]
+
+        self._stores = []
+        for filter_obj in filter_set.filters:
+            if filter_obj.count or filter_obj.aggregated:
+                self._stores.append(None)
+            elif self.stream:
+                self._stores.append(SpillMatchStore(spill_dir, named_spill))
+            else:
+                self._stores.append(MemoryMatchStore())
+
+    # Record a match for a filter, keeping its output line if still collecting,
+    # adding its message to the filter's sketch if it has one and binning its
+    # timestamp if a histogram is kept
+    def add_match(self, index: int, line: Optional[str] = None,
+                  epoch: Optional[Epoch] = None, message: Optional[str] = None) -> None:
+        self.counts[index] += 1
+        if line is not None and self.wants_lines(index):
+            self._stores[index].append(line)
+        if message is not None:
+            sketch = self.sketches[index]
+            if sketch is not None:
+                sketch.add_message(message)
+        if epoch is not None and self.histogram is not None:
+            self.histogram.add(index, epoch)
+
+    # Keep an output line for a match already recorded, if still collecting
+    def add_line(self, index: int, line: str) -> None:
+        if self.wants_lines(index):
+            self._stores[index].append(line)
+
+    # Record count matches of a filter that all happened at epoch
+    def add_count(self, index: int, count: int, epoch: Optional[Epoch] = None) -> None:
+        self.counts[index] += count
+        if epoch is not None and self.histogram is not None:
+            self.histogram.add_count(index, epoch, count)
+
+    # Whether a filter still needs the text of its matching lines
+    def wants_lines(self, index: int) -> bool:
+        store = self._stores[index]
+        return store is not None and (self.max_lines is None or len(store) < self.max_lines)
+
+    # How many more output lines a filter keeps; None for no limit
+    def lines_wanted(self, index: int) -> Optional[int]:
+        store = self._stores[index]
+        if store is None:
+            return 0
+        if self.max_lines is None:
+            return None
+        return max(0, self.max_lines - len(store))
+
+    # Run log entries through the filter set and record the matches
+    def collect(self, log_entries: Iterable) -> None:
+        match = self.filter_set.match
+        for entry in log_entries:
+            self.total_entries += 1
+            
+            line = None
+            for index in match(entry):
+                if line is None and self.wants_lines(index):
+                    line = entry.format_line()
+                self.add_match(index, line, entry.epoch, entry.message)
+
+    # Small picklable summary of this result, for sending between processes
+    def export_partial(self) -> Dict:
+        return {
+            'total_entries': self.total_entries,
+            'counts': list(self.counts),
+            'lines': [store.export() if store is not None else None for store in self._stores],
+            'histogram': self.histogram.export() if self.histogram is not None else None,
+            'sketches': [sketch.export() if sketch is not None else None
+                         for sketch in self.sketches],
+        }
+
+    # Fold a partial from a later part of the scan into this result
+    def merge_partial(self, partial: Dict) -> None:
+        self.total_entries += partial['total_entries']
+        if self.histogram is not None and partial.get('histogram') is not None:
+            self.histogram.merge(partial['histogram'])
+        for sketch, exported in zip(self.sketches, partial.get('sketches') or ()):
+            if sketch is not None and exported is not None:
+                sketch.merge(exported)
+        for index, (count, lines) in enumerate(zip(partial['counts'], partial['lines'])):
+            self.counts[index] += count
+            if isinstance(lines, str):
+                self._merge_spilled(index, lines)
+                continue
+            for line in lines or ():
+                if not self.wants_lines(index):
+                    break
+                self._stores[index].append(line)
+
+    # Take the lines of a spill file handed over by path, then delete it
+    def _merge_spilled(self, index: int, path: str) -> None:
+        try:
+            with open(path, 'r', encoding='utf-8', newline='\n') as spill_file:
+                for line in spill_file:
+                    if not self.wants_lines(index):
+                        break
+                    self._stores[index].append(line[:-1])
+        finally:
+            os.unlink(path)
+
+    def matches(self, index: int) -> Iterator[str]:
+        store = self._stores[index]
+        return iter(store) if store is not None else iter(())
+
+    def close(self) -> None:
+        for store in self._stores:
+            if store is not None:
+                store.close()
+
+    def __enter__(self) -> 'ScanResult':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
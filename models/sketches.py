@@ -0,0 +1,282 @@
+from typing import Dict, List, Optional, Tuple
+import base64
+import hashlib
+import heapq
+import math
+
+# Counters kept per --top entry; reported counts over-estimate by at most
+# (matches / counters), so more counters mean tighter counts
+TOP_COUNTERS_PER_ENTRY = 100
+MIN_TOP_COUNTERS = 1000
+
+# HyperLogLog registers are 2 ** precision bytes; 14 gives 16 KB per filter
+# and a standard error of 1.04 / sqrt(2 ** 14), about 0.8%
+HLL_PRECISION = 14
+
+# Bloom filter bits per key and probes per key; together a false positive
+# rate of about 0.8%
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+
+class SpaceSaving:
+    """Approximate most frequent keys of a stream in a fixed number of counters
+
+    The Space-Saving algorithm: a key that is not tracked takes over the
+    counter of the least frequent tracked key, inheriting its count as the
+    key's error. Each reported count is an upper bound, at most error above
+    the true count, and errors never exceed total / capacity, so every key
+    seen more often than that is tracked. Summaries of different parts of a
+    stream merge into a summary of the whole with the same bound.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.total = 0
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # (count, key) with exactly one entry per tracked key; counts go stale
+        # as keys are incremented and are refreshed when they reach the top
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, key: str, count: int = 1) -> None:
+        self.total += count
+        counts = self.counts
+        current = counts.get(key)
+        if current is not None:
+            counts[key] = current + count
+            return
+        if len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+            heapq.heappush(self._heap, (count, key))
+            return
+        floor, evicted = self._pop_min()
+        del counts[evicted], self.errors[evicted]
+        counts[key] = floor + count
+        self.errors[key] = floor
+        heapq.heappush(self._heap, (floor + count, key))
+
+    # Remove and return (count, key) of the least frequent tracked key
+    def _pop_min(self) -> Tuple[int, str]:
+        heap, counts = self._heap, self.counts
+        while True:
+            count, key = heap[0]
+            current = counts[key]
+            if current == count:
+                return heapq.heappop(heap)
+            heapq.heapreplace(heap, (current, key))
+
+    # The smallest tracked count once every counter is in use, else 0
+    @property
+    def floor(self) -> int:
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    # Largest error any reported count can have
+    @property
+    def max_error(self) -> int:
+        return self.total // self.capacity
+
+    # (key, count, error) of the n most frequent keys, most frequent first
+    def top(self, n: int) -> List[Tuple[str, int, int]]:
+        ranked = heapq.nsmallest(n, self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return [(key, count, self.errors[key]) for key, count in ranked]
+
+    # Fold another summary in; a key one of them does not track may have
+    # occurred up to that summary's floor times, which goes into its error
+    def merge(self, other: 'SpaceSaving') -> None:
+        own_floor, other_floor = self.floor, other.floor
+        merged = []
+        for key in self.counts.keys() | other.counts.keys():
+            count = self.counts.get(key, own_floor) + other.counts.get(key, other_floor)
+            error = self.errors.get(key, own_floor) + other.errors.get(key, other_floor)
+            merged.append((count, error, key))
+        merged = heapq.nlargest(self.capacity, merged, key=lambda item: (item[0], item[2]))
+        self.total += other.total
+        self.counts = {key: count for count, _, key in merged}
+        self.errors = {key: error for _, error, key in merged}
+        self._heap = [(count, key) for count, _, key in merged]
+        heapq.heapify(self._heap)
+
+    # Picklable state, for sending between processes
+    def export(self) -> Dict:
+        return {
+            'capacity': self.capacity,
+            'total': self.total,
+            'counters': [[key, count, self.errors[key]] for key, count in self.counts.items()],
+        }
+
+    @classmethod
+    def from_export(cls, exported: Dict) -> 'SpaceSaving':
+        summary = cls(exported['capacity'])
+        summary.total = exported['total']
+        for key, count, error in exported['counters']:
+            summary.counts[key] = count
+            summary.errors[key] = error
+            summary._heap.append((count, key))
+        heapq.heapify(summary._heap)
+        return summary
+
+class HyperLogLog:
+    """Approximate number of distinct keys of a stream in 2 ** precision bytes
+
+    Keys are hashed with a 64 bit BLAKE2 digest, which unlike hash() is the
+    same in every process, so sketches built by different workers merge
+    (register by register maximum) into the sketch of the whole stream. The
+    relative standard error is 1.04 / sqrt(2 ** precision).
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, key: str) -> None:
+        hashed = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+        width = 64 - self.precision
+        register = hashed >> width
+        rank = width - (hashed & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self) -> int:
+        registers = self.registers
+        size = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / size)
+        raw = alpha * size * size / sum(2.0 ** -rank for rank in registers)
+        empty = registers.count(0)
+        # Linear counting is more accurate while few registers are set
+        if raw <= 2.5 * size and empty:
+            return round(size * math.log(size / empty))
+        return round(raw)
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def export(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def from_export(cls, exported: bytes) -> 'HyperLogLog':
+        sketch = cls(int(math.log2(len(exported))))
+        sketch.registers = bytearray(exported)
+        return sketch
+
+class BloomFilter:
+    """Set membership in a fixed number of bits: no false negatives, few false positives
+
+    Each key sets hashes bits, picked by double hashing a 128 bit BLAKE2
+    digest, so filters saved by one process are probed alike by another.
+    Sized with for_keys, a filter answers a key that was never added with
+    True about 0.8% of the time.
+    """
+
+    def __init__(self, bits: int, hashes: int = BLOOM_HASHES):
+        self.bits = bits
+        self.hashes = hashes
+        self.array = bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_keys(cls, count: int) -> 'BloomFilter':
+        return cls(max(64, count * BLOOM_BITS_PER_KEY))
+
+    def _positions(self, key: str) -> range:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        step = int.from_bytes(digest[8:], 'big') | 1
+        return range(first, first + step * self.hashes, step)
+
+    def add(self, key: str) -> None:
+        array, bits = self.array, self.bits
+        for position in self._positions(key):
+            position %= bits
+            array[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        array, bits = self.array, self.bits
+        for position in self._positions(key):
+            position %= bits
+            if not array[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def export(self) -> bytes:
+        return bytes(self.array)
+
+    @classmethod
+    def from_export(cls, exported: bytes, bits: int, hashes: int = BLOOM_HASHES) -> 'BloomFilter':
+        bloom = cls(bits, hashes)
+        bloom.array = bytearray(exported)
+        return bloom
+
+class FilterSketch:
+    """The --top and --distinct aggregates of one filter
+
+    Keys are capture groups of the filter's --pattern, taken from the
+    message of each matching entry; lines where the group did not take part
+    add nothing. Memory is fixed by the number of counters and registers,
+    however many lines match.
+    """
+
+    def __init__(self, filter_obj):
+        self.pattern = filter_obj.pattern
+        self.top_n = filter_obj.top
+        self.group_by = _group_ref(filter_obj.group_by)
+        self.distinct_by = _group_ref(filter_obj.distinct)
+        self.top: Optional[SpaceSaving] = None
+        self.distinct: Optional[HyperLogLog] = None
+        if filter_obj.top is not None:
+            self.top = SpaceSaving(max(MIN_TOP_COUNTERS, filter_obj.top * TOP_COUNTERS_PER_ENTRY))
+        if filter_obj.distinct is not None:
+            self.distinct = HyperLogLog()
+
+    # Add the message of a matching entry
+    def add_message(self, message: str) -> None:
+        match = self.pattern.search(message)
+        if match is None:
+            return
+        if self.top is not None:
+            key = match.group(self.group_by)
+            if key is not None:
+                self.top.add(key)
+        if self.distinct is not None:
+            key = match.group(self.distinct_by)
+            if key is not None:
+                self.distinct.add(key)
+
+    # Picklable state, for sending between processes
+    def export(self) -> Dict:
+        return {
+            'top': self.top.export() if self.top is not None else None,
+            'distinct': self.distinct.export() if self.distinct is not None else None,
+        }
+
+    def merge(self, exported: Dict) -> None:
+        if self.top is not None and exported.get('top') is not None:
+            self.top.merge(SpaceSaving.from_export(exported['top']))
+        if self.distinct is not None and exported.get('distinct') is not None:
+            self.distinct.merge(HyperLogLog.from_export(exported['distinct']))
+
+# A FilterSketch export as JSON: HyperLogLog registers are bytes, which JSON
+# carries as base64
+def sketch_to_json(sketch: Optional[Dict]) -> Optional[Dict]:
+    if sketch is None or sketch['distinct'] is None:
+        return sketch
+    return dict(sketch, distinct=base64.b64encode(sketch['distinct']).decode('ascii'))
+
+def sketch_from_json(sketch: Optional[Dict]) -> Optional[Dict]:
+    if sketch is None or sketch['distinct'] is None:
+        return sketch
+    return dict(sketch, distinct=base64.b64decode(sketch['distinct']))
+
+# A --group-by/--distinct group as re.Match.group takes it: a number or a name
+def _group_ref(group: Optional[str]):
+    if group is None:
+        return None
+    return int(group) if group.isdigit() else group
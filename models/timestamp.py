@@ -0,0 +1,60 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Union
+
+# Seconds since 1970-01-01T00:00:00. Naive timestamps are taken as UTC wall
+# clock; fractional seconds (only from the slow path) give a float.
+Epoch = Union[int, float]
+
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+_EPOCH_AWARE = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# 'YYYY-MM-DDTHH:MM:' prefix -> epoch seconds at that minute. Log lines share
+# few distinct minutes, so most lines only need two dict lookups.
+# Both tables are module-level so hot loops can inline the lookups.
+MINUTE_CACHE: Dict[str, int] = {}
+_MINUTE_CACHE_LIMIT = 100_000
+
+SECONDS = {f"{second:02d}": second for second in range(60)}
+
+def parse_timestamp(text: str) -> Epoch:
+    """Parse an ISO timestamp into epoch seconds
+
+    The fixed YYYY-MM-DDTHH:MM:SS layout is handled from a cache of minute
+    prefixes without building a datetime; anything else goes through
+    datetime.fromisoformat, so the accepted inputs are the same. Raises
+    ValueError on invalid input.
+    """
+    second = SECONDS.get(text[17:])
+    if second is not None:
+        minute = MINUTE_CACHE.get(text[:17])
+        if minute is None:
+            minute = _cache_minute(text[:17])
+        if minute is not None:
+            return minute + second
+    return to_epoch(datetime.fromisoformat(text))
+
+# Validate and cache a 'YYYY-MM-DDTHH:MM:' prefix, None if it is not one
+def _cache_minute(prefix: str) -> Optional[int]:
+    if len(prefix) != 17 or prefix[10] != 'T' or prefix[16] != ':' or not prefix.isascii():
+        return None
+    try:
+        minute = to_epoch(datetime.fromisoformat(prefix[:16]))
+    except ValueError:
+        return None
+    if len(MINUTE_CACHE) >= _MINUTE_CACHE_LIMIT:
+        MINUTE_CACHE.clear()
+    MINUTE_CACHE[prefix] = minute
+    return minute
+
+def to_epoch(timestamp: datetime) -> Epoch:
+    if timestamp.tzinfo is not None and timestamp.utcoffset() is not None:
+        delta = timestamp - _EPOCH_AWARE
+    else:
+        delta = timestamp.replace(tzinfo=None) - _EPOCH_NAIVE
+    seconds = delta.days * 86400 + delta.seconds
+    if delta.microseconds:
+        return seconds + delta.microseconds / 1_000_000
+    return seconds
+
+def from_epoch(epoch: Epoch) -> datetime:
+    return _EPOCH_NAIVE + timedelta(seconds=epoch)
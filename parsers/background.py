@@ -0,0 +1,106 @@
+from typing import Callable, Generic, Iterable, Iterator, Optional, TypeVar
+import queue
+import threading
+
+T = TypeVar('T')
+
+# Kinds of queue entries
+_ITEM, _DONE, _ERROR = range(3)
+
+# Seconds a blocked producer waits before checking whether it was closed
+_PUT_TIMEOUT = 0.1
+
+class BackgroundIterator(Generic[T]):
+    """Runs an iterator on a daemon thread, handing its items over through a bounded queue
+
+    The producer stays at most depth items ahead of the consumer, so memory
+    is bounded while producing (reading, decompressing) overlaps with
+    consuming. The iterator is created on the thread by factory, so files it
+    opens are opened and closed there. An exception it raises is re-raised
+    to the consumer in its place, and the value a generator returns is kept
+    in result. close() stops the producer at its next item.
+    """
+
+    def __init__(self, factory: Callable[[], Iterable[T]], depth: int = 4,
+                 name: Optional[str] = None):
+        self.result = None
+        self._queue: queue.Queue = queue.Queue(max(1, depth))
+        self._closed = threading.Event()
+        self._finished = False
+        self._thread = threading.Thread(target=self._run, args=(factory,), daemon=True,
+                                        name=name or 'background-iterator')
+        self._thread.start()
+
+    def _put(self, entry) -> bool:
+        while not self._closed.is_set():
+            try:
+                self._queue.put(entry, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, factory: Callable[[], Iterable[T]]) -> None:
+        iterator = None
+        try:
+            iterator = iter(factory())
+            while True:
+                try:
+                    item = next(iterator)
+                except StopIteration as stop:
+                    self.result = stop.value
+                    break
+                if not self._put((_ITEM, item)):
+                    return
+        except BaseException as e:
+            self._put((_ERROR, e))
+            return
+        finally:
+            # Closing a generator early runs its cleanup (closes its files) here
+            close = getattr(iterator, 'close', None)
+            if close is not None and self._closed.is_set():
+                close()
+        self._put((_DONE, None))
+
+    def __iter__(self) -> Iterator[T]:
+        return self
+
+    def __next__(self) -> T:
+        if self._finished:
+            raise StopIteration
+        kind, value = self._queue.get()
+        if kind == _ITEM:
+            return value
+        self._finished = True
+        self._thread.join()
+        if kind == _ERROR:
+            raise value
+        raise StopIteration
+
+    def close(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        self._closed.set()
+        # Unblock a producer waiting on a full queue
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def __enter__(self) -> 'BackgroundIterator[T]':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        self.close()
+
+# Iterate over factory()'s items, produced on a background thread. The thread
+# is stopped when the returned generator is closed or garbage collected.
+def iter_in_background(factory: Callable[[], Iterable[T]], depth: int = 4,
+                       name: Optional[str] = None) -> Iterator[T]:
+    with BackgroundIterator(factory, depth, name) as items:
+        yield from items
@@ -0,0 +1,95 @@
+from datetime import datetime
+from typing import Iterable, Optional
+from models.filter_set import FilterSet
+from models.scan_result import ScanResult
+from models.timestamp import MINUTE_CACHE, SECONDS, Epoch, parse_timestamp
+from parsers.gzip_index import split_raw_lines
+from parsers.log_parser import LogParser
+
+# The ASCII characters str.strip() removes
+_ASCII_WHITESPACE = b' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'
+
+# Strip a line that starts or ends with a non-ASCII byte, which may be
+# Unicode whitespace that str.strip() would also remove
+def _strip_unicode(line: bytes) -> bytes:
+    return line.decode('utf-8', 'surrogateescape').strip().encode('utf-8', 'surrogateescape')
+
+class BinaryScanner:
+    """Scans log files as bytes, decoding only what a match needs
+
+    Files are read in large blocks and split into lines without decoding.
+    The event type and level are compared as bytes and patterns run on the
+    raw message where that gives the same result (see FilterSet.match_bytes),
+    so lines that match no filter are never decoded; only the timestamps of
+    lines of a wanted event type are. Counts and output lines are the same as
+    a text-mode scan, except that undecodable bytes in a line are replaced
+    with U+FFFD instead of aborting the scan.
+    """
+
+    def __init__(self, log_parser: LogParser, filter_set: FilterSet):
+        self.log_parser = log_parser
+        self.filter_set = filter_set
+
+    def scan(self, scan_result: ScanResult, from_time: Optional[datetime] = None,
+             to_time: Optional[datetime] = None) -> None:
+        from_epoch, to_epoch = self.log_parser._time_bounds(from_time, to_time)
+        log_files = self.log_parser.select_files(from_time, to_time)
+        for _, blocks in self.log_parser.iter_file_blocks(log_files, from_time, to_time):
+            self.scan_lines(split_raw_lines(blocks), scan_result, from_epoch, to_epoch)
+
+    # Match raw lines (bytes without line endings) into scan_result
+    def scan_lines(self, raw_lines: Iterable[bytes], scan_result: ScanResult,
+                   from_epoch: Optional[Epoch] = None, to_epoch: Optional[Epoch] = None) -> None:
+        event_types = self.filter_set.event_types_bytes
+        match = self.filter_set.match_bytes
+        wants_lines = scan_result.wants_lines
+        add_match = scan_result.add_match
+        sketches = scan_result.sketches
+        total_entries = 0
+
+        try:
+            for line in raw_lines:
+                line = line.strip(_ASCII_WHITESPACE)
+                if not line:
+                    continue
+                if line[0] >= 0x80 or line[-1] >= 0x80:
+                    line = _strip_unicode(line)
+
+                parts = line.split(b' ', 3)
+                if len(parts) < 4:
+                    continue
+                timestamp, level, event_type, message = parts
+                if event_type not in event_types:
+                    continue
+
+                try:
+                    timestamp_str = timestamp.decode('utf-8')
+                except UnicodeDecodeError:
+                    continue
+                # Inlined fast path of parse_timestamp, as in LogEntry.from_line
+                second = SECONDS.get(timestamp_str[17:])
+                minute = MINUTE_CACHE.get(timestamp_str[:17]) if second is not None else None
+                if minute is not None:
+                    epoch = minute + second
+                else:
+                    try:
+                        epoch = parse_timestamp(timestamp_str)
+                    except ValueError:
+                        continue
+
+                if from_epoch is not None and epoch < from_epoch:
+                    continue
+                if to_epoch is not None and epoch > to_epoch:
+                    continue
+                total_entries += 1
+
+                text = None
+                for index in match(event_type, level, message):
+                    if text is None and wants_lines(index):
+                        text = line.decode('utf-8', 'replace')
+                    if sketches[index] is not None:
+                        add_match(index, text, epoch, message.decode('utf-8', 'replace'))
+                    else:
+                        add_match(index, text, epoch)
+        finally:
+            scan_result.total_entries += total_entries
@@ -0,0 +1,196 @@
+from typing import AbstractSet, Dict, List, Optional, Sequence, Tuple
+import base64
+import json
+import os
+import re
+from models.event_filter import EventFilter
+from models.log_entry import LogEntry
+from models.pattern_matcher import (STRING_EDGE, UNBOUNDED, WORD_BOUNDARY,
+                                     extract_bounded_literals)
+from models.sketches import BloomFilter
+from models.timestamp import Epoch
+
+BLOCK_INDEX_SUFFIX = '.blk'
+BLOCK_INDEX_VERSION = 1
+
+# Lines per indexed block
+BLOCK_LINES = 64 * 1024
+
+# Message tokens: runs of word characters, and whitespace-separated chunks
+_WORD = re.compile(r'\w+')
+_CHUNK = re.compile(r'\S+')
+
+# (event type, level or None, tokens every matching message contains)
+Screen = Tuple[str, Optional[str], List[str]]
+
+def block_index_path_for(file_path: str) -> str:
+    return file_path + BLOCK_INDEX_SUFFIX
+
+# The tokens a message containing literal is sure to hold: the words and
+# chunks bounded on both sides, since one at an edge of the literal may
+# continue in the message. Words are also bounded by a \b next to the
+# literal, and both kinds by the start or end of the message.
+def literal_tokens(literal: str, left: str = UNBOUNDED, right: str = UNBOUNDED) -> List[str]:
+    tokens = []
+    for token_pattern, bounds in ((_WORD, (WORD_BOUNDARY, STRING_EDGE)), (_CHUNK, (STRING_EDGE,))):
+        for match in token_pattern.finditer(literal):
+            if ((match.start() > 0 or left in bounds)
+                    and (match.end() < len(literal) or right in bounds)):
+                tokens.append(match.group())
+    return tokens
+
+# What a block needs to hold for a filter to match in it
+def filter_screen(filter_obj: EventFilter) -> Screen:
+    tokens: List[str] = []
+    if filter_obj.pattern is not None:
+        for literal, left, right in extract_bounded_literals(filter_obj.pattern):
+            tokens += literal_tokens(literal, left, right)
+    return filter_obj.event_type, filter_obj.level, list(dict.fromkeys(tokens))
+
+class IndexedBlock:
+    """What one block of a log file holds: entry counts by event type and level,
+    the time span, and a bloom filter of the message tokens"""
+
+    def __init__(self, start: Optional[int], end: Optional[int], lines: Optional[int],
+                 min_epoch: Optional[Epoch], max_epoch: Optional[Epoch],
+                 entries: Dict[str, Dict[str, int]], bloom: BloomFilter):
+        # Byte range in an uncompressed file, or the number of lines in a
+        # compressed one, whose blocks are found by counting lines
+        self.start = start
+        self.end = end
+        self.lines = lines
+        self.min_epoch = min_epoch
+        self.max_epoch = max_epoch
+        # event type -> level -> entries
+        self.entries = entries
+        self.bloom = bloom
+
+    # Whether any screened filter can match an entry of this block
+    def can_match(self, screens: Sequence[Screen]) -> bool:
+        for event_type, level, tokens in screens:
+            levels = self.entries.get(event_type)
+            if levels is None or (level is not None and level not in levels):
+                continue
+            if all(token in self.bloom for token in tokens):
+                return True
+        return False
+
+    def entry_count(self, event_types: AbstractSet[str]) -> int:
+        return sum(count for event_type in event_types
+                   for count in self.entries.get(event_type, {}).values())
+
+    def to_json(self) -> Dict:
+        return {
+            'start': self.start,
+            'end': self.end,
+            'lines': self.lines,
+            'min_epoch': self.min_epoch,
+            'max_epoch': self.max_epoch,
+            'entries': self.entries,
+            'bloom_bits': self.bloom.bits,
+            'bloom_hashes': self.bloom.hashes,
+            'bloom': base64.b64encode(self.bloom.export()).decode('ascii'),
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict) -> 'IndexedBlock':
+        bloom = BloomFilter.from_export(base64.b64decode(data['bloom']), data['bloom_bits'],
+                                        data['bloom_hashes'])
+        return cls(data['start'], data['end'], data['lines'], data['min_epoch'],
+                   data['max_epoch'], data['entries'], bloom)
+
+class BlockIndex:
+    """Sidecar block index for a log file, to skip blocks no filter can match
+
+    The file is cut into blocks of BLOCK_LINES lines. Each block records
+    its entries per event type and level, its time span and a bloom filter
+    of the message tokens, so a block that lacks a filter's event type or
+    level, or a token the filter's --pattern literals require, is skipped
+    without being read or parsed; its entries still count towards the total.
+    """
+
+    def __init__(self, size: int, mtime_ns: int, blocks: List[IndexedBlock]):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.blocks = blocks
+
+    @classmethod
+    def load(cls, file_path: str) -> Optional['BlockIndex']:
+        try:
+            with open(block_index_path_for(file_path), 'r', encoding='utf-8') as index_file:
+                data = json.load(index_file)
+            if data.get('version') != BLOCK_INDEX_VERSION:
+                return None
+            index = cls(data['size'], data['mtime_ns'],
+                        [IndexedBlock.from_json(block) for block in data['blocks']])
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+        return index if index.is_current(file_path) else None
+
+    def save(self, file_path: str) -> bool:
+        data = {
+            'version': BLOCK_INDEX_VERSION,
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'blocks': [block.to_json() for block in self.blocks],
+        }
+        temp_path = block_index_path_for(file_path) + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as index_file:
+                json.dump(data, index_file)
+            os.replace(temp_path, block_index_path_for(file_path))
+        except (IOError, OSError):
+            return False
+        return True
+
+    # An index is only valid while the file's size and mtime are unchanged
+    def is_current(self, file_path: str) -> bool:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+class BlockIndexBuilder:
+    """Collects the blocks of a file while all its entries are read"""
+
+    def __init__(self):
+        self.blocks: List[IndexedBlock] = []
+        self._start_block()
+
+    def _start_block(self) -> None:
+        self._entries: Dict[str, Dict[str, int]] = {}
+        self._messages: List[str] = []
+        self._min_epoch: Optional[Epoch] = None
+        self._max_epoch: Optional[Epoch] = None
+
+    def add(self, entry: LogEntry) -> None:
+        levels = self._entries.get(entry.event_type)
+        if levels is None:
+            levels = self._entries[entry.event_type] = {}
+        levels[entry.level] = levels.get(entry.level, 0) + 1
+        self._messages.append(entry.message)
+        epoch = entry.epoch
+        if self._min_epoch is None or epoch < self._min_epoch:
+            self._min_epoch = epoch
+        if self._max_epoch is None or epoch > self._max_epoch:
+            self._max_epoch = epoch
+
+    def end_block(self, start: Optional[int], end: Optional[int], lines: Optional[int]) -> None:
+        # Tokenized in one pass: no token spans the newlines joining the
+        # messages, and str.split() splits on the same whitespace as \S+
+        text = '\n'.join(self._messages)
+        tokens = set(_WORD.findall(text))
+        tokens.update(text.split())
+        bloom = BloomFilter.for_keys(len(tokens))
+        for token in tokens:
+            bloom.add(token)
+        self.blocks.append(IndexedBlock(start, end, lines, self._min_epoch, self._max_epoch,
+                                        self._entries, bloom))
+        self._start_block()
+
+    # The index of a file that had stat when reading began; None if the
+    # file changed while it was read
+    def build(self, file_path: str, stat: os.stat_result) -> Optional[BlockIndex]:
+        index = BlockIndex(stat.st_size, stat.st_mtime_ns, self.blocks)
+        return index if index.is_current(file_path) else None
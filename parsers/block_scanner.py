@@ -0,0 +1,101 @@
+from datetime import datetime
+from itertools import islice
+from typing import List, Optional, Tuple
+from models.filter_set import FilterSet
+from models.log_entry import LogEntry
+from models.scan_result import ScanResult
+from models.timestamp import Epoch
+from parsers.block_index import BlockIndex, IndexedBlock, filter_screen
+from parsers.codec_registry import is_compressed
+from parsers.gzip_index import split_text_lines
+from parsers.log_parser import LogParser
+
+class BlockIndexScanner:
+    """Scans log files through their block indexes, reading only blocks a filter can match
+
+    A block is skipped when no filter's event type (and level) occurs in
+    it, or when a token its --pattern literals require is missing from the
+    block's bloom filter; skipped blocks still add their entries of the
+    wanted event types to the total. Blocks that straddle --from/--to are
+    always read, so the total counts exactly the entries inside the window.
+    Uncompressed files are read block range by block range; compressed ones
+    are still decompressed in full, but skipped lines are not parsed. A
+    file without a current index is read once in full to build it.
+
+    Counts and output lines are the same as a full text-mode scan.
+    """
+
+    def __init__(self, log_parser: LogParser, filter_set: FilterSet):
+        self.log_parser = log_parser
+        self.filter_set = filter_set
+        self.screens = [filter_screen(filter_obj) for filter_obj in filter_set.filters]
+        self.blocks = 0
+        self.skipped_blocks = 0
+
+    def scan(self, scan_result: ScanResult, from_time: Optional[datetime] = None,
+             to_time: Optional[datetime] = None) -> None:
+        from_epoch, to_epoch = self.log_parser._time_bounds(from_time, to_time)
+        for file_path in self.log_parser.select_files(from_time, to_time):
+            index = BlockIndex.load(file_path) or self.log_parser.build_block_index(file_path)
+            if index is None:
+                scan_result.collect(self._in_window(self.log_parser._parse_single_file(file_path),
+                                                    from_epoch, to_epoch))
+            elif is_compressed(file_path):
+                self._scan_compressed(file_path, index, scan_result, from_epoch, to_epoch)
+            else:
+                self._scan_ranges(file_path, index, scan_result, from_epoch, to_epoch)
+
+    # Whether a block has to be read; a skipped one adds its entries within
+    # the window to the total
+    def _read_block(self, block: IndexedBlock, scan_result: ScanResult,
+                    from_epoch: Optional[Epoch], to_epoch: Optional[Epoch]) -> bool:
+        self.blocks += 1
+        if block.min_epoch is None:
+            self.skipped_blocks += 1
+            return False
+        if ((from_epoch is not None and block.max_epoch < from_epoch)
+                or (to_epoch is not None and block.min_epoch > to_epoch)):
+            self.skipped_blocks += 1
+            return False
+        if ((from_epoch is not None and block.min_epoch < from_epoch)
+                or (to_epoch is not None and block.max_epoch > to_epoch)):
+            return True
+        if block.can_match(self.screens):
+            return True
+        self.skipped_blocks += 1
+        scan_result.total_entries += block.entry_count(self.filter_set.event_types)
+        return False
+
+    def _scan_ranges(self, file_path: str, index: BlockIndex, scan_result: ScanResult,
+                     from_epoch: Optional[Epoch], to_epoch: Optional[Epoch]) -> None:
+        # Adjacent blocks to read are read as one range
+        ranges: List[Tuple[int, int]] = []
+        for block in index.blocks:
+            if not self._read_block(block, scan_result, from_epoch, to_epoch):
+                continue
+            if ranges and ranges[-1][1] == block.start:
+                ranges[-1] = (ranges[-1][0], block.end)
+            else:
+                ranges.append((block.start, block.end))
+        for start, end in ranges:
+            scan_result.collect(self._in_window(self.log_parser._parse_file_range(file_path, start, end),
+                                                from_epoch, to_epoch))
+
+    def _scan_compressed(self, file_path: str, index: BlockIndex, scan_result: ScanResult,
+                         from_epoch: Optional[Epoch], to_epoch: Optional[Epoch]) -> None:
+        event_types = self.log_parser.event_types
+        lines = split_text_lines(self.log_parser._decompressed_blocks(file_path))
+        for block in index.blocks:
+            block_lines = islice(lines, block.lines)
+            if self._read_block(block, scan_result, from_epoch, to_epoch):
+                entries = (LogEntry.from_line(line, event_types) for line in block_lines)
+                scan_result.collect(self._in_window(filter(None, entries), from_epoch, to_epoch))
+            else:
+                for _ in block_lines:
+                    pass
+
+    def _in_window(self, entries, from_epoch: Optional[Epoch], to_epoch: Optional[Epoch]):
+        if from_epoch is None and to_epoch is None:
+            return entries
+        include = self.log_parser._should_include_entry
+        return (entry for entry in entries if include(entry, from_epoch, to_epoch))
@@ -0,0 +1,87 @@
+from typing import BinaryIO, Callable, Dict, Generator, List, Optional
+import gzip
+from parsers.gzip_index import READ_BLOCK_SIZE
+
+try:
+    import bz2
+except ImportError:  # Python built without bz2 support
+    bz2 = None
+
+try:
+    import lzma
+except ImportError:  # Python built without lzma support
+    lzma = None
+
+try:
+    from compression import zstd
+except ImportError:  # Python < 3.14: use the zstandard package when installed
+    try:
+        import zstandard as zstd
+    except ImportError:
+        zstd = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # .lz4 files are listed but cannot be read
+    lz4_frame = None
+
+class Codec:
+    """How to open one kind of compressed log file
+
+    A codec whose module is not installed is still registered, so its files
+    are found and reported as unreadable instead of being silently ignored.
+    """
+
+    def __init__(self, suffix: str, opener: Optional[Callable[[str], BinaryIO]],
+                 requires: Optional[str] = None):
+        self.suffix = suffix
+        self.requires = requires
+        self._opener = opener
+
+    @property
+    def available(self) -> bool:
+        return self._opener is not None
+
+    # Open a file for reading decompressed bytes
+    def open(self, file_path: str) -> BinaryIO:
+        if self._opener is None:
+            raise OSError(f"reading {self.suffix} files needs the {self.requires} module")
+        return self._opener(file_path)
+
+# File suffix -> codec, in registration order
+CODECS: Dict[str, Codec] = {}
+
+def register_codec(suffix: str, opener: Optional[Callable[[str], BinaryIO]],
+                   requires: Optional[str] = None) -> Codec:
+    codec = Codec(suffix, opener, requires)
+    CODECS[suffix] = codec
+    return codec
+
+def codec_for(file_path: str) -> Optional[Codec]:
+    for suffix, codec in CODECS.items():
+        if file_path.endswith(suffix):
+            return codec
+    return None
+
+def is_compressed(file_path: str) -> bool:
+    return codec_for(file_path) is not None
+
+def codec_suffixes() -> List[str]:
+    return list(CODECS)
+
+# Decompressed blocks of a compressed file, read through its codec
+def read_codec_blocks(file_path: str, block_size: int = READ_BLOCK_SIZE) -> Generator[bytes, None, None]:
+    with codec_for(file_path).open(file_path) as file_handle:
+        while True:
+            block = file_handle.read(block_size)
+            if not block:
+                break
+            yield block
+
+register_codec('.gz', lambda file_path: gzip.open(file_path, 'rb'))
+register_codec('.bz2', (lambda file_path: bz2.open(file_path, 'rb')) if bz2 else None, 'bz2')
+register_codec('.xz', (lambda file_path: lzma.open(file_path, 'rb')) if lzma else None, 'lzma')
+register_codec('.zst', (lambda file_path: zstd.open(file_path, 'rb')) if zstd else None,
+               'zstandard')
+register_codec('.lz4', (lambda file_path: lz4_frame.open(file_path, 'rb')) if lz4_frame else None,
+               'lz4')
@@ -0,0 +1,320 @@
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import json
+import mmap
+import os
+import sys
+from models.filter_set import FilterSet
+from models.scan_result import ScanResult
+from models.timestamp import Epoch
+from parsers.log_parser import LogParser
+
+try:
+    import numpy
+except ImportError:  # Queries fall back to pure-Python passes over the same files
+    numpy = None
+
+MANIFEST_NAME = 'compact-manifest.json'
+COMPACT_VERSION = 1
+
+# Column file name -> array typecode. Typecode sizes are checked on write
+# and recorded in the manifest with the byte order.
+COLUMNS = {
+    'epochs': 'd',          # Entry timestamps, epoch seconds
+    'levels': 'I',          # Codes into the manifest's levels list
+    'event_types': 'I',     # Codes into the manifest's event_types list
+    'line_offsets': 'q',    # Start of each output line in lines.bin, plus the end
+    'message_starts': 'I',  # Byte offset of the message within its line
+}
+_NUMPY_KINDS = {'d': 'f', 'I': 'u', 'q': 'i'}
+
+LINES_NAME = 'lines.bin'
+
+# Rows buffered before the columns are appended to disk
+FLUSH_ROWS = 65536
+
+class CompactWriter:
+    """Writes log entries into a columnar compact store
+
+    Every entry becomes one row: epoch timestamp, dictionary-encoded level
+    and event_type, and its output line in a concatenated UTF-8 buffer with
+    offsets. Rows keep the order entries were read in, which is the order a
+    text scan reports them.
+    """
+
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        self.rows = 0
+        self.levels: Dict[str, int] = {}
+        self.event_types: Dict[str, int] = {}
+        self._columns = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        self._line_parts: List[bytes] = []
+        self._line_offset = 0
+        os.makedirs(out_dir, exist_ok=True)
+        # An old manifest would describe columns about to be truncated, so a
+        # store is not complete again until close() writes the new one
+        try:
+            os.unlink(self._path(MANIFEST_NAME))
+        except FileNotFoundError:
+            pass
+        for name in list(COLUMNS) + [LINES_NAME]:
+            open(self._path(name), 'wb').close()
+        self._columns['line_offsets'].append(0)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.out_dir, name)
+
+    def add(self, entry) -> None:
+        columns = self._columns
+        level = self.levels.setdefault(entry.level, len(self.levels))
+        event_type = self.event_types.setdefault(entry.event_type, len(self.event_types))
+        line = entry.format_line().encode('utf-8')
+        prefix = len(line) - len(entry.message.encode('utf-8'))
+
+        columns['epochs'].append(entry.epoch)
+        columns['levels'].append(level)
+        columns['event_types'].append(event_type)
+        self._line_offset += len(line)
+        columns['line_offsets'].append(self._line_offset)
+        columns['message_starts'].append(prefix)
+        self._line_parts.append(line)
+        self.rows += 1
+        if len(self._line_parts) >= FLUSH_ROWS:
+            self._flush()
+
+    def add_all(self, entries: Iterable) -> None:
+        for entry in entries:
+            self.add(entry)
+
+    def _flush(self) -> None:
+        for name, column in self._columns.items():
+            with open(self._path(name), 'ab') as column_file:
+                column.tofile(column_file)
+            del column[:]
+        with open(self._path(LINES_NAME), 'ab') as lines_file:
+            lines_file.write(b''.join(self._line_parts))
+        self._line_parts = []
+
+    # Flush the last rows and write the manifest, which marks the store complete
+    def close(self) -> None:
+        self._flush()
+        manifest = {
+            'version': COMPACT_VERSION,
+            'rows': self.rows,
+            'byteorder': sys.byteorder,
+            'columns': {name: [typecode, array(typecode).itemsize]
+                        for name, typecode in COLUMNS.items()},
+            'levels': list(self.levels),
+            'event_types': list(self.event_types),
+        }
+        temp_path = self._path(MANIFEST_NAME) + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(temp_path, self._path(MANIFEST_NAME))
+
+class CompactStore:
+    """Read-only, memory-mapped view of a compact store
+
+    Columns are numpy memmaps when numpy is installed (vectorized=True), and
+    memoryviews over mmaps otherwise; lines.bin is always an mmap.
+    """
+
+    def __init__(self, store_dir: str, vectorized: Optional[bool] = None):
+        with open(os.path.join(store_dir, MANIFEST_NAME), 'r', encoding='utf-8') as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get('version') != COMPACT_VERSION:
+            raise ValueError(f"Unsupported compact store version in {store_dir}")
+
+        self.store_dir = store_dir
+        self.rows = manifest['rows']
+        # Dictionaries of the level and event_type code columns
+        self.level_names: List[str] = manifest['levels']
+        self.event_type_names: List[str] = manifest['event_types']
+        self.vectorized = numpy is not None if vectorized is None else vectorized
+        if self.vectorized and numpy is None:
+            raise ValueError("Vectorized compact queries need numpy")
+        self._byteorder = manifest['byteorder']
+        self._maps: List[mmap.mmap] = []
+
+        for name, (typecode, itemsize) in manifest['columns'].items():
+            setattr(self, name, self._column(name, typecode, itemsize))
+        self.lines = self._map(os.path.join(store_dir, LINES_NAME))
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+    def _map(self, path: str):
+        with open(path, 'rb') as column_file:
+            if os.fstat(column_file.fileno()).st_size == 0:
+                return b''
+            mapped = mmap.mmap(column_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def _column(self, name: str, typecode: str, itemsize: int) -> Sequence:
+        path = os.path.join(self.store_dir, name)
+        if self.vectorized:
+            order = '<' if self._byteorder == 'little' else '>'
+            dtype = numpy.dtype(f"{order}{_NUMPY_KINDS[typecode]}{itemsize}")
+            if os.path.getsize(path) == 0:
+                return numpy.zeros(0, dtype)
+            return numpy.memmap(path, dtype=dtype, mode='r')
+
+        if array(typecode).itemsize != itemsize or self._byteorder != sys.byteorder:
+            column = array(typecode)
+            with open(path, 'rb') as column_file:
+                column.frombytes(column_file.read())
+            if self._byteorder != sys.byteorder:
+                column.byteswap()
+            return column
+        mapped = self._map(path)
+        return memoryview(mapped).cast(typecode) if mapped else array(typecode)
+
+    def line(self, row: int) -> str:
+        return self.lines[self.line_offsets[row]:self.line_offsets[row + 1]].decode('utf-8')
+
+    # (start, end) offsets in lines.bin of the messages of the given rows
+    def message_bounds(self, rows: Sequence[int]) -> Tuple[List[int], List[int]]:
+        if self.vectorized:
+            return ((self.line_offsets[rows] + self.message_starts[rows]).tolist(),
+                    self.line_offsets[rows + 1].tolist())
+        line_offsets, message_starts = self.line_offsets, self.message_starts
+        return ([line_offsets[row] + message_starts[row] for row in rows],
+                [line_offsets[row + 1] for row in rows])
+
+    def close(self) -> None:
+        # numpy memmaps and memoryviews must be released before the mmaps
+        for name in COLUMNS:
+            column = getattr(self, name, None)
+            if isinstance(column, memoryview):
+                column.release()
+            setattr(self, name, None)
+        self.lines = None
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self) -> 'CompactStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+class CompactScanner:
+    """Answers a filter set from a compact store
+
+    Entries are selected by event_type and level codes and the time window
+    without reading any text: with numpy through vectorized masks over the
+    memory-mapped columns, otherwise in one pure-Python pass. Only
+    --pattern filters look at the messages, as raw bytes screened by
+    FilterSet.match_bytes, and only output lines that are kept get decoded.
+    """
+
+    def __init__(self, store: CompactStore, filter_set: FilterSet):
+        self.store = store
+        self.filter_set = filter_set
+
+    def scan(self, scan_result: ScanResult, from_time: Optional[datetime] = None,
+             to_time: Optional[datetime] = None) -> None:
+        store, filter_set = self.store, self.filter_set
+        from_epoch, to_epoch = LogParser._time_bounds(from_time, to_time)
+
+        event_codes = {name: code for code, name in enumerate(store.event_type_names)}
+        level_codes = {name: code for code, name in enumerate(store.level_names)}
+        wanted = sorted(event_codes[event_type] for event_type in filter_set.event_types
+                        if event_type in event_codes)
+        rows_by_event = self._event_rows(wanted, from_epoch, to_epoch)
+        scan_result.total_entries += sum(len(rows) for rows, _ in rows_by_event.values())
+
+        pattern_hits = self._match_patterns(rows_by_event)
+        for index, filter_obj in enumerate(filter_set.filters):
+            if filter_obj.pattern is not None:
+                rows = pattern_hits.get(index, ())
+            else:
+                code = event_codes.get(filter_obj.event_type)
+                if code is None or (filter_obj.level is not None
+                                    and filter_obj.level not in level_codes):
+                    continue
+                rows, levels = rows_by_event[code]
+                if filter_obj.level is not None:
+                    rows = self._with_level(rows, levels, level_codes[filter_obj.level])
+            self._record(scan_result, index, rows)
+
+    # event code -> (rows of that event type in the window, their level codes)
+    def _event_rows(self, wanted: List[int], from_epoch: Optional[Epoch],
+                    to_epoch: Optional[Epoch]) -> Dict[int, Tuple[Sequence[int], Sequence[int]]]:
+        store = self.store
+        if store.vectorized:
+            window = numpy.ones(store.rows, dtype=bool)
+            if from_epoch is not None:
+                window &= store.epochs >= from_epoch
+            if to_epoch is not None:
+                window &= store.epochs <= to_epoch
+            result = {}
+            for code in wanted:
+                rows = numpy.flatnonzero(window & (store.event_types == code))
+                result[code] = (rows, store.levels[rows])
+            return result
+
+        result = {code: ([], []) for code in wanted}
+        for row, (epoch, event_type, level) in enumerate(
+                zip(store.epochs, store.event_types, store.levels)):
+            selected = result.get(event_type)
+            if selected is None:
+                continue
+            if from_epoch is not None and epoch < from_epoch:
+                continue
+            if to_epoch is not None and epoch > to_epoch:
+                continue
+            selected[0].append(row)
+            selected[1].append(level)
+        return result
+
+    def _with_level(self, rows: Sequence[int], levels: Sequence[int], level: int) -> Sequence[int]:
+        if self.store.vectorized:
+            return rows[levels == level]
+        return [row for row, row_level in zip(rows, levels) if row_level == level]
+
+    # filter index -> rows matched by that --pattern filter, in row order
+    def _match_patterns(self, rows_by_event) -> Dict[int, List[int]]:
+        store, filter_set = self.store, self.filter_set
+        pattern_indexes = {index for index, filter_obj in enumerate(filter_set.filters)
+                           if filter_obj.pattern is not None}
+        pattern_events = {filter_set.filters[index].event_type for index in pattern_indexes}
+        level_names = [level.encode('utf-8') for level in store.level_names]
+
+        hits: Dict[int, List[int]] = {}
+        for code, (rows, levels) in rows_by_event.items():
+            event_type = store.event_type_names[code]
+            if event_type not in pattern_events:
+                continue
+            event_bytes = event_type.encode('utf-8')
+            starts, ends = store.message_bounds(rows)
+            if store.vectorized:
+                rows, levels = rows.tolist(), levels.tolist()
+            lines, match_bytes = store.lines, filter_set.match_bytes
+            for row, level, start, end in zip(rows, levels, starts, ends):
+                for index in match_bytes(event_bytes, level_names[level], lines[start:end]):
+                    if index in pattern_indexes:
+                        hits.setdefault(index, []).append(row)
+        return hits
+
+    def _record(self, scan_result: ScanResult, index: int, rows: Sequence[int]) -> None:
+        sketch = scan_result.sketches[index]
+        if sketch is not None:
+            lines = self.store.lines
+            for start, end in zip(*self.store.message_bounds(rows)):
+                sketch.add_message(lines[start:end].decode('utf-8'))
+        kept = 0
+        for row in rows:
+            if not scan_result.wants_lines(index):
+                break
+            scan_result.add_match(index, self.store.line(int(row)))
+            kept += 1
+        scan_result.counts[index] += len(rows) - kept
+        if scan_result.histogram is not None:
+            epochs = self.store.epochs
+            scan_result.histogram.add_many(
+                index, epochs[rows] if self.store.vectorized else [epochs[row] for row in rows])
@@ -1,5 +1,6 @@
 from typing import List
 from models.event_filter import EventFilter
+from models.filter_set import FilterSet
 
 class EventsParser:
     def __init__(self, events_file: str):
@@ -20,6 +21,10 @@ class EventsParser:
             return []
         
         return filters
+
+    # Parse events configuration file into a compiled FilterSet
+    def parse_filter_set(self) -> FilterSet:
+        return FilterSet(self.parse_events())
     
     
     
\ No newline at end of file
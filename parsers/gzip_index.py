@@ -0,0 +1,352 @@
+from collections import deque
+from datetime import datetime
+from functools import partial
+from typing import Callable, Generator, Iterable, List, Optional, Tuple
+from models.timestamp import Epoch, to_epoch
+from parsers.background import BackgroundIterator
+import gzip
+import json
+import mmap
+import os
+import zlib
+
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 2
+
+# Default distance between checkpoints, in uncompressed bytes
+DEFAULT_CHECKPOINT_EVERY = 4 * 1024 * 1024
+
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Compressed bytes per range of a .gz file decoded on its own thread
+PARALLEL_SPLIT_SIZE = 8 * 1024 * 1024
+
+# ID1, ID2 and CM (deflate) of a gzip member header
+GZIP_MAGIC = b'\x1f\x8b\x08'
+
+# Called at the end of each gzip member with
+# (compressed_offset, uncompressed_offset, line_aligned)
+MemberCallback = Callable[[int, int, bool], None]
+
+def index_path_for(file_path: str) -> str:
+    return file_path + INDEX_SUFFIX
+
+# Split a '\n'-terminated text line the way text mode's universal newlines would
+def _universal_lines(text: str) -> List[str]:
+    if '\r' not in text:
+        return [text]
+    lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return [line + '\n' for line in lines]
+
+def split_raw_lines(blocks: Iterable[bytes]) -> Generator[bytes, None, None]:
+    """Yield the lines of a stream of byte blocks, without line endings
+
+    Lines are split where text mode's universal newlines would split them
+    ('\\n', '\\r\\n' and a bare '\\r'), but are not decoded.
+    """
+    pending = b''
+    for block in blocks:
+        if b'\n' not in block:
+            pending += block
+            continue
+        data = pending + block
+        lines = data.split(b'\n')
+        pending = lines.pop()
+        if b'\r' in data:
+            lines = [part for line in lines
+                     for part in (_split_carriage_returns(line) if b'\r' in line else (line,))]
+        yield from lines
+    if pending:
+        if b'\r' in pending:
+            yield from _split_carriage_returns(pending)
+        else:
+            yield pending
+
+def split_text_lines(blocks: Iterable[bytes]) -> Generator[str, None, None]:
+    """Yield the decoded lines of a stream of UTF-8 byte blocks, without line endings
+
+    Lines are split like split_raw_lines, but whole blocks are decoded at
+    once (cut after their last '\\n', so no character is split), which is
+    much cheaper than decoding line by line.
+    """
+    pending = b''
+    for block in blocks:
+        end = block.rfind(b'\n')
+        if end == -1:
+            pending += block
+            continue
+        text = (pending + block[:end + 1]).decode('utf-8') if pending else block[:end + 1].decode('utf-8')
+        pending = block[end + 1:]
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        lines = text.split('\n')
+        lines.pop()
+        yield from lines
+    if pending:
+        text = pending.decode('utf-8')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        lines = text.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        yield from lines
+
+# Split a line holding '\r' characters; one at the very end (from '\r\n' or
+# a final bare '\r') only terminates the line
+def _split_carriage_returns(line: bytes) -> List[bytes]:
+    lines = line.split(b'\r')
+    if lines[-1] == b'':
+        lines.pop()
+    return lines
+
+def iter_gzip_blocks(file_handle, start: int = 0, stop: Optional[int] = None,
+                     on_member_end: Optional[MemberCallback] = None) -> Generator[bytes, None, int]:
+    """Yield decompressed data from the gzip members between two compressed offsets
+
+    start and stop must be member boundaries (0 and None for the whole file);
+    reading stops at the first member end at or after stop, and that offset
+    is returned. on_member_end is told where each member ends, which is where
+    an index can checkpoint; a member end is line-aligned when the output so
+    far ends with '\n'.
+    """
+    file_handle.seek(start)
+    compressed_pos = start
+    uncompressed_pos = 0
+    decompressor = None
+    line_aligned = True
+
+    while stop is None or compressed_pos < stop:
+        data = file_handle.read(READ_BLOCK_SIZE)
+        if not data:
+            break
+
+        while data:
+            if decompressor is None:
+                # Zero padding between or after members is ignored, like gzip.open
+                stripped = data.lstrip(b'\x00')
+                compressed_pos += len(data) - len(stripped)
+                data = stripped
+                if not data or (stop is not None and compressed_pos >= stop):
+                    break
+                decompressor = zlib.decompressobj(31)
+
+            try:
+                output = decompressor.decompress(data)
+            except zlib.error as e:
+                raise gzip.BadGzipFile(f"Invalid gzip data at offset {compressed_pos}: {e}")
+            if output:
+                uncompressed_pos += len(output)
+                line_aligned = output.endswith(b'\n')
+                yield output
+
+            if decompressor.eof:
+                unused = decompressor.unused_data
+                compressed_pos += len(data) - len(unused)
+                data = unused
+                decompressor = None
+                if on_member_end is not None:
+                    on_member_end(compressed_pos, uncompressed_pos, line_aligned)
+                if stop is not None and compressed_pos >= stop:
+                    break
+            else:
+                compressed_pos += len(data)
+                data = b''
+
+    if decompressor is not None:
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+    return compressed_pos
+
+# Blocks of the members from start up to the first member end at or after
+# stop, returning that end offset
+def _member_range_blocks(file_path: str, start: int,
+                         stop: Optional[int]) -> Generator[bytes, None, int]:
+    with open(file_path, 'rb') as file_handle:
+        return (yield from iter_gzip_blocks(file_handle, start, stop))
+
+# Offsets of the first gzip member header at or after every split_size bytes
+def _member_header_candidates(file_path: str, split_size: int) -> List[int]:
+    candidates: List[int] = []
+    with open(file_path, 'rb') as file_handle:
+        size = os.fstat(file_handle.fileno()).st_size
+        if size <= split_size:
+            return candidates
+        with mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for target in range(split_size, size, split_size):
+                if candidates and candidates[-1] >= target:
+                    continue
+                found = mapped.find(GZIP_MAGIC, target)
+                if found == -1:
+                    break
+                candidates.append(found)
+    return candidates
+
+def iter_gzip_blocks_parallel(file_path: str, threads: int, split_size: int = PARALLEL_SPLIT_SIZE,
+                              depth: int = 2) -> Generator[bytes, None, None]:
+    """Yield the decompressed data of a .gz file, decoding its members on several threads
+
+    The file is cut into ranges at the first member header signature after
+    every split_size compressed bytes, and up to threads ranges are decoded
+    ahead on background threads (zlib releases the GIL), each at most depth
+    blocks ahead. A signature can also occur inside compressed data, so a
+    range is only used when the data before it ended exactly at its start;
+    otherwise it is dropped and decoding carries on from where the previous
+    range really ended. Output is the same as iter_gzip_blocks; a
+    single-member file is simply decoded on one background thread.
+    """
+    bounds = [0] + _member_header_candidates(file_path, split_size)
+    ranges = list(zip(bounds, bounds[1:] + [None]))
+    running: deque = deque()
+    launched = 0
+    position = 0
+    try:
+        while running or launched < len(ranges):
+            while len(running) < max(1, threads) and launched < len(ranges):
+                start, stop = ranges[launched]
+                running.append((start, BackgroundIterator(
+                    partial(_member_range_blocks, file_path, start, stop), depth, 'gzip-range')))
+                launched += 1
+
+            start, blocks = running.popleft()
+            if start > position:
+                # The previous range ended at a member boundary before this
+                # one; decode the gap here
+                position = yield from _member_range_blocks(file_path, position, start)
+            if start != position:
+                # Not a member boundary, or already decoded
+                blocks.close()
+                continue
+            yield from blocks
+            position = blocks.result
+
+        # The last range was dropped, so the tail is still left
+        yield from _member_range_blocks(file_path, position, None)
+    finally:
+        for _, blocks in running:
+            blocks.close()
+
+def iter_gzip_lines(file_handle, start: int = 0, stop: Optional[int] = None,
+                    on_member_end: Optional[MemberCallback] = None) -> Generator[str, None, None]:
+    """Yield text lines from the gzip members between two compressed offsets
+
+    Lines are split like gzip.open(..., 'rt') would split them; see
+    iter_gzip_blocks for start, stop and on_member_end.
+    """
+    pending = b''
+    for data in iter_gzip_blocks(file_handle, start, stop, on_member_end):
+        pending += data
+        if b'\n' not in data:
+            continue
+        *complete, pending = pending.split(b'\n')
+        for raw_line in complete:
+            yield from _universal_lines(raw_line.decode('utf-8') + '\n')
+    if pending:
+        yield from _universal_lines(pending.decode('utf-8'))
+
+class GzipIndex:
+    """Sidecar seek index for a .gz log file
+
+    Python's zlib cannot resume inflation at an arbitrary bit offset, so
+    checkpoints are placed at gzip member boundaries, which can be
+    decompressed independently. Multi-member files (as written by log
+    shippers) get a checkpoint every checkpoint_every uncompressed bytes;
+    a single-member file has a single segment. Each segment records the
+    min and max entry timestamp it holds, so segments outside a --from/--to
+    window are skipped exactly, whether or not the file is ordered.
+    """
+
+    def __init__(self, size: int, mtime_ns: int,
+                 segments: List[Tuple[int, int, Optional[Epoch], Optional[Epoch]]]):
+        self.size = size
+        self.mtime_ns = mtime_ns
+        # (compressed_offset, uncompressed_offset, min_epoch, max_epoch)
+        self.segments = segments
+
+    @classmethod
+    def load(cls, file_path: str) -> Optional['GzipIndex']:
+        try:
+            with open(index_path_for(file_path), 'r', encoding='utf-8') as index_file:
+                data = json.load(index_file)
+            if data.get('version') != INDEX_VERSION:
+                return None
+            segments = [tuple(segment) for segment in data['segments']]
+            index = cls(data['size'], data['mtime_ns'], segments)
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+        return index if index.is_current(file_path) else None
+
+    def save(self, file_path: str) -> bool:
+        data = {
+            'version': INDEX_VERSION,
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'segments': [list(segment) for segment in self.segments],
+        }
+        temp_path = index_path_for(file_path) + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as index_file:
+                json.dump(data, index_file)
+            os.replace(temp_path, index_path_for(file_path))
+        except (IOError, OSError):
+            return False
+        return True
+
+    # An index is only valid while the file's size and mtime are unchanged
+    def is_current(self, file_path: str) -> bool:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return False
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+    # Compressed (start, stop) ranges of the segments that can hold entries
+    # within [from_time, to_time]; stop None means end of file
+    def ranges_for(self, from_time: Optional[datetime],
+                   to_time: Optional[datetime]) -> List[Tuple[int, Optional[int]]]:
+        lower = to_epoch(from_time) if from_time is not None else None
+        upper = to_epoch(to_time) if to_time is not None else None
+        ranges: List[Tuple[int, Optional[int]]] = []
+        for position, (compressed, _, min_epoch, max_epoch) in enumerate(self.segments):
+            if min_epoch is None:
+                continue
+            if lower is not None and max_epoch < lower:
+                continue
+            if upper is not None and min_epoch > upper:
+                continue
+            stop = (self.segments[position + 1][0]
+                    if position + 1 < len(self.segments) else None)
+            if ranges and ranges[-1][1] == compressed:
+                ranges[-1] = (ranges[-1][0], stop)
+            else:
+                ranges.append((compressed, stop))
+        return ranges
+
+class GzipIndexBuilder:
+    """Collects checkpoints and per-segment timestamps while a file is read"""
+
+    def __init__(self, checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY):
+        self.checkpoint_every = checkpoint_every
+        self.segments: List[List] = [[0, 0, None, None]]
+
+    def add_timestamp(self, epoch: Epoch) -> None:
+        segment = self.segments[-1]
+        if segment[2] is None or epoch < segment[2]:
+            segment[2] = epoch
+        if segment[3] is None or epoch > segment[3]:
+            segment[3] = epoch
+
+    def member_end(self, compressed_offset: int, uncompressed_offset: int,
+                   line_aligned: bool) -> None:
+        if line_aligned and uncompressed_offset - self.segments[-1][1] >= self.checkpoint_every:
+            self.segments.append([compressed_offset, uncompressed_offset, None, None])
+
+    def build(self, file_path: str) -> Optional[GzipIndex]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        # Drop a checkpoint placed at the very end of the file
+        segments = [tuple(segment) for segment in self.segments
+                    if segment[0] < stat.st_size or segment[0] == 0]
+        return GzipIndex(stat.st_size, stat.st_mtime_ns, segments)
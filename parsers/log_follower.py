@@ -0,0 +1,182 @@
+from datetime import datetime
+from typing import Callable, Dict, Generator, Iterable, List, Optional
+import os
+import time
+from models.filter_set import FilterSet
+from models.log_entry import LogEntry
+from models.scan_result import ScanResult
+from models.sketches import FilterSketch
+from models.timestamp import Epoch
+from parsers.codec_registry import is_compressed
+from parsers.gzip_index import READ_BLOCK_SIZE, _split_carriage_returns
+from parsers.log_parser import LogParser
+
+# An unfinished line longer than this is processed as it is, so a writer that
+# never ends its line cannot grow memory without bound
+MAX_PENDING = 1024 * 1024
+
+# Called after each poll with the poll's result and whether it was the first
+Reporter = Callable[[ScanResult, bool], None]
+
+class _FollowedFile:
+    """An open log file and the unfinished line read from it so far"""
+
+    def __init__(self, path: str, handle):
+        stat = os.fstat(handle.fileno())
+        self.path = path
+        self.handle = handle
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.pending = b''
+
+    # Start over if the file was truncated (copytruncate rotation)
+    def check_truncated(self) -> None:
+        if os.fstat(self.handle.fileno()).st_size < self.handle.tell():
+            self.handle.seek(0)
+            self.pending = b''
+
+    # Complete raw lines appended since the last read. The unfinished line
+    # is returned too when the file did not grow since the last read, as its
+    # writer may never end it, or with final=True
+    def read_lines(self, final: bool = False) -> Generator[bytes, None, None]:
+        grew = False
+        while True:
+            data = self.handle.read(READ_BLOCK_SIZE)
+            if not data:
+                break
+            grew = True
+            lines = (self.pending + data).split(b'\n')
+            self.pending = lines.pop()
+            if len(self.pending) > MAX_PENDING:
+                lines.append(self.pending)
+                self.pending = b''
+            yield from lines
+        if self.pending and (final or not grew):
+            yield self.pending
+            self.pending = b''
+
+    def close(self) -> None:
+        self.handle.close()
+
+class LogFollower:
+    """Follows a log directory by polling, like tail -F for every log file
+
+    The first poll reads every file from the start (compressed files
+    included), unfinished last lines too, so it reports what a batch run
+    would. Later polls list the directory again, read only what was
+    appended to uncompressed files, and start reading new files from the
+    start; a file's unfinished last line is held back while the file grows. A path whose inode changed was rotated: the old file is drained
+    through its still-open handle before the new one is read, so no lines
+    are lost. A file that shrank was truncated and is read again from the
+    start. Compressed files appearing later are taken to be rotated copies
+    of lines already read and are skipped.
+
+    Memory stays bounded: only per-filter totals and sketches, one open
+    handle and one unfinished line per file are kept between polls, and each
+    poll's matching lines are reported and then dropped.
+    """
+
+    def __init__(self, log_parser: LogParser, filter_set: FilterSet,
+                 poll_interval: float = 1.0, max_lines: Optional[int] = None,
+                 stream: bool = False, spill_dir: Optional[str] = None):
+        self.log_parser = log_parser
+        self.filter_set = filter_set
+        self.poll_interval = poll_interval
+        self.max_lines = max_lines
+        self.stream = stream
+        self.spill_dir = spill_dir
+        # Matches per filter over all polls so far
+        self.totals = [0] * len(filter_set)
+        # --top/--distinct sketches per filter over all polls so far
+        self.sketches: List[Optional[FilterSketch]] = [
+            FilterSketch(filter_obj) if filter_obj.aggregated else None
+            for filter_obj in filter_set.filters]
+        self._files: Dict[str, _FollowedFile] = {}
+        self._polls = 0
+
+    # Poll until interrupted (or for the given number of polls), reporting
+    # each poll's result. Polls start every poll_interval seconds.
+    def follow(self, report: Reporter, from_time: Optional[datetime] = None,
+               to_time: Optional[datetime] = None, polls: Optional[int] = None) -> None:
+        try:
+            while polls is None or polls > 0:
+                started = time.monotonic()
+                with ScanResult(self.filter_set, self.max_lines, self.stream,
+                                self.spill_dir) as scan_result:
+                    first = self._polls == 0
+                    self.poll(scan_result, from_time, to_time)
+                    report(scan_result, first)
+                if polls is not None:
+                    polls -= 1
+                    if polls == 0:
+                        break
+                time.sleep(max(0.0, self.poll_interval - (time.monotonic() - started)))
+        finally:
+            self.close()
+
+    # Read everything written since the last poll into scan_result
+    def poll(self, scan_result: ScanResult, from_time: Optional[datetime] = None,
+             to_time: Optional[datetime] = None) -> None:
+        bounds = self.log_parser._time_bounds(from_time, to_time)
+        first = self._polls == 0
+        self._polls += 1
+
+        current = {}
+        for file_path in self.log_parser._get_log_files():
+            if is_compressed(file_path):
+                if first:
+                    current[file_path] = None
+                continue
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            current[file_path] = (stat.st_dev, stat.st_ino)
+
+        # Drain files that were removed or rotated away before reading
+        # whatever replaced them
+        for file_path, followed in list(self._files.items()):
+            if current.get(file_path) != followed.identity:
+                self._collect(followed.read_lines(final=True), scan_result, bounds)
+                followed.close()
+                del self._files[file_path]
+
+        for file_path in sorted(current):
+            if is_compressed(file_path):
+                scan_result.collect(entry for entry in self.log_parser._parse_file(file_path)
+                                    if self.log_parser._should_include_entry(entry, *bounds))
+                continue
+            followed = self._files.get(file_path)
+            if followed is None:
+                try:
+                    followed = _FollowedFile(file_path, open(file_path, 'rb'))
+                except (IOError, OSError) as e:
+                    print(f"Warning: Could not read file {file_path}: {e}")
+                    continue
+                self._files[file_path] = followed
+            else:
+                followed.check_truncated()
+            self._collect(followed.read_lines(final=first), scan_result, bounds)
+
+        for index, count in enumerate(scan_result.counts):
+            self.totals[index] += count
+        for sketch, polled in zip(self.sketches, scan_result.sketches):
+            if sketch is not None:
+                sketch.merge(polled.export())
+
+    def _collect(self, raw_lines: Iterable[bytes], scan_result: ScanResult, bounds) -> None:
+        scan_result.collect(self._entries(raw_lines, *bounds))
+
+    def _entries(self, raw_lines: Iterable[bytes], from_epoch: Optional[Epoch],
+                 to_epoch: Optional[Epoch]) -> Generator[LogEntry, None, None]:
+        event_types = self.log_parser.event_types
+        for raw_line in raw_lines:
+            pieces = _split_carriage_returns(raw_line) if b'\r' in raw_line else (raw_line,)
+            for piece in pieces:
+                entry = LogEntry.from_line(piece.decode('utf-8', 'replace'), event_types)
+                if entry and self.log_parser._should_include_entry(entry, from_epoch, to_epoch):
+                    yield entry
+
+    def close(self) -> None:
+        for followed in self._files.values():
+            followed.close()
+        self._files = {}
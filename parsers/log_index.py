@@ -0,0 +1,279 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import threading
+from models.filter_set import FilterSet
+from models.log_entry import LogEntry
+from models.scan_result import ScanResult
+from models.timestamp import Epoch
+from parsers.codec_registry import is_compressed
+from parsers.log_parser import LogParser
+from parsers.scan_cache import HEAD_SIZE, _head_digest, _last_line_end
+
+# Estimated bytes an entry takes in memory besides its message text: the
+# slotted LogEntry, its epoch, timestamp text and the index list slots
+ENTRY_OVERHEAD = 200
+
+# Results of recent queries kept for repeating them without a scan
+RESULT_CACHE_SIZE = 32
+
+class _LoadedFile:
+    """The entries of one log file, indexed by event type"""
+
+    def __init__(self, path: str, stat: os.stat_result):
+        self.path = path
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        # Bytes of complete lines loaded, and a hash of the file's first
+        # head_size bytes to tell an append from a rewrite (uncompressed files)
+        self.offset = 0
+        self.head = None
+        self.head_size = 0
+        # event type -> entries in file order, their epochs, and whether the
+        # epochs are ascending (so a time window is found by bisection)
+        self.entries: Dict[str, List[LogEntry]] = {}
+        self.epochs: Dict[str, List[Epoch]] = {}
+        self.ordered: Dict[str, bool] = {}
+        self.memory = 0
+
+    def add(self, entries: Iterable[LogEntry]) -> None:
+        memory = 0
+        for entry in entries:
+            event_type, epoch = entry.event_type, entry.epoch
+            epochs = self.epochs.get(event_type)
+            if epochs is None:
+                self.entries[event_type] = [entry]
+                self.epochs[event_type] = [epoch]
+                self.ordered[event_type] = True
+            else:
+                if epoch < epochs[-1]:
+                    self.ordered[event_type] = False
+                self.entries[event_type].append(entry)
+                epochs.append(epoch)
+            memory += ENTRY_OVERHEAD + len(entry.message)
+        self.memory += memory
+
+    def is_current(self, stat: os.stat_result) -> bool:
+        return stat.st_size == self.size and stat.st_mtime_ns == self.mtime_ns
+
+    # The entries of an event type within [from_epoch, to_epoch], in file order
+    def select(self, event_type: str, from_epoch: Optional[Epoch],
+               to_epoch: Optional[Epoch]) -> Sequence[LogEntry]:
+        entries = self.entries.get(event_type)
+        if not entries:
+            return ()
+        if from_epoch is None and to_epoch is None:
+            return entries
+        epochs = self.epochs[event_type]
+        if self.ordered[event_type]:
+            start = bisect_left(epochs, from_epoch) if from_epoch is not None else 0
+            end = bisect_right(epochs, to_epoch) if to_epoch is not None else len(epochs)
+            return entries[start:end]
+        return [entry for entry, epoch in zip(entries, epochs)
+                if (from_epoch is None or epoch >= from_epoch)
+                and (to_epoch is None or epoch <= to_epoch)]
+
+class LogIndex:
+    """The log files of a folder parsed once and kept in memory for repeated queries
+
+    Files are loaded on first use and kept, indexed by event type, in least
+    recently used order; once the estimated memory exceeds memory_limit the
+    coldest files are dropped (and loaded again when a query needs them). A
+    file that alone exceeds the limit is scanned without being kept.
+
+    Every query stats the files first: a file that grew is extended from the
+    end of its last complete line, and one that changed otherwise (rewritten,
+    truncated, rotated, recompressed) is loaded again, so results are always
+    those of a fresh scan. The results of recent queries are kept as well,
+    within the same memory limit, and answered again while no file changed.
+    """
+
+    def __init__(self, log_parser: LogParser, memory_limit: int):
+        self.log_parser = log_parser
+        self.memory_limit = memory_limit
+        self._files: 'OrderedDict[str, _LoadedFile]' = OrderedDict()
+        # query key -> (file stamp, exported partial, estimated memory)
+        self._results: 'OrderedDict[Tuple, Tuple]' = OrderedDict()
+        # Queries come from several server threads
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+        self.queries = 0
+        self.result_hits = 0
+
+    @property
+    def memory(self) -> int:
+        return (sum(loaded.memory for loaded in self._files.values())
+                + sum(result[2] for result in self._results.values()))
+
+    # (path, stat) of every log file present
+    def _stat_files(self) -> List[Tuple[str, os.stat_result]]:
+        files = []
+        for file_path in self.log_parser._get_log_files():
+            try:
+                files.append((file_path, os.stat(file_path)))
+            except OSError as e:
+                print(f"Warning: Could not read file {file_path}: {e}")
+        return files
+
+    # Bring loaded files up to date with the folder, dropping files that are
+    # gone; with load=True also load files not loaded yet, while they fit
+    def refresh(self, load: bool = False) -> None:
+        with self._lock:
+            files = self._stat_files()
+            self._forget_missing(files)
+            for file_path, stat in files:
+                if file_path in self._files or (load and self.memory < self.memory_limit):
+                    self._load(file_path, stat)
+
+    def query(self, filter_set: FilterSet, from_time: Optional[datetime] = None,
+              to_time: Optional[datetime] = None, max_lines: Optional[int] = None,
+              bucket: Optional[int] = None) -> ScanResult:
+        from_epoch, to_epoch = self.log_parser._time_bounds(from_time, to_time)
+        with self._lock:
+            self.queries += 1
+            files = self._stat_files()
+            stamp = tuple((file_path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+                          for file_path, stat in files)
+            key = (filter_set.fingerprint, from_epoch, to_epoch, max_lines, bucket)
+            scan_result = ScanResult(filter_set, max_lines, bucket=bucket)
+            cached = self._results.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._results.move_to_end(key)
+                self.result_hits += 1
+                scan_result.merge_partial(cached[1])
+                return scan_result
+
+            for file_path, stat in files:
+                loaded = self._load(file_path, stat)
+                if loaded is not None:
+                    self._scan_loaded(loaded, scan_result, from_epoch, to_epoch)
+                    self._scan_tail(loaded, stat, scan_result, from_epoch, to_epoch)
+            self._forget_missing(files)
+            self._keep_result(key, stamp, scan_result)
+            return scan_result
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                'log_dir': self.log_parser.log_dir,
+                'loaded_files': len(self._files),
+                'entries': sum(len(entries) for loaded in self._files.values()
+                               for entries in loaded.entries.values()),
+                'memory_bytes': self.memory,
+                'memory_limit_bytes': self.memory_limit,
+                'loads': self.loads,
+                'evictions': self.evictions,
+                'queries': self.queries,
+                'cached_results': len(self._results),
+                'result_hits': self.result_hits,
+            }
+
+    def _forget_missing(self, files: List[Tuple[str, os.stat_result]]) -> None:
+        present = {file_path for file_path, _ in files}
+        for file_path in list(self._files):
+            if file_path not in present:
+                del self._files[file_path]
+
+    # The loaded form of a file, brought up to date; a file too large to
+    # keep is returned without being kept. None when it cannot be read.
+    def _load(self, file_path: str, stat: os.stat_result) -> Optional[_LoadedFile]:
+        loaded = self._files.get(file_path)
+        if loaded is not None:
+            if loaded.is_current(stat):
+                self._files.move_to_end(file_path)
+                return loaded
+            if self._is_append(loaded, stat):
+                self._extend(loaded, stat)
+                self._files.move_to_end(file_path)
+                self._evict()
+                return loaded
+            del self._files[file_path]
+
+        loaded = _LoadedFile(file_path, stat)
+        try:
+            if is_compressed(file_path):
+                loaded.add(self.log_parser._parse_single_file(file_path))
+                loaded.offset = stat.st_size
+            else:
+                self._extend(loaded, stat)
+        except (IOError, OSError, ValueError) as e:
+            print(f"Warning: Could not read file {file_path}: {e}")
+            return None
+        self.loads += 1
+        if loaded.memory <= self.memory_limit:
+            self._files[file_path] = loaded
+            self._evict()
+        return loaded
+
+    # Whether a loaded uncompressed file only had lines appended since
+    def _is_append(self, loaded: _LoadedFile, stat: os.stat_result) -> bool:
+        if is_compressed(loaded.path) or stat.st_size < loaded.size:
+            return False
+        if (stat.st_dev, stat.st_ino) != loaded.identity:
+            return False
+        try:
+            return _head_digest(loaded.path, loaded.head_size) == loaded.head
+        except (IOError, OSError):
+            return False
+
+    # Load the complete lines an uncompressed file gained
+    def _extend(self, loaded: _LoadedFile, stat: os.stat_result) -> None:
+        end = _last_line_end(loaded.path, loaded.offset, stat.st_size)
+        loaded.add(self.log_parser._parse_file_range(loaded.path, loaded.offset, end))
+        loaded.offset = end
+        loaded.size = stat.st_size
+        loaded.mtime_ns = stat.st_mtime_ns
+        if loaded.head is None:
+            loaded.head_size = min(end, HEAD_SIZE)
+            loaded.head = _head_digest(loaded.path, loaded.head_size)
+
+    # Drop cached results, then the least recently used files, until the
+    # estimated memory is within the limit
+    def _evict(self) -> None:
+        while self.memory > self.memory_limit and (self._results or len(self._files) > 1):
+            if self._results:
+                self._results.popitem(last=False)
+            else:
+                self._files.popitem(last=False)
+                self.evictions += 1
+
+    def _scan_loaded(self, loaded: _LoadedFile, scan_result: ScanResult,
+                     from_epoch: Optional[Epoch], to_epoch: Optional[Epoch]) -> None:
+        match = scan_result.filter_set.match
+        add_match, wants_lines = scan_result.add_match, scan_result.wants_lines
+        for event_type in scan_result.filter_set.event_types:
+            entries = loaded.select(event_type, from_epoch, to_epoch)
+            scan_result.total_entries += len(entries)
+            for entry in entries:
+                line = None
+                for index in match(entry):
+                    if line is None and wants_lines(index):
+                        line = entry.format_line()
+                    add_match(index, line, entry.epoch, entry.message)
+
+    # The unfinished last line of a growing file is read on every query
+    def _scan_tail(self, loaded: _LoadedFile, stat: os.stat_result, scan_result: ScanResult,
+                   from_epoch: Optional[Epoch], to_epoch: Optional[Epoch]) -> None:
+        if is_compressed(loaded.path) or stat.st_size <= loaded.offset:
+            return
+        event_types = scan_result.filter_set.event_types
+        scan_result.collect(
+            entry for entry in self.log_parser._parse_file_range(loaded.path, loaded.offset, stat.st_size)
+            if entry.event_type in event_types
+            and self.log_parser._should_include_entry(entry, from_epoch, to_epoch))
+
+    def _keep_result(self, key: Tuple, stamp: Tuple, scan_result: ScanResult) -> None:
+        partial = scan_result.export_partial()
+        memory = sum(ENTRY_OVERHEAD + len(line) for lines in partial['lines'] if lines
+                     for line in lines)
+        if memory > self.memory_limit // 4:
+            return
+        self._results[key] = (stamp, partial, memory)
+        self._results.move_to_end(key)
+        while len(self._results) > RESULT_CACHE_SIZE:
+            self._results.popitem(last=False)
+        self._evict()
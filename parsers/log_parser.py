@@ -1,22 +1,288 @@
-from typing import List, Optional, Generator
+from typing import AbstractSet, Iterator, List, Optional, Generator, Tuple
 from datetime import datetime
+from fnmatch import fnmatch
+from functools import partial
+from itertools import islice
+from operator import attrgetter
+import copy
+import heapq
 import os
-import gzip
+import tempfile
+import io
+import mmap
+try:
+    import resource
+except ImportError:  # Windows: the fan-in is not capped by the open file limit
+    resource = None
 from models.log_entry import LogEntry
+from models.timestamp import Epoch, to_epoch
+from parsers.background import iter_in_background
+from parsers.block_index import BLOCK_LINES, BlockIndex, BlockIndexBuilder
+from parsers.codec_registry import codec_suffixes, is_compressed, read_codec_blocks
+from parsers.span_manifest import Span, SpanManifest, span_of
+from parsers.time_seek import find_time_range, find_time_span
+from parsers.gzip_index import (DEFAULT_CHECKPOINT_EVERY, READ_BLOCK_SIZE, GzipIndex,
+                                GzipIndexBuilder, iter_gzip_blocks, iter_gzip_blocks_parallel,
+                                iter_gzip_lines, split_raw_lines, split_text_lines)
+
+# Decompressed blocks a background decompression thread may read ahead
+DECOMPRESS_QUEUE_DEPTH = 4
+
+# In the read-ahead queue, marks the end of a file's blocks, and a file the
+# consumer has to parse itself (a .gz file whose index is built on this read)
+_FILE_END = None
+_PARSE_INLINE = object()
+
+# Streams --merge-by-time merges at once; more files are merged a batch at
+# a time into sorted temporary runs, which are then merged the same way
+MERGE_FAN_IN = 64
+
+# The merge fan-in, kept to half the process's open file limit
+def merge_fan_in() -> int:
+    if resource is None:
+        return MERGE_FAN_IN
+    soft_limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    if soft_limit == resource.RLIM_INFINITY:
+        return MERGE_FAN_IN
+    return max(2, min(MERGE_FAN_IN, soft_limit // 2))
+
+class LogReadError(IOError):
+    """A log file could not be read where skipping it would leave the results incomplete"""
+
+class _MappedRange(io.RawIOBase):
+    """Read-only raw stream over a byte range of a memory-mapped file"""
+
+    def __init__(self, mapped: mmap.mmap, start: int, end: int):
+        self._mapped = mapped
+        self._pos = start
+        self._end = end
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self._end - self._pos)
+        if size <= 0:
+            return 0
+        buffer[:size] = self._mapped[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+# Entries sorted by timestamp within a sliding window: each entry is held
+# until window later ones have been read, so an entry up to window lines
+# late (behind an earlier timestamp) still comes out in order
+def reorder_entries(entries: Iterator[LogEntry], window: int) -> Generator[LogEntry, None, None]:
+    heap: List[Tuple[Epoch, int, LogEntry]] = []
+    for sequence, entry in enumerate(entries):
+        if len(heap) < window:
+            heapq.heappush(heap, (entry.epoch, sequence, entry))
+        else:
+            yield heapq.heappushpop(heap, (entry.epoch, sequence, entry))[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+# Entries of a sorted run file written by merge_sorted
+def _read_run(run_path: str) -> Generator[LogEntry, None, None]:
+    with open(run_path, 'r', encoding='utf-8', newline='\n') as run_file:
+        for line in run_file:
+            entry = LogEntry.from_line(line)
+            if entry:
+                yield entry
+
+# k-way merge of timestamp-sorted streams, at most fan_in (by default
+# merge_fan_in()) at a time. Streams
+# are only started when their batch is merged, so no more than fan_in files
+# are open at once; each batch beyond the last is written to a temporary
+# run. Equal timestamps keep stream order.
+def merge_sorted(streams: List[Iterator[LogEntry]],
+                 fan_in: Optional[int] = None) -> Generator[LogEntry, None, None]:
+    fan_in = fan_in or merge_fan_in()
+    if len(streams) <= fan_in:
+        yield from heapq.merge(*streams, key=attrgetter('epoch'))
+        return
+    with tempfile.TemporaryDirectory(prefix='log-merge-') as run_dir:
+        run_count = 0
+        while len(streams) > fan_in:
+            runs = []
+            for start in range(0, len(streams), fan_in):
+                run_path = os.path.join(run_dir, f'run-{run_count}.log')
+                run_count += 1
+                with open(run_path, 'w', encoding='utf-8', newline='\n') as run_file:
+                    for entry in heapq.merge(*streams[start:start + fan_in], key=attrgetter('epoch')):
+                        run_file.write(entry.format_line() + '\n')
+                runs.append(run_path)
+            streams = [_read_run(run_path) for run_path in runs]
+        yield from heapq.merge(*streams, key=attrgetter('epoch'))
 
 class LogParser:
-    def __init__(self, log_dir: str):
+    def __init__(self, log_dir: str, seek: bool = False, gz_index: bool = False,
+                 gz_checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+                 event_types: Optional[AbstractSet[str]] = None,
+                 decompress_threads: int = 1, recursive: bool = False,
+                 include: Optional[List[str]] = None, exclude: Optional[List[str]] = None,
+                 prune: bool = False, read_ahead: int = 0,
+                 block_size: int = READ_BLOCK_SIZE, merge_by_time: bool = False,
+                 reorder_window: int = 0):
         self.log_dir = log_dir
+        # Only yield entries of these event types (None means all); other
+        # lines are dropped before their timestamp or message is decoded
+        self.event_types = event_types
+        # Binary-search timestamp-ordered uncompressed files for --from/--to
+        self.seek = seek
+        # Use (and build on first full read) sidecar seek indexes for .gz files
+        self.gz_index = gz_index
+        self.gz_checkpoint_every = gz_checkpoint_every
+        # Threads decompressing a compressed file while its lines are parsed:
+        # 0 decompresses inline, and more than 1 also decodes the members of
+        # multi-member .gz files in parallel
+        self.decompress_threads = decompress_threads
+        # Also look for log files in subdirectories, keeping those matching
+        # an include glob (if any) and no exclude glob
+        self.recursive = recursive
+        self.include = include or []
+        self.exclude = exclude or []
+        # Skip files whose time span lies outside --from/--to; pruned_files
+        # counts the files skipped by the last select_files
+        self.prune = prune
+        self.pruned_files = 0
+        # Blocks a background thread may read ahead of parsing, across file
+        # boundaries (0 reads on the parsing thread), and bytes per block
+        self.read_ahead = read_ahead
+        self.block_size = block_size
+        # Interleave the files' entries by timestamp instead of concatenating
+        # them in file name order, first sorting each file's entries within a
+        # window of this many entries to absorb local disorder
+        self.merge_by_time = merge_by_time
+        self.reorder_window = reorder_window
+        # Raise LogReadError for a file that cannot be read instead of
+        # warning and skipping it
+        self.strict_reads = False
 
     # Parse all log files in the directory and yield LogEntry objects
     def parse_all_logs(self, from_time: Optional[datetime] = None,
                       to_time: Optional[datetime] = None) -> Generator[LogEntry, None, None]:
-        log_files = self._get_log_files()
+        log_files = self.select_files(from_time, to_time)
+        from_epoch, to_epoch = self._time_bounds(from_time, to_time)
+        
+        if self.read_ahead > 0:
+            entries = self._parse_read_ahead(log_files, from_time, to_time)
+            for entry in entries:
+                if self._should_include_entry(entry, from_epoch, to_epoch):
+                    yield entry
+            return
+        
+        if self.merge_by_time:
+            for entry in self._merge_files(log_files, from_time, to_time):
+                if self._should_include_entry(entry, from_epoch, to_epoch):
+                    yield entry
+            return
         
         for file_path in log_files:
-            for entry in self._parse_single_file(file_path):
-                if self._should_include_entry(entry, from_time, to_time):
+            for entry in self._parse_file(file_path, from_time, to_time):
+                if self._should_include_entry(entry, from_epoch, to_epoch):
                     yield entry
+    
+    # k-way merge of the files' entries by timestamp, a bounded number of
+    # files at a time (see merge_sorted). Merged files are decompressed inline rather
+    # than each on its own thread, and a file that cannot be read is an
+    # error, since dropping it would silently leave entries out.
+    # Equal timestamps keep file name order, then file order.
+    def _merge_files(self, log_files: List[str], from_time: Optional[datetime],
+                     to_time: Optional[datetime]) -> Iterator[LogEntry]:
+        reader = copy.copy(self)
+        reader.decompress_threads = 0
+        reader.strict_reads = True
+        streams = [reader._parse_file(file_path, from_time, to_time) for file_path in log_files]
+        if self.reorder_window > 0:
+            streams = [reorder_entries(stream, self.reorder_window) for stream in streams]
+        return merge_sorted(streams)
+    
+    # Parse files from blocks read ahead on a background thread; entries come
+    # out in the same order as from _parse_file
+    def _parse_read_ahead(self, log_files: List[str], from_time: Optional[datetime],
+                          to_time: Optional[datetime]) -> Generator[LogEntry, None, None]:
+        event_types = self.event_types
+        for file_path, blocks in self.iter_file_blocks(log_files, from_time, to_time,
+                                                       build_indexes=True):
+            if blocks is None:
+                yield from self._parse_gzip_indexed(file_path, from_time, to_time)
+                continue
+            for line in split_text_lines(blocks):
+                entry = LogEntry.from_line(line, event_types)
+                if entry:
+                    yield entry
+    
+    def iter_file_blocks(self, log_files: List[str], from_time: Optional[datetime] = None,
+                         to_time: Optional[datetime] = None, build_indexes: bool = False
+                         ) -> Generator[Tuple[str, Optional[Iterator[bytes]]], None, None]:
+        """Yield (file path, its blocks) for each file, in order, as _read_file_blocks reads them
+
+        With read_ahead, the blocks are read on a background thread that
+        stays up to read_ahead blocks ahead and moves on to the next file
+        while the caller is still busy with this one. Blocks a caller leaves
+        unread are skipped. With build_indexes, a .gz file whose gzip index
+        is built on this read comes with None instead of its blocks, for
+        the caller to parse through _parse_gzip_indexed.
+        """
+        if self.read_ahead <= 0:
+            for file_path in log_files:
+                if build_indexes and self._builds_gzip_index(file_path):
+                    yield file_path, None
+                else:
+                    yield file_path, self._read_file_blocks(file_path, from_time, to_time)
+            return
+        
+        items = iter_in_background(partial(self._read_ahead_blocks, log_files, from_time, to_time,
+                                           build_indexes), self.read_ahead, 'read-ahead')
+        try:
+            for file_path in log_files:
+                first = next(items)
+                if first is _PARSE_INLINE:
+                    next(items)
+                    yield file_path, None
+                    continue
+                blocks = self._blocks_until_file_end(first, items)
+                yield file_path, blocks
+                for _ in blocks:
+                    pass
+        finally:
+            items.close()
+    
+    # Runs on the read-ahead thread: every file's blocks followed by _FILE_END
+    def _read_ahead_blocks(self, log_files: List[str], from_time: Optional[datetime],
+                           to_time: Optional[datetime],
+                           build_indexes: bool) -> Generator[object, None, None]:
+        for file_path in log_files:
+            if build_indexes and self._builds_gzip_index(file_path):
+                yield _PARSE_INLINE
+            else:
+                for block in self._read_file_blocks(file_path, from_time, to_time):
+                    if block:
+                        yield block
+            yield _FILE_END
+    
+    @staticmethod
+    def _blocks_until_file_end(first: bytes, items: Iterator[object]) -> Generator[bytes, None, None]:
+        block = first
+        while block is not _FILE_END:
+            yield block
+            block = next(items)
+    
+    # Whether _parse_file builds a gzip index while reading this file
+    def _builds_gzip_index(self, file_path: str) -> bool:
+        return self.gz_index and file_path.endswith('.gz') and GzipIndex.load(file_path) is None
+                    
+    # Parse a log file, reading only the parts that can hold entries within
+    # [from_time, to_time] when seeking or a gzip index allows it
+    def _parse_file(self, file_path: str, from_time: Optional[datetime] = None,
+                    to_time: Optional[datetime] = None) -> Generator[LogEntry, None, None]:
+        if self.gz_index and file_path.endswith('.gz'):
+            return self._parse_gzip_indexed(file_path, from_time, to_time)
+        
+        time_range = self._get_time_range(file_path, from_time, to_time)
+        if time_range is not None:
+            return self._parse_file_range(file_path, *time_range)
+        return self._parse_single_file(file_path)
                     
     # Get all log files in the directory
     def _get_log_files(self) -> List[str]:
@@ -28,46 +294,396 @@ class LogParser:
             print(f"Warning: '{self.log_dir}' is not a directory\n")
             return []
         
-        LOG_EXTENSIONS = {'.log', '.log.gz', '.txt'}
+        LOG_EXTENSIONS = tuple({'.log', '.txt'} | {'.log' + suffix for suffix in codec_suffixes()})
 
-        log_files = [] 
-        for filename in os.listdir(self.log_dir):
-            if any(filename.endswith(ext) for ext in LOG_EXTENSIONS):
-                file_path = os.path.join(self.log_dir, filename) 
-                log_files.append(file_path)
+        log_files = []
+        # (directory, its path relative to log_dir with '/' separators)
+        pending = [(self.log_dir, '')]
+        while pending:
+            directory, prefix = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        relative = prefix + entry.name
+                        if entry.is_dir(follow_symlinks=False):
+                            if self.recursive and not self._matches(self.exclude, entry.name, relative):
+                                pending.append((entry.path, relative + '/'))
+                        elif (entry.name.endswith(LOG_EXTENSIONS)
+                              and (not self.include or self._matches(self.include, entry.name, relative))
+                              and not self._matches(self.exclude, entry.name, relative)):
+                            log_files.append(entry.path)
+            except OSError as e:
+                print(f"Warning: Could not list directory {directory}: {e}")
                 
         return sorted(log_files)
+    
+    # Whether a glob matches a path: globs holding a '/' are matched against
+    # the path relative to log_dir, others against the name alone
+    @staticmethod
+    def _matches(globs: List[str], name: str, relative: str) -> bool:
+        return any(fnmatch(relative if '/' in glob else name, glob) for glob in globs)
+    
+    # The log files that can hold entries within [from_time, to_time]. With
+    # prune, files whose time span is known to lie outside it are skipped.
+    def select_files(self, from_time: Optional[datetime] = None,
+                     to_time: Optional[datetime] = None) -> List[str]:
+        log_files = self._get_log_files()
+        self.pruned_files = 0
+        if not self.prune or (from_time is None and to_time is None):
+            return log_files
+        
+        from_epoch, to_epoch = self._time_bounds(from_time, to_time)
+        manifest = SpanManifest.load(self.log_dir)
+        selected = []
+        for file_path in log_files:
+            span = self._file_span(file_path, manifest)
+            if span is not None and (span[0] is None
+                                     or (to_epoch is not None and span[0] > to_epoch)
+                                     or (from_epoch is not None and span[1] < from_epoch)):
+                self.pruned_files += 1
+            else:
+                selected.append(file_path)
+        return selected
+    
+    # A file's time span without reading it in full: from the span manifest,
+    # a gzip index, or the first and last lines of an ordered uncompressed
+    # file. None when it cannot be known cheaply.
+    def _file_span(self, file_path: str, manifest: SpanManifest) -> Optional[Span]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        span = manifest.get(file_path, stat)
+        if span is not None:
+            return span
+        
+        if is_compressed(file_path):
+            index = GzipIndex.load(file_path) if file_path.endswith('.gz') else None
+            if index is None:
+                return None
+            epochs = [epoch for segment in index.segments for epoch in segment[2:] if epoch is not None]
+            return (min(epochs), max(epochs)) if epochs else (None, None)
+        
+        if stat.st_size == 0:
+            return None
+        try:
+            with open(file_path, 'rb') as file_handle, \
+                    mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return find_time_span(mapped)
+        except (IOError, OSError, ValueError):
+            return None
+    
+    # Record the exact time span of every log file in the folder's span
+    # manifest, returning how many spans were computed
+    def build_span_manifest(self, force: bool = False) -> int:
+        log_files = self._get_log_files()
+        manifest = SpanManifest.load(self.log_dir)
+        manifest.retain(log_files)
+        # Spans cover entries of every event type
+        reader = LogParser(self.log_dir, decompress_threads=self.decompress_threads)
+        built = 0
+        for file_path in log_files:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            if not force and manifest.get(file_path, stat) is not None:
+                continue
+            manifest.set(file_path, stat, span_of(reader._parse_single_file(file_path)))
+            built += 1
+        manifest.save()
+        return built
+    
+    # Build sidecar block indexes for all log files, returning how many were written
+    def build_block_indexes(self, force: bool = False) -> int:
+        built = 0
+        for file_path in self._get_log_files():
+            if not force and BlockIndex.load(file_path) is not None:
+                continue
+            if self.build_block_index(file_path) is not None:
+                built += 1
+        return built
+    
+    # Read a file in full to build (and save) its block index of blocks of
+    # block_lines lines; None when the file cannot be read or changed meanwhile
+    def build_block_index(self, file_path: str, block_lines: int = BLOCK_LINES) -> Optional[BlockIndex]:
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            print(f"Warning: Could not read file {file_path}: {e}")
+            return None
+        # Blocks record entries of every event type
+        reader = LogParser(self.log_dir, decompress_threads=self.decompress_threads,
+                           block_size=self.block_size)
+        builder = BlockIndexBuilder()
+        try:
+            if is_compressed(file_path):
+                lines = split_text_lines(reader._decompressed_blocks(file_path))
+                while True:
+                    count = 0
+                    for line in islice(lines, block_lines):
+                        count += 1
+                        entry = LogEntry.from_line(line)
+                        if entry:
+                            builder.add(entry)
+                    if not count:
+                        break
+                    builder.end_block(None, None, count)
+            else:
+                for start, end in self._split_lines(file_path, block_lines):
+                    for entry in reader._parse_file_range(file_path, start, end):
+                        builder.add(entry)
+                    builder.end_block(start, end, None)
+        except (IOError, OSError, ValueError) as e:
+            print(f"Warning: Could not index file {file_path}: {e}")
+            return None
+        index = builder.build(file_path, stat)
+        if index is not None:
+            index.save(file_path)
+        return index
+    
+    # Split an uncompressed file into (start, end) byte ranges of the given
+    # number of lines each
+    @staticmethod
+    def _split_lines(file_path: str, lines: int) -> List[Tuple[int, int]]:
+        ranges = []
+        with open(file_path, 'rb') as file_handle:
+            size = os.fstat(file_handle.fileno()).st_size
+            if size == 0:
+                return ranges
+            with mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                start = 0
+                while start < size:
+                    end = start
+                    for _ in range(lines):
+                        newline = mapped.find(b'\n', end)
+                        if newline == -1:
+                            end = size
+                            break
+                        end = newline + 1
+                    ranges.append((start, end))
+                    start = end
+        return ranges
                 
     # Parse a single log file
     def _parse_single_file(self, file_path: str) -> Generator[LogEntry, None, None]:
+        if is_compressed(file_path):
+            for line in split_text_lines(self._decompressed_blocks(file_path)):
+                entry = LogEntry.from_line(line, self.event_types)
+                if entry:
+                    yield entry
+            return
+        
         try:
-            if file_path.endswith('.gz'):
-                file_handle = gzip.open(file_path, 'rt', encoding='utf-8')
-            else:
-                file_handle = open(file_path, 'r', encoding='utf-8')
-            
-            with file_handle:
+            with open(file_path, 'r', encoding='utf-8') as file_handle:
                 for line in file_handle:
-                    entry = LogEntry.from_line(line)
+                    entry = LogEntry.from_line(line, self.event_types)
                     if entry:
                         yield entry
         except (IOError, OSError) as e:
+            self._read_failed(file_path, e)
+            return
+    
+    # Decompressed blocks of a whole compressed file, decompressed on
+    # background threads as configured by decompress_threads
+    def _decompressed_blocks(self, file_path: str) -> Generator[bytes, None, None]:
+        try:
+            if file_path.endswith('.gz') and self.decompress_threads > 1:
+                yield from iter_gzip_blocks_parallel(file_path, self.decompress_threads)
+            elif self.decompress_threads > 0:
+                yield from iter_in_background(partial(read_codec_blocks, file_path, self.block_size),
+                                              DECOMPRESS_QUEUE_DEPTH, 'decompress')
+            else:
+                yield from read_codec_blocks(file_path, self.block_size)
+        except (IOError, OSError) as e:
+            self._read_failed(file_path, e)
+            return
+    
+    # Parse a .gz file through its sidecar index, skipping segments outside
+    # [from_time, to_time]. Without a current index, the whole file is read
+    # and an index is built and saved along the way.
+    def _parse_gzip_indexed(self, file_path: str, from_time: Optional[datetime] = None,
+                            to_time: Optional[datetime] = None,
+                            rebuild: bool = False) -> Generator[LogEntry, None, None]:
+        index = None if rebuild else GzipIndex.load(file_path)
+        try:
+            with open(file_path, 'rb') as file_handle:
+                if index is not None:
+                    for start, stop in index.ranges_for(from_time, to_time):
+                        for line in iter_gzip_lines(file_handle, start, stop):
+                            entry = LogEntry.from_line(line, self.event_types)
+                            if entry:
+                                yield entry
+                    return
+                
+                # The index must cover every entry, whatever the event type
+                builder = GzipIndexBuilder(self.gz_checkpoint_every)
+                event_types = self.event_types
+                for line in iter_gzip_lines(file_handle, on_member_end=builder.member_end):
+                    entry = LogEntry.from_line(line)
+                    if entry:
+                        builder.add_timestamp(entry.epoch)
+                        if event_types is None or entry.event_type in event_types:
+                            yield entry
+            
+            index = builder.build(file_path)
+            if index is not None:
+                index.save(file_path)
+        except (IOError, OSError) as e:
+            self._read_failed(file_path, e)
+            return
+
+    # Build sidecar indexes for all .gz files, returning how many were written
+    def build_gzip_indexes(self, force: bool = False) -> int:
+        built = 0
+        for file_path in self._get_log_files():
+            if not file_path.endswith('.gz'):
+                continue
+            if not force and GzipIndex.load(file_path) is not None:
+                continue
+            for _ in self._parse_gzip_indexed(file_path, rebuild=True):
+                pass
+            if GzipIndex.load(file_path) is not None:
+                built += 1
+        return built
+
+    # With seek enabled, the byte range of an uncompressed, timestamp-ordered
+    # file that can hold entries within [from_time, to_time]. None means the
+    # whole file has to be scanned.
+    def _get_time_range(self, file_path: str, from_time: Optional[datetime],
+                        to_time: Optional[datetime]) -> Optional[Tuple[int, int]]:
+        if not self.seek or (from_time is None and to_time is None) or is_compressed(file_path):
+            return None
+        try:
+            if os.path.getsize(file_path) == 0:
+                return None
+            with open(file_path, 'rb') as file_handle, \
+                    mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return find_time_range(mapped, from_time, to_time)
+        except (IOError, OSError, ValueError):
+            return None
+
+    # Split (a byte range of) an uncompressed file into newline-aligned
+    # (start, end) byte ranges
+    def _split_file(self, file_path: str, chunk_size: int, start: int = 0,
+                    end: Optional[int] = None) -> List[Tuple[int, int]]:
+        try:
+            if end is None:
+                end = os.path.getsize(file_path)
+            if end - start <= chunk_size:
+                return [(start, end)]
+
+            ranges = []
+            with open(file_path, 'rb') as file_handle, \
+                    mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                while start < end:
+                    newline = mapped.find(b'\n', start + chunk_size - 1, end)
+                    chunk_end = end if newline == -1 else newline + 1
+                    ranges.append((start, chunk_end))
+                    start = chunk_end
+            return ranges
+        except (IOError, OSError, ValueError) as e:
             print(f"Warning: Could not read file {file_path}: {e}")
+            return []
+
+    # Parse the lines of an uncompressed file that start within [start, end)
+    def _parse_file_range(self, file_path: str, start: int, end: int) -> Generator[LogEntry, None, None]:
+        if start >= end:
+            return
+        try:
+            with open(file_path, 'rb') as raw_file, \
+                    mmap.mmap(raw_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                reader = io.BufferedReader(_MappedRange(mapped, start, end), 1 << 20)
+                with io.TextIOWrapper(reader, encoding='utf-8') as file_handle:
+                    for line in file_handle:
+                        entry = LogEntry.from_line(line, self.event_types)
+                        if entry:
+                            yield entry
+        except (IOError, OSError) as e:
+            self._read_failed(file_path, e)
             return
+
+    # Read a log file as raw lines (bytes, no line endings), split like text
+    # mode would split them. The same seek ranges and gzip index segments as
+    # _parse_file are used, but no gzip index is built.
+    def _read_raw_lines(self, file_path: str, from_time: Optional[datetime] = None,
+                        to_time: Optional[datetime] = None) -> Generator[bytes, None, None]:
+        return split_raw_lines(self._read_file_blocks(file_path, from_time, to_time))
+    
+    # The (decompressed) blocks _read_raw_lines splits into lines
+    def _read_file_blocks(self, file_path: str, from_time: Optional[datetime] = None,
+                          to_time: Optional[datetime] = None) -> Generator[bytes, None, None]:
+        if is_compressed(file_path):
+            index = GzipIndex.load(file_path) if self.gz_index and file_path.endswith('.gz') else None
+            if index is None:
+                return self._decompressed_blocks(file_path)
+            return self._read_gzip_blocks(file_path, index.ranges_for(from_time, to_time))
+        
+        time_range = self._get_time_range(file_path, from_time, to_time)
+        if time_range is not None:
+            return self._read_blocks(file_path, *time_range)
+        return self._read_blocks(file_path)
+
+    # Raw lines of an uncompressed file that start within [start, end)
+    def _read_raw_range(self, file_path: str, start: int = 0,
+                        end: Optional[int] = None) -> Generator[bytes, None, None]:
+        return split_raw_lines(self._read_blocks(file_path, start, end))
+
+    def _read_blocks(self, file_path: str, start: int = 0,
+                     end: Optional[int] = None) -> Generator[bytes, None, None]:
+        try:
+            with open(file_path, 'rb') as file_handle:
+                file_handle.seek(start)
+                remaining = end - start if end is not None else None
+                while remaining is None or remaining > 0:
+                    size = self.block_size if remaining is None else min(self.block_size, remaining)
+                    block = file_handle.read(size)
+                    if not block:
+                        break
+                    if remaining is not None:
+                        remaining -= len(block)
+                    yield block
+        except (IOError, OSError) as e:
+            self._read_failed(file_path, e)
+            return
+
+    # Decompressed blocks of the given compressed ranges of a .gz file
+    def _read_gzip_blocks(self, file_path: str,
+                          ranges: List[Tuple[int, Optional[int]]]) -> Generator[bytes, None, None]:
+        try:
+            with open(file_path, 'rb') as file_handle:
+                for start, stop in ranges:
+                    yield from iter_gzip_blocks(file_handle, start, stop)
+        except (IOError, OSError) as e:
+            self._read_failed(file_path, e)
+            return
+
+    # Convert --from/--to datetimes to epoch seconds for per-entry checks
+    @staticmethod
+    def _time_bounds(from_time: Optional[datetime],
+                     to_time: Optional[datetime]) -> Tuple[Optional[Epoch], Optional[Epoch]]:
+        return (to_epoch(from_time) if from_time is not None else None,
+                to_epoch(to_time) if to_time is not None else None)
+    
+    # Report a file that could not be read
+    def _read_failed(self, file_path: str, error: Exception) -> None:
+        if self.strict_reads:
+            raise LogReadError(f"Could not read file {file_path}: {error}") from error
+        print(f"Warning: Could not read file {file_path}: {error}")
     
-    # Check if log entry falls within time range
-    def _should_include_entry(self, log_entry: LogEntry, from_time: Optional[datetime],
-                              to_time: Optional[datetime]) -> bool:
+    # Check if log entry falls within time range (bounds in epoch seconds)
+    def _should_include_entry(self, log_entry: LogEntry, from_epoch: Optional[Epoch],
+                              to_epoch: Optional[Epoch]) -> bool:
         # If no time filters specified, include all entries
-        if from_time is None and to_time is None:
+        if from_epoch is None and to_epoch is None:
             return True
         
         # Check from_time (inclusive)
-        if from_time is not None and log_entry.timestamp < from_time:
+        if from_epoch is not None and log_entry.epoch < from_epoch:
             return False
         
         # Check to_time (inclusive)
-        if to_time is not None and log_entry.timestamp > to_time:
+        if to_epoch is not None and log_entry.epoch > to_epoch:
             return False
         
         return True
\ No newline at end of file
@@ -0,0 +1,136 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import AbstractSet, Dict, List, Optional, Tuple
+from models.event_filter import EventFilter
+from models.filter_set import FilterSet
+from models.scan_result import ScanResult
+from parsers.binary_scanner import BinaryScanner
+from parsers.codec_registry import is_compressed
+from parsers.gzip_index import READ_BLOCK_SIZE
+from parsers.log_parser import LogParser
+
+# Per-process state, set up once by _init_worker
+_worker = {}
+
+def _init_worker(log_dir: str, filters: List[EventFilter], from_time: Optional[datetime],
+                 to_time: Optional[datetime], max_lines: Optional[int], gz_index: bool,
+                 gz_checkpoint_every: int, event_types: Optional[AbstractSet[str]],
+                 binary: bool = False, bucket: Optional[int] = None,
+                 decompress_threads: int = 1, block_size: int = READ_BLOCK_SIZE,
+                 stream: bool = False, spill_dir: Optional[str] = None) -> None:
+    _worker['filter_set'] = FilterSet(filters)
+    _worker['log_parser'] = LogParser(log_dir, gz_index=gz_index,
+                                      gz_checkpoint_every=gz_checkpoint_every,
+                                      event_types=event_types,
+                                      decompress_threads=decompress_threads,
+                                      block_size=block_size)
+    _worker['from_time'] = from_time
+    _worker['to_time'] = to_time
+    _worker['time_bounds'] = LogParser._time_bounds(from_time, to_time)
+    _worker['max_lines'] = max_lines
+    _worker['binary'] = binary
+    _worker['bucket'] = bucket
+    _worker['stream'] = stream
+    _worker['spill_dir'] = spill_dir
+
+# A worker's result; streamed lines are spilled to files handed back by path
+def _worker_result() -> ScanResult:
+    return ScanResult(_worker['filter_set'], _worker['max_lines'], _worker['stream'],
+                      _worker['spill_dir'], _worker['bucket'], named_spill=True)
+
+# A whole file (start and end None) or a newline-aligned byte range of one
+ScanTask = Tuple[str, Optional[int], Optional[int]]
+
+# Parse and match one task inside a worker, returning only a partial result
+def _scan_task(task: ScanTask) -> Dict:
+    log_parser = _worker['log_parser']
+    from_time, to_time = _worker['from_time'], _worker['to_time']
+    file_path, start, end = task
+    if _worker['binary']:
+        return _scan_task_binary(log_parser, file_path, start, end)
+    
+    if start is None:
+        parsed = log_parser._parse_file(file_path, from_time, to_time)
+    else:
+        parsed = log_parser._parse_file_range(file_path, start, end)
+    entries = (entry for entry in parsed
+               if log_parser._should_include_entry(entry, *_worker['time_bounds']))
+
+    with _worker_result() as scan_result:
+        scan_result.collect(entries)
+        return scan_result.export_partial()
+
+def _scan_task_binary(log_parser: LogParser, file_path: str, start: Optional[int],
+                      end: Optional[int]) -> Dict:
+    if start is None:
+        raw_lines = log_parser._read_raw_lines(file_path, _worker['from_time'], _worker['to_time'])
+    else:
+        raw_lines = log_parser._read_raw_range(file_path, start, end)
+    scanner = BinaryScanner(log_parser, _worker['filter_set'])
+
+    with _worker_result() as scan_result:
+        scanner.scan_lines(raw_lines, scan_result, *_worker['time_bounds'])
+        return scan_result.export_partial()
+
+class ParallelScanner:
+    """Scans log files on a process pool
+
+    Each worker parses and matches whole files, or newline-aligned chunks of
+    uncompressed files larger than chunk_size, and sends back counts plus the
+    output lines it kept; when the result streams, the lines are spilled to
+    files in its spill_dir and sent back by path. Partials are merged in file and chunk order, so the
+    result is the same as a serial scan. With binary=True, workers scan
+    with a BinaryScanner.
+    """
+
+    DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, log_parser: LogParser, filter_set: FilterSet, workers: int,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, binary: bool = False):
+        self.log_parser = log_parser
+        self.filter_set = filter_set
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.binary = binary
+
+    # Break the file list into tasks, narrowing ordered files to the time
+    # window when seeking and chunking large uncompressed files
+    def _plan_tasks(self, log_files: List[str], from_time: Optional[datetime],
+                    to_time: Optional[datetime]) -> List[ScanTask]:
+        tasks = []
+        for file_path in log_files:
+            time_range = self.log_parser._get_time_range(file_path, from_time, to_time)
+            if time_range is not None:
+                start, end = time_range
+                if start < end:
+                    tasks.extend((file_path, chunk_start, chunk_end) for chunk_start, chunk_end
+                                 in self.log_parser._split_file(file_path, self.chunk_size or end,
+                                                                start, end))
+            elif is_compressed(file_path) or not self.chunk_size:
+                tasks.append((file_path, None, None))
+            else:
+                tasks.extend((file_path, start, end) for start, end
+                             in self.log_parser._split_file(file_path, self.chunk_size))
+        return tasks
+
+    def scan(self, scan_result: ScanResult, from_time: Optional[datetime] = None,
+             to_time: Optional[datetime] = None) -> None:
+        log_files = self.log_parser.select_files(from_time, to_time)
+        if not log_files:
+            return
+
+        tasks = self._plan_tasks(log_files, from_time, to_time)
+        if not tasks:
+            return
+
+        init_args = (self.log_parser.log_dir, self.filter_set.filters,
+                     from_time, to_time, scan_result.max_lines,
+                     self.log_parser.gz_index, self.log_parser.gz_checkpoint_every,
+                     self.log_parser.event_types, self.binary,
+                     scan_result.histogram.width if scan_result.histogram is not None else None,
+                     self.log_parser.decompress_threads, self.log_parser.block_size,
+                     scan_result.stream, scan_result.spill_dir)
+        workers = min(self.workers, len(tasks))
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=init_args) as pool:
+            for partial in pool.map(_scan_task, tasks):
+                scan_result.merge_partial(partial)
@@ -0,0 +1,542 @@
+from datetime import datetime
+from itertools import accumulate
+from typing import AbstractSet, Dict, Generator, Iterable, List, Optional, Set, Tuple
+import hashlib
+import json
+import mmap
+import os
+from models.filter_set import FilterSet
+from models.log_entry import LogEntry
+from models.scan_result import ScanResult
+from models.sketches import FilterSketch, sketch_from_json, sketch_to_json
+from models.timestamp import Epoch
+from parsers.codec_registry import is_compressed
+from parsers.log_parser import LogParser
+
+CACHE_VERSION = 4
+
+# Bytes at the start of a file whose hash tells an appended file from a
+# rewritten one
+HEAD_SIZE = 4096
+
+class FilePartial:
+    """What one file contributes to a scan result, for any --from/--to
+
+    Entry totals and every filter's matches are kept per timestamp. Filters
+    that print lines keep, in order, the timestamp of each match and either
+    its byte offset in the (decompressed) file, for every match when
+    max_lines is None, or its output line, for the file's first max_lines
+    matches; --top/--distinct filters keep the sketch of all their matches,
+    which only applies when the window covers the whole partial. Applying
+    the partial with a time window gives the same counts as scanning the
+    file with that window, and the same lines as long as the window does
+    not want more than were kept; lines kept by offset are read back from
+    the file by CachedScanner.
+    """
+
+    def __init__(self, filter_set: FilterSet, max_lines: Optional[int] = None):
+        self.entries: Dict[Epoch, int] = {}
+        self.counts: List[Dict[Epoch, int]] = [{} for _ in filter_set.filters]
+        self.max_lines = max_lines
+        keeps_lines = [not (filter_obj.count or filter_obj.aggregated)
+                       for filter_obj in filter_set.filters]
+        # Offsets are kept instead of lines when every match is kept
+        self.by_offset = max_lines is None
+        self.lines: List[Optional[List]] = [
+            [] if keeps else None for keeps in keeps_lines]
+        self.line_epochs: List[Optional[List[Epoch]]] = [
+            [] if keeps else None for keeps in keeps_lines]
+        self.sketches: List[Optional[FilterSketch]] = [
+            FilterSketch(filter_obj) if filter_obj.aggregated else None
+            for filter_obj in filter_set.filters]
+
+    # Add (offset, entry) pairs, offsets being where the entries' lines start
+    def collect(self, located_entries: Iterable[Tuple[int, LogEntry]], filter_set: FilterSet) -> None:
+        match, max_lines, by_offset = filter_set.match, self.max_lines, self.by_offset
+        entries, counts, lines, line_epochs = self.entries, self.counts, self.lines, self.line_epochs
+        sketches = self.sketches
+        # Lines are only kept while they are all of the filter's matches so
+        # far, so the kept lines are always the file's first matches
+        matched = [sum(filter_counts.values()) for filter_counts in counts]
+        for offset, entry in located_entries:
+            epoch = entry.epoch
+            entries[epoch] = entries.get(epoch, 0) + 1
+            line = None
+            for index in match(entry):
+                filter_counts = counts[index]
+                filter_counts[epoch] = filter_counts.get(epoch, 0) + 1
+                filter_lines = lines[index]
+                if filter_lines is not None:
+                    if by_offset:
+                        filter_lines.append(offset)
+                        line_epochs[index].append(epoch)
+                    elif len(filter_lines) == matched[index] and (
+                            max_lines is None or len(filter_lines) < max_lines):
+                        if line is None:
+                            line = entry.format_line()
+                        filter_lines.append(line)
+                        line_epochs[index].append(epoch)
+                else:
+                    sketch = sketches[index]
+                    if sketch is not None:
+                        sketch.add_message(entry.message)
+                matched[index] += 1
+
+    # (matches, kept lines) of a filter within [from_epoch, to_epoch]
+    def window_lines(self, index: int, from_epoch: Optional[Epoch] = None,
+                     to_epoch: Optional[Epoch] = None) -> Tuple[int, int]:
+        def within(epoch: Epoch) -> bool:
+            return ((from_epoch is None or epoch >= from_epoch)
+                    and (to_epoch is None or epoch <= to_epoch))
+
+        matches = sum(count for epoch, count in self.counts[index].items() if within(epoch))
+        kept = sum(1 for epoch in self.line_epochs[index] if within(epoch))
+        return matches, kept
+
+    # Whether every entry of this partial lies within [from_epoch, to_epoch]
+    def covered_by(self, from_epoch: Optional[Epoch] = None, to_epoch: Optional[Epoch] = None) -> bool:
+        if not self.entries:
+            return True
+        return ((from_epoch is None or min(self.entries) >= from_epoch)
+                and (to_epoch is None or max(self.entries) <= to_epoch))
+
+    # Whether any entry of this partial may lie within [from_epoch, to_epoch]
+    def overlaps(self, from_epoch: Optional[Epoch] = None, to_epoch: Optional[Epoch] = None) -> bool:
+        if not self.entries:
+            return False
+        return ((from_epoch is None or max(self.entries) >= from_epoch)
+                and (to_epoch is None or min(self.entries) <= to_epoch))
+
+    # Merge this partial's sketches into scan_result's; only valid when the
+    # time window covers the whole partial
+    def apply_sketches(self, scan_result: ScanResult) -> None:
+        for sketch, own in zip(scan_result.sketches, self.sketches):
+            if sketch is not None and own is not None:
+                sketch.merge(own.export())
+    
+    # Add this partial's entries within [from_epoch, to_epoch] to scan_result,
+    # except the kept lines of the filters in reread. Lines kept by offset
+    # are returned instead, as (offset, filter index) pairs in file order.
+    def apply(self, scan_result: ScanResult, from_epoch: Optional[Epoch] = None,
+              to_epoch: Optional[Epoch] = None,
+              reread: AbstractSet[int] = frozenset()) -> List[Tuple[int, int]]:
+        def within(epoch: Epoch) -> bool:
+            return ((from_epoch is None or epoch >= from_epoch)
+                    and (to_epoch is None or epoch <= to_epoch))
+
+        scan_result.total_entries += sum(count for epoch, count in self.entries.items()
+                                         if within(epoch))
+        with_epochs = scan_result.histogram is not None
+        located = []
+        for index, counts in enumerate(self.counts):
+            if with_epochs:
+                for epoch, count in counts.items():
+                    if within(epoch):
+                        scan_result.add_count(index, count, epoch)
+            else:
+                scan_result.counts[index] += sum(count for epoch, count in counts.items()
+                                                 if within(epoch))
+            if self.lines[index] is None or index in reread:
+                continue
+            wanted = scan_result.lines_wanted(index)
+            for epoch, line in zip(self.line_epochs[index], self.lines[index]):
+                if wanted == 0:
+                    break
+                if within(epoch):
+                    if self.by_offset:
+                        located.append((line, index))
+                    else:
+                        scan_result.add_line(index, line)
+                    if wanted is not None:
+                        wanted -= 1
+        located.sort()
+        return located
+
+    def to_json(self) -> Dict:
+        # Match counts of filters keeping every match by offset follow
+        # from their line timestamps, so they are not stored twice
+        derived = [self.by_offset and lines is not None for lines in self.lines]
+        return {
+            'by_offset': self.by_offset,
+            'entries': _pack_counts(self.entries),
+            'counts': [None if skip else _pack_counts(counts)
+                       for skip, counts in zip(derived, self.counts)],
+            'lines': [_pack(lines) if self.by_offset and lines is not None else lines
+                      for lines in self.lines],
+            'line_epochs': [_pack(epochs) if epochs is not None else None
+                            for epochs in self.line_epochs],
+            'sketches': [sketch_to_json(sketch.export()) if sketch is not None else None
+                         for sketch in self.sketches],
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict, filter_set: FilterSet,
+                  max_lines: Optional[int] = None) -> 'FilePartial':
+        partial = cls(filter_set, None if data['by_offset'] else max_lines)
+        partial.by_offset = data['by_offset']
+        partial.entries = _unpack_counts(data['entries'])
+        partial.line_epochs = [_unpack(epochs) if epochs is not None else None
+                               for epochs in data['line_epochs']]
+        partial.lines = [_unpack(lines) if partial.by_offset and lines is not None else lines
+                         for lines in data['lines']]
+        partial.counts = [_unpack_counts(counts) if counts is not None
+                          else _count_epochs(partial.line_epochs[index])
+                          for index, counts in enumerate(data['counts'])]
+        for sketch, exported in zip(partial.sketches, data['sketches']):
+            if sketch is not None:
+                sketch.merge(sketch_from_json(exported))
+        return partial
+
+# Integers (offsets, whole-second timestamps) are stored as differences from
+# the one before, which keeps checkpoints a fraction of the size of the log;
+# a list holding fractional timestamps is stored as it is
+def _pack(values: List[Epoch]) -> Dict:
+    if any(isinstance(value, float) for value in values):
+        return {'values': values}
+    return {'deltas': [value - previous for previous, value in zip([0] + values, values)]}
+
+def _unpack(packed: Dict) -> List[Epoch]:
+    if 'values' in packed:
+        return packed['values']
+    return list(accumulate(packed['deltas']))
+
+def _pack_counts(counts: Dict[Epoch, int]) -> Dict:
+    epochs = sorted(counts)
+    return {'epochs': _pack(epochs), 'counts': [counts[epoch] for epoch in epochs]}
+
+def _unpack_counts(packed: Dict) -> Dict[Epoch, int]:
+    return dict(zip(_unpack(packed['epochs']), packed['counts']))
+
+def _count_epochs(epochs: List[Epoch]) -> Dict[Epoch, int]:
+    counts: Dict[Epoch, int] = {}
+    for epoch in epochs:
+        counts[epoch] = counts.get(epoch, 0) + 1
+    return counts
+
+# (offset, raw line) for the lines of a stream of blocks starting at offset
+# base, split where split_raw_lines splits them
+def _located_raw_lines(blocks: Iterable[bytes], base: int = 0) -> Generator[Tuple[int, bytes], None, None]:
+    pending = b''
+    for block in blocks:
+        if b'\n' not in block:
+            pending += block
+            continue
+        data = pending + block
+        end = data.rfind(b'\n') + 1
+        yield from _split_located(data[:end - 1], base)
+        base += end
+        pending = data[end:]
+    if pending:
+        yield from _split_located(pending, base)
+
+def _split_located(data: bytes, base: int) -> Generator[Tuple[int, bytes], None, None]:
+    start = 0
+    for line in data.split(b'\n'):
+        if b'\r' in line:
+            offset = start
+            for piece in line.split(b'\r'):
+                yield base + offset, piece
+                offset += len(piece) + 1
+        else:
+            yield base + start, line
+        start += len(line) + 1
+
+# (offset, entry) for the log entries of a stream of blocks starting at base
+def located_entries(blocks: Iterable[bytes], base: int = 0,
+                    event_types: Optional[AbstractSet[str]] = None
+                    ) -> Generator[Tuple[int, LogEntry], None, None]:
+    for offset, raw_line in _located_raw_lines(blocks, base):
+        entry = LogEntry.from_line(raw_line.decode('utf-8'), event_types)
+        if entry:
+            yield offset, entry
+
+# Hash of the first size bytes of a file
+def _head_digest(file_path: str, size: int) -> str:
+    with open(file_path, 'rb') as file_handle:
+        return hashlib.sha256(file_handle.read(size)).hexdigest()
+
+# Offset just past the last '\n' in [start, end) of a file, or start if none
+def _last_line_end(file_path: str, start: int, end: int) -> int:
+    if end <= start:
+        return start
+    with open(file_path, 'rb') as file_handle, \
+            mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        newline = mapped.rfind(b'\n', start, min(end, len(mapped)))
+    return start if newline == -1 else newline + 1
+
+class ScanCache:
+    """Checkpoints of earlier scans of a log directory, one JSON file per log file
+
+    A checkpoint is keyed by the filter set's fingerprint, the log directory
+    and the file's device and inode, so a renamed file keeps its checkpoint.
+    It records the size, mtime and head hash the file had, how many bytes of
+    complete lines were processed, and the FilePartial of those lines.
+    """
+
+    def __init__(self, cache_dir: str, filter_set: FilterSet, log_dir: str):
+        self.cache_dir = cache_dir
+        self.filter_set = filter_set
+        self.fingerprint = filter_set.fingerprint
+        key = f"{self.fingerprint}:{os.path.realpath(log_dir)}"
+        self._prefix = hashlib.sha256(key.encode('utf-8')).hexdigest()[:24]
+
+    def _entry_path(self, stat: os.stat_result) -> str:
+        return os.path.join(self.cache_dir, f"{self._prefix}-{stat.st_dev}-{stat.st_ino}.json")
+
+    def load(self, stat: os.stat_result) -> Optional[Dict]:
+        try:
+            with open(self._entry_path(stat), 'r', encoding='utf-8') as cache_file:
+                data = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get('version') != CACHE_VERSION or data.get('fingerprint') != self.fingerprint:
+            return None
+        return data
+
+    def save(self, stat: os.stat_result, data: Dict) -> bool:
+        data = dict(data, version=CACHE_VERSION, fingerprint=self.fingerprint)
+        entry_path = self._entry_path(stat)
+        temp_path = entry_path + '.tmp'
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # dumps uses the C encoder, dump does not
+            serialized = json.dumps(data)
+            with open(temp_path, 'w', encoding='utf-8') as cache_file:
+                cache_file.write(serialized)
+            os.replace(temp_path, entry_path)
+        except (IOError, OSError):
+            return False
+        return True
+
+    # Remove this directory's checkpoints for files not in keep (deleted or
+    # rotated away), returning how many were removed
+    def prune(self, keep: Set[str]) -> int:
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return 0
+        removed = 0
+        for name in names:
+            entry_path = os.path.join(self.cache_dir, name)
+            if name.startswith(self._prefix + '-') and entry_path not in keep:
+                try:
+                    os.unlink(entry_path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+class CachedScanner:
+    """Scans log files, reading only what changed since the last cached scan
+
+    Unchanged files are not read at all, and files that only grew are read
+    from the end of the last complete line processed before. A checkpoint is
+    discarded, and the file scanned from the start, when the file changed
+    without growing or its head no longer hashes the same (truncated and
+    rewritten, or rotated in place). Compressed files are reused only while
+    size and mtime are unchanged. The time window is applied to the cached
+    partials, so changing --from/--to needs no re-read, except to rebuild
+    the --top/--distinct sketches of files the window cuts into, or to find
+    more lines than the checkpoints keep (the first --max-lines per filter).
+    Without --max-lines, checkpoints keep the offsets of the matching lines,
+    which are read back without parsing or matching the rest of the file;
+    a compressed file is decompressed again for them.
+    """
+
+    def __init__(self, log_parser: LogParser, filter_set: FilterSet, cache_dir: str):
+        self.log_parser = log_parser
+        self.filter_set = filter_set
+        self.cache = ScanCache(cache_dir, filter_set, log_parser.log_dir)
+        self.aggregated = any(filter_obj.aggregated for filter_obj in filter_set.filters)
+
+    def scan(self, scan_result: ScanResult, from_time: Optional[datetime] = None,
+             to_time: Optional[datetime] = None) -> None:
+        from_epoch, to_epoch = self.log_parser._time_bounds(from_time, to_time)
+        seen = set()
+        for file_path in self.log_parser._get_log_files():
+            try:
+                stat = os.stat(file_path)
+            except OSError as e:
+                print(f"Warning: Could not read file {file_path}: {e}")
+                continue
+            seen.add(self.cache._entry_path(stat))
+            partials = self._scan_file(file_path, stat, scan_result.max_lines)
+            reread = self._lines_to_reread(partials, scan_result, from_epoch, to_epoch)
+            located = []
+            for partial in partials:
+                located += partial.apply(scan_result, from_epoch, to_epoch, reread)
+            if located:
+                self._add_located_lines(file_path, located, scan_result)
+            if reread:
+                self._scan_lines(file_path, scan_result, reread, from_epoch, to_epoch)
+            if not self.aggregated:
+                continue
+            if all(partial.covered_by(from_epoch, to_epoch) for partial in partials):
+                for partial in partials:
+                    partial.apply_sketches(scan_result)
+            elif any(partial.overlaps(from_epoch, to_epoch) for partial in partials):
+                self._scan_sketches(file_path, scan_result, from_epoch, to_epoch)
+        self.cache.prune(seen)
+    
+    # Filters whose lines in the window the result wants more of than the
+    # partials kept; for these the file is read again
+    def _lines_to_reread(self, partials: List[FilePartial], scan_result: ScanResult,
+                         from_epoch: Optional[Epoch], to_epoch: Optional[Epoch]) -> Set[int]:
+        reread = set()
+        for index in range(len(self.filter_set)):
+            wanted = scan_result.lines_wanted(index)
+            if wanted == 0:
+                continue
+            matches = kept = 0
+            for partial in partials:
+                partial_matches, partial_kept = partial.window_lines(index, from_epoch, to_epoch)
+                matches += partial_matches
+                kept += partial_kept
+            if kept < matches and (wanted is None or wanted > kept):
+                reread.add(index)
+        return reread
+    
+    # Add the lines of (offset, filter index) pairs, in file order, reading
+    # each line back from the file once
+    def _add_located_lines(self, file_path: str, located: List[Tuple[int, int]],
+                           scan_result: ScanResult) -> None:
+        event_types = self.log_parser.event_types
+        offsets = sorted({offset for offset, _ in located})
+        position = 0
+        for offset, raw_line in self._raw_lines_at(file_path, offsets):
+            entry = LogEntry.from_line(raw_line.decode('utf-8', 'replace'), event_types)
+            line = entry.format_line() if entry is not None else None
+            while position < len(located) and located[position][0] == offset:
+                if line is not None:
+                    scan_result.add_line(located[position][1], line)
+                position += 1
+    
+    # (offset, raw line) of the lines starting at the given sorted offsets:
+    # looked up directly in an uncompressed file, found by decompressing a
+    # compressed one again
+    def _raw_lines_at(self, file_path: str,
+                      offsets: List[int]) -> Generator[Tuple[int, bytes], None, None]:
+        if is_compressed(file_path):
+            wanted = iter(offsets)
+            next_offset = next(wanted, None)
+            for offset, raw_line in _located_raw_lines(self.log_parser._decompressed_blocks(file_path)):
+                if next_offset is None:
+                    return
+                if offset == next_offset:
+                    yield offset, raw_line
+                    next_offset = next(wanted, None)
+            return
+        try:
+            with open(file_path, 'rb') as file_handle, \
+                    mmap.mmap(file_handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                size = len(mapped)
+                for offset in offsets:
+                    end = mapped.find(b'\n', offset)
+                    end = size if end == -1 else end
+                    carriage_return = mapped.find(b'\r', offset, end)
+                    yield offset, mapped[offset:end if carriage_return == -1 else carriage_return]
+        except (IOError, OSError, ValueError) as e:
+            self.log_parser._read_failed(file_path, e)
+    
+    def _scan_lines(self, file_path: str, scan_result: ScanResult, indexes: Set[int],
+                    from_epoch: Optional[Epoch], to_epoch: Optional[Epoch]) -> None:
+        match, wants_lines = self.filter_set.match, scan_result.wants_lines
+        include = self.log_parser._should_include_entry
+        for entry in self.log_parser._parse_single_file(file_path):
+            if not include(entry, from_epoch, to_epoch):
+                continue
+            line = None
+            for index in match(entry):
+                if index in indexes and wants_lines(index):
+                    if line is None:
+                        line = entry.format_line()
+                    scan_result.add_line(index, line)
+            if line is not None and not any(wants_lines(index) for index in indexes):
+                return
+    
+    # A sketch cannot be cut to a time window, so for a file the window cuts
+    # into (holding entries both inside and outside it), the --top/--distinct
+    # sketches are built from its entries again
+    def _scan_sketches(self, file_path: str, scan_result: ScanResult,
+                       from_epoch: Optional[Epoch], to_epoch: Optional[Epoch]) -> None:
+        match, sketches = self.filter_set.match, scan_result.sketches
+        include = self.log_parser._should_include_entry
+        for entry in self.log_parser._parse_single_file(file_path):
+            if not include(entry, from_epoch, to_epoch):
+                continue
+            for index in match(entry):
+                sketch = sketches[index]
+                if sketch is not None:
+                    sketch.add_message(entry.message)
+
+    # Whether a checkpoint still describes the start of the file
+    def _is_valid(self, checkpoint: Optional[Dict], file_path: str, stat: os.stat_result) -> bool:
+        if checkpoint is None:
+            return False
+        if checkpoint['size'] == stat.st_size and checkpoint['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        # Only growth is an append; anything else is a rewrite or truncation.
+        # With no complete line hashed, a rewrite cannot be told apart.
+        if (is_compressed(file_path) or stat.st_size <= checkpoint['size']
+                or checkpoint['head_size'] == 0):
+            return False
+        try:
+            return _head_digest(file_path, checkpoint['head_size']) == checkpoint['head']
+        except (IOError, OSError):
+            return False
+
+    # The partials of a file: everything up to its last complete line (from
+    # the cache where possible) and, for a growing file, its unfinished tail.
+    # They keep up to max_lines lines per filter.
+    def _scan_file(self, file_path: str, stat: os.stat_result,
+                   max_lines: Optional[int] = None) -> List[FilePartial]:
+        log_parser, filter_set = self.log_parser, self.filter_set
+        checkpoint = self.cache.load(stat)
+        # Lines kept by offset serve any --max-lines; lines kept for one
+        # --max-lines cannot serve a run without it
+        if (checkpoint is not None and max_lines is None
+                and not checkpoint['partial']['by_offset']):
+            checkpoint = None
+        if self._is_valid(checkpoint, file_path, stat):
+            partial = FilePartial.from_json(checkpoint['partial'], filter_set, max_lines)
+            offset = checkpoint['offset']
+        else:
+            checkpoint = None
+            partial = FilePartial(filter_set, max_lines)
+            offset = 0
+
+        event_types = log_parser.event_types
+        if is_compressed(file_path):
+            if checkpoint is not None:
+                return [partial]
+            partial.collect(located_entries(log_parser._decompressed_blocks(file_path),
+                                            event_types=event_types), filter_set)
+            end = stat.st_size
+            tail = None
+        else:
+            try:
+                end = _last_line_end(file_path, offset, stat.st_size)
+            except (IOError, OSError, ValueError) as e:
+                print(f"Warning: Could not read file {file_path}: {e}")
+                return [partial]
+            if end > offset:
+                partial.collect(located_entries(log_parser._read_blocks(file_path, offset, end),
+                                                offset, event_types), filter_set)
+            tail = None
+            if stat.st_size > end:
+                tail = FilePartial(filter_set, None if partial.by_offset else max_lines)
+                tail.collect(located_entries(log_parser._read_blocks(file_path, end, stat.st_size),
+                                             end, event_types), filter_set)
+
+        if checkpoint is None or end != offset or checkpoint['size'] != stat.st_size:
+            head_size = min(HEAD_SIZE, end)
+            self.cache.save(stat, {
+                'path': file_path,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'offset': end,
+                'head_size': head_size,
+                'head': _head_digest(file_path, head_size),
+                'partial': partial.to_json(),
+            })
+        return [partial] if tail is None else [partial, tail]
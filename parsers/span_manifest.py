@@ -0,0 +1,84 @@
+from typing import Dict, Iterable, Optional, Tuple
+import json
+import os
+from models.log_entry import LogEntry
+from models.timestamp import Epoch
+
+MANIFEST_VERSION = 1
+
+# Written in the log folder by `main.py index --spans`
+MANIFEST_NAME = '.log-spans.json'
+
+# (earliest, latest) entry timestamp of a file; (None, None) when it holds no entries
+Span = Tuple[Optional[Epoch], Optional[Epoch]]
+
+def manifest_path_for(log_dir: str) -> str:
+    return os.path.join(log_dir, MANIFEST_NAME)
+
+# Exact span of a stream of entries
+def span_of(entries: Iterable[LogEntry]) -> Span:
+    earliest = latest = None
+    for entry in entries:
+        epoch = entry.epoch
+        if earliest is None or epoch < earliest:
+            earliest = epoch
+        if latest is None or epoch > latest:
+            latest = epoch
+    return earliest, latest
+
+class SpanManifest:
+    """Cached time spans of the log files in a folder
+
+    Each file's span is recorded with its size and mtime and only used while
+    both are unchanged. Spans come from a full read, so unlike the first and
+    last lines they are exact for files that are out of order, and they let
+    compressed files be pruned without decompressing them.
+    """
+
+    def __init__(self, log_dir: str, spans: Optional[Dict[str, list]] = None):
+        self.log_dir = log_dir
+        # Path relative to log_dir -> [size, mtime_ns, earliest, latest]
+        self.spans = spans if spans is not None else {}
+
+    @classmethod
+    def load(cls, log_dir: str) -> 'SpanManifest':
+        try:
+            with open(manifest_path_for(log_dir), 'r', encoding='utf-8') as manifest_file:
+                data = json.load(manifest_file)
+            if data.get('version') == MANIFEST_VERSION and isinstance(data.get('spans'), dict):
+                return cls(log_dir, data['spans'])
+        except (IOError, OSError, ValueError):
+            pass
+        return cls(log_dir)
+
+    def save(self) -> bool:
+        data = {'version': MANIFEST_VERSION, 'spans': self.spans}
+        temp_path = manifest_path_for(self.log_dir) + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as manifest_file:
+                json.dump(data, manifest_file)
+            os.replace(temp_path, manifest_path_for(self.log_dir))
+        except (IOError, OSError):
+            return False
+        return True
+
+    def _key(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.log_dir).replace(os.sep, '/')
+
+    # The recorded span of a file, None when missing or stale
+    def get(self, file_path: str, stat: os.stat_result) -> Optional[Span]:
+        record = self.spans.get(self._key(file_path))
+        if record is None or len(record) != 4:
+            return None
+        size, mtime_ns, earliest, latest = record
+        if size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+            return None
+        return earliest, latest
+
+    def set(self, file_path: str, stat: os.stat_result, span: Span) -> None:
+        self.spans[self._key(file_path)] = [stat.st_size, stat.st_mtime_ns, *span]
+
+    # Forget files that are gone, given the paths still present
+    def retain(self, file_paths: Iterable[str]) -> None:
+        keep = {self._key(file_path) for file_path in file_paths}
+        self.spans = {key: record for key, record in self.spans.items() if key in keep}
@@ -0,0 +1,168 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+import mmap
+from models.log_entry import LogEntry
+from models.timestamp import Epoch, parse_timestamp, to_epoch
+
+# Evenly spaced probes used to check that a file is in timestamp order
+ORDER_PROBES = 16
+
+# Give up on a probe after this many unparsable lines in a row
+MAX_SKIPPED_LINES = 64
+
+class UnsuitableFile(Exception):
+    """Raised when a file's layout does not allow seeking by timestamp"""
+
+# Offset of the first line that starts at or after pos
+def _next_line_start(mapped: mmap.mmap, pos: int) -> int:
+    if pos <= 0:
+        return 0
+    newline = mapped.find(b'\n', pos - 1)
+    return len(mapped) if newline == -1 else newline + 1
+
+# Timestamp of the first valid log line starting at or after pos, or None past the end
+def _first_timestamp_from(mapped: mmap.mmap, pos: int) -> Optional[Epoch]:
+    start = _next_line_start(mapped, pos)
+    size = len(mapped)
+    for _ in range(MAX_SKIPPED_LINES):
+        if start >= size:
+            return None
+        newline = mapped.find(b'\n', start)
+        end = size if newline == -1 else newline + 1
+        raw_line = mapped[start:end]
+        # Text mode also splits on a bare '\r', which a byte seek cannot see
+        if b'\r' in raw_line.rstrip(b'\r\n'):
+            raise UnsuitableFile("line contains a bare carriage return")
+        try:
+            entry = LogEntry.from_line(raw_line.decode('utf-8'))
+        except UnicodeDecodeError:
+            entry = None
+        if entry:
+            return entry.epoch
+        start = end
+    raise UnsuitableFile("too many unparsable lines")
+
+# Smallest line start whose timestamp satisfies the predicate, assuming order
+def _bisect(mapped: mmap.mmap, predicate) -> int:
+    low, high = 0, len(mapped)
+    while low < high:
+        middle = (low + high) // 2
+        timestamp = _first_timestamp_from(mapped, middle)
+        if timestamp is None or predicate(timestamp):
+            high = middle
+        else:
+            low = middle + 1
+    return _next_line_start(mapped, low)
+
+# Check sampled timestamps across the file are non-decreasing
+def _looks_ordered(mapped: mmap.mmap) -> bool:
+    size = len(mapped)
+    previous = None
+    for probe in range(ORDER_PROBES + 1):
+        timestamp = _first_timestamp_from(mapped, size * probe // ORDER_PROBES)
+        if timestamp is None:
+            continue
+        if previous is not None and timestamp < previous:
+            return False
+        previous = timestamp
+    return True
+
+# Bytes at each end of a file (or of a seeked range) whose lines are checked
+# for its time span; enough to cover lines written slightly out of order
+SPAN_PROBE_BYTES = 64 * 1024
+
+# Timestamps of the valid log lines that start within [start, end)
+def _timestamps_between(mapped: mmap.mmap, start: int, end: int) -> List[Epoch]:
+    timestamps = []
+    for raw_line in mapped[_next_line_start(mapped, start):end].split(b'\n'):
+        try:
+            entry = LogEntry.from_line(raw_line.decode('utf-8'))
+        except UnicodeDecodeError:
+            entry = None
+        if entry:
+            timestamps.append(entry.epoch)
+    return timestamps
+
+# Bytes of a seeked range whose timestamps are checked at a time
+ORDER_CHECK_BYTES = 1024 * 1024
+
+# Whether the timestamps of the lines within [start, end) never go back.
+# Lines are split as text mode splits them, and only their first word is
+# decoded, skipping it when it repeats the previous line's: far cheaper
+# than parsing the range. A line that is not a log entry can only make the
+# range look out of order, never hide disorder.
+def _range_ordered(mapped: mmap.mmap, start: int, end: int) -> bool:
+    previous = None
+    previous_text = None
+    while start < end:
+        newline = mapped.find(b'\n', min(start + ORDER_CHECK_BYTES, end) - 1, end)
+        chunk_end = end if newline == -1 else newline + 1
+        for raw_line in mapped[start:chunk_end].splitlines():
+            words = raw_line.split(None, 1)
+            if not words or words[0] == previous_text:
+                continue
+            try:
+                epoch = parse_timestamp(words[0].decode('ascii'))
+            except (UnicodeDecodeError, ValueError):
+                continue
+            if previous is not None and epoch < previous:
+                return False
+            previous = epoch
+            previous_text = words[0]
+        start = chunk_end
+    return True
+
+def find_time_range(mapped: mmap.mmap, from_time: Optional[datetime],
+                    to_time: Optional[datetime]) -> Optional[Tuple[int, int]]:
+    """Byte range of the lines within [from_time, to_time] of an ordered file
+
+    Binary-searches the file by byte offset for the first line at or after
+    from_time and the first line after to_time. Returns None when the file
+    does not look timestamp-ordered, so the caller can fall back to a full
+    scan: when sampled timestamps go back, when a line within
+    SPAN_PROBE_BYTES outside either end of the range belongs in the window,
+    or when a timestamp goes back inside the range. The range is checked
+    before any of it is parsed, so every scanner that seeks gives the same
+    entries, in the same order, as a full scan of a file found out of order.
+    """
+    try:
+        if not _looks_ordered(mapped):
+            return None
+        start, end = 0, len(mapped)
+        if from_time is not None:
+            lower = to_epoch(from_time)
+            start = _bisect(mapped, lambda epoch: epoch >= lower)
+            if any(epoch >= lower for epoch in
+                   _timestamps_between(mapped, max(0, start - SPAN_PROBE_BYTES), start)):
+                return None
+        if to_time is not None:
+            upper = to_epoch(to_time)
+            end = _bisect(mapped, lambda epoch: epoch > upper)
+            if any(epoch <= upper for epoch in
+                   _timestamps_between(mapped, end, min(len(mapped), end + SPAN_PROBE_BYTES))):
+                return None
+        end = max(start, end)
+        if not _range_ordered(mapped, start, end):
+            return None
+    except (UnsuitableFile, TypeError):
+        return None
+    return start, end
+
+def find_time_span(mapped: mmap.mmap) -> Optional[Tuple[Epoch, Epoch]]:
+    """Earliest and latest timestamp of an ordered file, from its first and last lines
+
+    Only the first and last SPAN_PROBE_BYTES are read, so lines slightly out
+    of order at either end are still covered. Returns None when the file
+    does not look timestamp-ordered or holds no valid line near its ends.
+    """
+    try:
+        if not _looks_ordered(mapped):
+            return None
+    except UnsuitableFile:
+        return None
+    size = len(mapped)
+    head = _timestamps_between(mapped, 0, min(size, SPAN_PROBE_BYTES))
+    tail = _timestamps_between(mapped, max(0, size - SPAN_PROBE_BYTES), size)
+    if not head or not tail:
+        return None
+    return min(head), max(tail)
@@ -0,0 +1,142 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import io
+import json
+import os
+import socketserver
+import stat
+import threading
+from analyzer import AnalysisResult
+from cli import CLI
+from models.event_filter import EventFilter
+from models.filter_set import FilterSet
+from parsers.log_index import LogIndex
+from writers import WRITERS, TextWriter
+
+# Content-Type of each output format
+CONTENT_TYPES = {
+    'text': 'text/plain; charset=utf-8',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+class QueryError(ValueError):
+    """A query that cannot be answered, reported to the client as 400 Bad Request"""
+
+# The filters of a query: events-file lines from the request body and from
+# filter parameters
+def parse_filters(params: Dict[str, List[str]], body: str) -> FilterSet:
+    filters = []
+    for line in body.splitlines() + params.get('filter', []):
+        if not line.strip() or line.strip().startswith('#'):
+            continue
+        event_filter = EventFilter.from_line(line)
+        if event_filter is None:
+            raise QueryError(f"Invalid filter: {line.strip()}")
+        filters.append(event_filter)
+    if not filters:
+        raise QueryError("No filters given; send events-file lines as the body or as filter parameters")
+    return FilterSet(filters)
+
+def _param(params: Dict[str, List[str]], name: str) -> Optional[str]:
+    values = params.get(name)
+    return values[-1] if values else None
+
+# Run a query and render its result; returns (content type, body)
+def answer_query(log_index: LogIndex, params: Dict[str, List[str]], body: str) -> Tuple[str, str]:
+    filter_set = parse_filters(params, body)
+    try:
+        from_time = CLI._parse_datetime(_param(params, 'from')) if _param(params, 'from') else None
+        to_time = CLI._parse_datetime(_param(params, 'to')) if _param(params, 'to') else None
+        bucket = CLI._parse_duration(_param(params, 'bucket')) if _param(params, 'bucket') else None
+        max_lines = int(_param(params, 'max_lines')) if _param(params, 'max_lines') else None
+    except ValueError as e:
+        raise QueryError(str(e))
+    if max_lines is not None and max_lines < 0:
+        raise QueryError("max_lines must not be negative")
+    output_format = _param(params, 'output') or 'text'
+    if output_format not in WRITERS:
+        raise QueryError(f"Unknown output format: {output_format}")
+
+    output = io.StringIO()
+    with AnalysisResult(log_index.query(filter_set, from_time, to_time, max_lines, bucket)) as result:
+        if output_format == 'text':
+            TextWriter(output, series=bucket is not None).write(result)
+        else:
+            WRITERS[output_format](output).write(result)
+    return CONTENT_TYPES[output_format], output.getvalue()
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answers GET /status and GET or POST /query from the server's LogIndex
+
+    A query takes events-file lines as its body (POST) and as repeated
+    filter parameters, plus the from, to, max_lines, bucket and output
+    (text, json or ndjson) parameters of the command line.
+    """
+
+    server_version = 'LogAnalyzer'
+
+    def do_GET(self) -> None:
+        self._handle('')
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length') or 0)
+        self._handle(self.rfile.read(length).decode('utf-8', 'replace'))
+
+    def _handle(self, body: str) -> None:
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        log_index = self.server.log_index
+        if url.path == '/status':
+            self._send(200, CONTENT_TYPES['json'], json.dumps(log_index.status()) + '\n')
+        elif url.path == '/query':
+            try:
+                content_type, result = answer_query(log_index, params, body)
+            except QueryError as e:
+                self._send(400, CONTENT_TYPES['text'], f"Error: {e}\n")
+                return
+            self._send(200, content_type, result)
+        else:
+            self._send(404, CONTENT_TYPES['text'], "Unknown path; use /query or /status\n")
+
+    def _send(self, status: int, content_type: str, text: str) -> None:
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # Unix socket clients have no address
+    def address_string(self) -> str:
+        return self.client_address[0] if self.client_address else 'local'
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+# An HTTP server answering queries on a Unix socket, or on a localhost port
+def make_server(log_index: LogIndex, port: int = 8765, socket_path: Optional[str] = None):
+    if socket_path is not None:
+        # A socket left behind by an earlier server is replaced
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.unlink(socket_path)
+        server = _UnixHTTPServer(socket_path, QueryHandler)
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', port), QueryHandler)
+        server.daemon_threads = True
+    server.log_index = log_index
+    return server
+
+# Refresh log_index every interval seconds on a daemon thread, so changed
+# files are reloaded before the next query asks for them; set the returned
+# event to stop
+def start_refresher(log_index: LogIndex, interval: float) -> threading.Event:
+    stopped = threading.Event()
+
+    def refresh() -> None:
+        while not stopped.wait(interval):
+            log_index.refresh()
+
+    threading.Thread(target=refresh, daemon=True, name='log-index-refresh').start()
+    return stopped
@@ -0,0 +1,91 @@
+import unittest
+import sys
+import os
+import tempfile
+import json
+from contextlib import redirect_stderr, redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generator import generate_events, generate_logs
+from benchmarks.run_benchmarks import compare, main, run_benchmarks
+from parsers.events_parser import EventsParser
+from parsers.log_parser import LogParser
+
+class TestGenerator(unittest.TestCase):
+    
+    def _read_all(self, paths):
+        contents = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                contents.append(f.read())
+        return contents
+    
+    def test_same_seed_gives_identical_files(self):
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            paths = generate_logs(first, lines=2000, files=4, gz_ratio=0.5, seed=7)
+            again = generate_logs(second, lines=2000, files=4, gz_ratio=0.5, seed=7)
+            self.assertEqual([os.path.basename(p) for p in paths], [os.path.basename(p) for p in again])
+            self.assertEqual(self._read_all(paths), self._read_all(again))
+            self.assertEqual(sum(p.endswith('.gz') for p in paths), 2)
+            
+            other = generate_logs(second, lines=2000, files=4, gz_ratio=0.5, seed=8)
+            self.assertNotEqual(self._read_all(paths), self._read_all(other))
+    
+    def test_generated_logs_parse_in_order(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            generate_logs(temp_dir, lines=3000, files=3, gz_ratio=0.34, malformed_ratio=0.01)
+            entries = list(LogParser(temp_dir).parse_all_logs())
+            self.assertGreater(len(entries), 2900)
+            self.assertLess(len(entries), 3000)
+            epochs = [entry.epoch for entry in entries]
+            self.assertEqual(epochs, sorted(epochs))
+            
+            events_file = generate_events(os.path.join(temp_dir, 'events.txt'), filters=12)
+            self.assertEqual(len(EventsParser(events_file).parse_filter_set()), 12)
+
+class TestRunBenchmarks(unittest.TestCase):
+    
+    def test_results_and_regression_warnings(self):
+        config = {'lines': 500, 'files': 2, 'gz_ratio': 0.5, 'order': 'jittered',
+                  'filters': 5, 'pattern_ratio': 0.5, 'seed': 1}
+        results = run_benchmarks(config, repeat=1, only=['parse', 'end_to_end'])
+        self.assertEqual(set(results['stages']), {'parse', 'end_to_end'})
+        self.assertEqual(results['stages']['parse']['items'], 500)
+        self.assertGreater(results['stages']['end_to_end']['peak_bytes'], 0)
+        self.assertEqual(compare(results, results), [])
+        
+        slower = {**results, 'stages': {name: dict(stage, lines_per_sec=stage['lines_per_sec'] / 2)
+                                        for name, stage in results['stages'].items()}}
+        warnings = compare(results, slower, threshold=10)
+        self.assertEqual(len(warnings), 2)
+        self.assertIn('lines/sec dropped 50.0%', warnings[0])
+        self.assertEqual(compare(results, dict(results, config=dict(config, seed=2)))[:1],
+                         ["Baseline was generated with different options; results are not comparable"])
+
+    def test_mix_and_malformed_ratio_are_recorded(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = os.path.join(temp_dir, 'results.json')
+            argv = ['--lines', '400', '--files', '1', '--gz-ratio', '0', '--repeat', '1', '--no-memory',
+                    '--stage', 'parse', '--mix', 'DEVICE=3,GNMI=1', '--malformed-ratio', '0.5',
+                    '--data-dir', os.path.join(temp_dir, 'logs'), '--output', output]
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                self.assertEqual(main(argv), 0)
+            with open(output, 'r', encoding='utf-8') as results_file:
+                results = json.load(results_file)
+            self.assertEqual(results['config']['mix'], {'DEVICE': 3.0, 'GNMI': 1.0})
+            self.assertEqual(results['config']['malformed_ratio'], 0.5)
+            
+            entries = list(LogParser(os.path.join(temp_dir, 'logs')).parse_all_logs())
+            self.assertTrue(100 < len(entries) < 300)
+            self.assertEqual({entry.event_type for entry in entries}, {'DEVICE', 'GNMI'})
+            
+            self.assertEqual(compare(results, dict(results, config=dict(results['config'],
+                                                                        malformed_ratio=0.1)))[:1],
+                             ["Baseline was generated with different options; results are not comparable"])
+            with open(os.devnull, 'w') as devnull, redirect_stderr(devnull):
+                with self.assertRaises(SystemExit):
+                    main(['--mix', 'NOPE=1'])
+
+if __name__ == '__main__':
+    unittest.main()
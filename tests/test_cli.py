@@ -65,5 +65,116 @@ class TestCLI(unittest.TestCase):
                 '--events-file', '/nonexistent/events.txt'
             ])
 
+    def test_max_lines_and_head_alias(self):
+        cli = CLI()
+        args = cli.parse_args(['--log-dir', self.temp_dir, '--events-file', self.temp_events_file,
+                               '--head', '5', '--stream'])
+        self.assertEqual(args.max_lines, 5)
+        self.assertTrue(args.stream)
+        
+        with self.assertRaises(SystemExit):
+            cli.parse_args(['--log-dir', self.temp_dir, '--events-file', self.temp_events_file,
+                            '--max-lines', '-1'])
+    
+    def test_stats_and_profile(self):
+        cli = CLI()
+        base = ['--log-dir', self.temp_dir, '--events-file', self.temp_events_file]
+        self.assertIsNone(cli.parse_args(base).stats)
+        self.assertEqual(cli.parse_args(base + ['--stats']).stats, 'text')
+        args = cli.parse_args(base + ['--stats', 'json', '--profile', 'run.prof'])
+        self.assertEqual((args.stats, args.profile), ('json', 'run.prof'))
+        
+        with self.assertRaises(SystemExit):
+            cli.parse_args(base + ['--stats', '--follow'])
+    
+    def test_discovery_and_prune(self):
+        cli = CLI()
+        base = ['--log-dir', self.temp_dir, '--events-file', self.temp_events_file]
+        args = cli.parse_args(base)
+        self.assertEqual((args.recursive, args.include, args.exclude, args.prune),
+                         (False, None, None, False))
+        args = cli.parse_args(base + ['--recursive', '--include', '2025-*/*', '--exclude', 'tmp',
+                                      '--exclude', '*.txt', '--prune'])
+        self.assertEqual((args.recursive, args.include, args.exclude, args.prune),
+                         (True, ['2025-*/*'], ['tmp', '*.txt'], True))
+        
+        with self.assertRaises(SystemExit):
+            cli.parse_args(base + ['--prune', '--follow'])
+        
+        args = cli.parse_index_args(['--log-dir', self.temp_dir, '--recursive', '--spans'])
+        self.assertEqual((args.recursive, args.spans), (True, True))
+    
+    def test_merge_by_time(self):
+        cli = CLI()
+        base = ['--log-dir', self.temp_dir, '--events-file', self.temp_events_file]
+        args = cli.parse_args(base)
+        self.assertEqual((args.merge_by_time, args.reorder_window), (False, 0))
+        args = cli.parse_args(base + ['--merge-by-time', '--reorder-window', '100'])
+        self.assertEqual((args.merge_by_time, args.reorder_window), (True, 100))
+        
+        for extra in (['--reorder-window', '100'], ['--merge-by-time', '--reorder-window', '-1'],
+                      ['--merge-by-time', '--workers', '2'], ['--merge-by-time', '--follow']):
+            with self.assertRaises(SystemExit):
+                cli.parse_args(base + extra)
+    
+    def test_read_ahead(self):
+        cli = CLI()
+        base = ['--log-dir', self.temp_dir, '--events-file', self.temp_events_file]
+        args = cli.parse_args(base + ['--read-ahead', '8', '--block-size', '64'])
+        self.assertEqual((args.read_ahead, args.block_size), (8, 64))
+        self.assertEqual(cli.parse_args(base + ['--workers', '2', '--block-size', '64']).block_size, 64)
+        for extra in (['--read-ahead', '-1'], ['--block-size', '0'], ['--read-ahead', '8', '--workers', '2']):
+            with self.assertRaises(SystemExit):
+                cli.parse_args(base + extra)
+    
+    def test_block_index(self):
+        cli = CLI()
+        base = ['--log-dir', self.temp_dir, '--events-file', self.temp_events_file]
+        self.assertFalse(cli.parse_args(base).block_index)
+        self.assertTrue(cli.parse_args(base + ['--block-index', '--seek']).block_index)
+        for extra in (['--workers', '2'], ['--binary'], ['--merge-by-time']):
+            with self.assertRaises(SystemExit):
+                cli.parse_args(base + ['--block-index'] + extra)
+        
+        args = cli.parse_index_args(['--log-dir', self.temp_dir, '--blocks'])
+        self.assertTrue(args.blocks)
+    
+    def test_emit_partial_and_merge(self):
+        cli = CLI()
+        base = ['--log-dir', self.temp_dir, '--events-file', self.temp_events_file]
+        partial = os.path.join(self.temp_dir, 'host1.bin')
+        self.assertEqual(cli.parse_args(base + ['--emit-partial', partial]).emit_partial, partial)
+        with self.assertRaises(SystemExit):
+            cli.parse_args(base + ['--emit-partial', partial, '--follow'])
+        
+        args = cli.parse_merge_args([self.temp_events_file, self.temp_events_file, '--head', '5'])
+        self.assertEqual((args.partials, args.max_lines, args.output),
+                         ([self.temp_events_file] * 2, 5, 'text'))
+        with self.assertRaises(SystemExit):
+            cli.parse_merge_args([partial])
+        with self.assertRaises(SystemExit):
+            cli.parse_merge_args([])
+    
+    def test_serve_arguments(self):
+        cli = CLI()
+        args = cli.parse_serve_args(['--log-dir', self.temp_dir, '--memory-mb', '64'])
+        self.assertEqual((args.port, args.socket, args.memory_mb, args.refresh_interval),
+                         (8765, None, 64, 5.0))
+        with self.assertRaises(SystemExit):
+            cli.parse_serve_args(['--log-dir', self.temp_dir, '--memory-mb', '0'])
+        with self.assertRaises(SystemExit):
+            cli.parse_serve_args(['--log-dir', self.temp_events_file])
+    
+    def test_output_format(self):
+        cli = CLI()
+        base = ['--log-dir', self.temp_dir, '--events-file', self.temp_events_file]
+        self.assertEqual(cli.parse_args(base).output, 'text')
+        self.assertEqual(cli.parse_args(base + ['--output', 'ndjson']).output, 'ndjson')
+        
+        with self.assertRaises(SystemExit):
+            cli.parse_args(base + ['--output', 'xml'])
+        with self.assertRaises(SystemExit):
+            cli.parse_args(base + ['--output', 'json', '--follow'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
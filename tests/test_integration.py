@@ -8,6 +8,9 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from parsers.log_parser import LogParser
 from parsers.events_parser import EventsParser
 from main import process_entries
+from models.scan_result import ScanResult
+from parsers.binary_scanner import BinaryScanner
+from parsers.parallel_scanner import ParallelScanner
 
 class TestIntegration(unittest.TestCase):
     
@@ -130,5 +133,228 @@ class TestIntegration(unittest.TestCase):
             self.assertLessEqual(entry.timestamp, to_time, 
                                "Filtered entry should be before to_time")
 
+    def _scan_lines(self, scan_result):
+        return [(count, list(scan_result.matches(i))) for i, count in enumerate(scan_result.counts)]
+    
+    def test_parallel_scan_matches_serial_scan(self):
+        filter_set = EventsParser(os.path.join(self.test_compressed_dir, 'test_events.txt')).parse_filter_set()
+        log_parser = LogParser(self.test_compressed_dir)
+        from_time = datetime(2025, 6, 1, 14, 0, 0)
+        
+        with ScanResult(filter_set) as serial, ScanResult(filter_set) as parallel:
+            serial.collect(log_parser.parse_all_logs(from_time))
+            ParallelScanner(log_parser, filter_set, workers=2).scan(parallel, from_time)
+            
+            self.assertEqual(parallel.total_entries, serial.total_entries)
+            self.assertEqual(self._scan_lines(parallel), self._scan_lines(serial))
+
+    def test_parallel_scan_spills_worker_lines(self):
+        import tempfile
+        filter_set = EventsParser(os.path.join(self.test_compressed_dir, 'test_events.txt')).parse_filter_set()
+        log_parser = LogParser(self.test_compressed_dir)
+
+        with tempfile.TemporaryDirectory() as spill_dir:
+            with ScanResult(filter_set) as serial, \
+                    ScanResult(filter_set, max_lines=3, spill_dir=spill_dir) as limited, \
+                    ScanResult(filter_set, spill_dir=spill_dir) as parallel:
+                serial.collect(log_parser.parse_all_logs())
+                ParallelScanner(log_parser, filter_set, workers=2).scan(parallel)
+                ParallelScanner(log_parser, filter_set, workers=2).scan(limited)
+
+                self.assertEqual(self._scan_lines(parallel), self._scan_lines(serial))
+                for index in range(len(filter_set)):
+                    self.assertEqual(list(limited.matches(index)), list(serial.matches(index))[:3])
+                # Worker spill files are deleted once merged
+                self.assertEqual(os.listdir(spill_dir), [])
+
+    def test_bucket_series_agree_across_scanners(self):
+        filter_set = EventsParser(os.path.join(self.test_compressed_dir, 'test_events.txt')).parse_filter_set()
+        log_parser = LogParser(self.test_compressed_dir)
+        
+        with ScanResult(filter_set, bucket=300) as serial, \
+                ScanResult(filter_set, bucket=300) as parallel, \
+                ScanResult(filter_set, bucket=300) as binary:
+            serial.collect(log_parser.parse_all_logs())
+            ParallelScanner(log_parser, filter_set, workers=2).scan(parallel)
+            BinaryScanner(log_parser, filter_set).scan(binary)
+            
+            for index in range(len(filter_set)):
+                series = serial.histogram.series(index)
+                self.assertEqual(sum(count for _, count in series), serial.counts[index])
+                self.assertEqual(parallel.histogram.series(index), series)
+                self.assertEqual(binary.histogram.series(index), series)
+
+    def test_analyzer_matches_scan_result(self):
+        from analyzer import Analyzer
+        events_file = os.path.join(self.test_compressed_dir, 'test_events.txt')
+        filter_set = EventsParser(events_file).parse_filter_set()
+        from_time = datetime(2025, 6, 1, 14, 0, 0)
+        
+        with ScanResult(filter_set) as expected:
+            log_parser = LogParser(self.test_compressed_dir, event_types=filter_set.event_types)
+            expected.collect(log_parser.parse_all_logs(from_time))
+            for options in ({}, {'binary': True}, {'workers': 2},
+                            {'workers': 2, 'binary': True, 'block_size': 4096}):
+                with Analyzer(self.test_compressed_dir, events_file, **options).run(from_time) as result:
+                    self.assertEqual(result.total_entries, expected.total_entries)
+                    self.assertEqual(len(result), len(filter_set))
+                    for filter_result in result:
+                        self.assertEqual(filter_result.filter, filter_set.filters[filter_result.index])
+                        self.assertEqual(filter_result.matches, expected.counts[filter_result.index])
+                        self.assertEqual(list(filter_result.lines()),
+                                         list(expected.matches(filter_result.index)))
+                        self.assertEqual(filter_result.series(), [])
+    
+    def test_structured_writers(self):
+        import io
+        import json
+        from contextlib import redirect_stdout
+        from analyzer import Analyzer
+        from main import display_results
+        from writers import JsonWriter, NdjsonWriter, TextWriter
+        
+        with Analyzer(self.project_root, self.events_file_path, bucket=3600).run() as result:
+            # The text writer is what display_results prints
+            printed = io.StringIO()
+            with redirect_stdout(printed):
+                display_results(result.scan_result, series=True)
+            text = io.StringIO()
+            TextWriter(text, series=True).write(result)
+            self.assertEqual(text.getvalue(), printed.getvalue())
+            
+            json_output = io.StringIO()
+            JsonWriter(json_output).write(result)
+            document = json.loads(json_output.getvalue())
+            self.assertEqual(document['total_entries'], result.total_entries)
+            self.assertEqual(document['bucket_seconds'], 3600)
+            for filter_result, filter_json in zip(result, document['filters']):
+                self.assertEqual(filter_json['filter'], filter_result.description)
+                self.assertEqual(filter_json['matches'], filter_result.matches)
+                self.assertEqual(sum(count for _, count in filter_json['series']), filter_result.matches)
+                if filter_result.count_only:
+                    self.assertNotIn('lines', filter_json)
+                else:
+                    self.assertEqual([' '.join([line['timestamp'], line['level'], line['event_type'],
+                                                line['message']]) for line in filter_json['lines']],
+                                     list(filter_result.lines()))
+            
+            ndjson_output = io.StringIO()
+            NdjsonWriter(ndjson_output).write(result)
+            records = [json.loads(line) for line in ndjson_output.getvalue().splitlines()]
+            self.assertEqual(records[0], {'type': 'summary', 'total_entries': result.total_entries,
+                                          'bucket_seconds': 3600})
+            self.assertEqual([record['matches'] for record in records if record['type'] == 'filter'],
+                             [filter_result.matches for filter_result in result])
+            self.assertEqual(len([record for record in records if record['type'] == 'line']),
+                             sum(len(filter_json.get('lines', ())) for filter_json in document['filters']))
+    
+    def test_top_and_distinct_across_scanners(self):
+        import json
+        import tempfile
+        from analyzer import Analyzer
+        from writers import JsonWriter, TextWriter
+        
+        with tempfile.TemporaryDirectory() as log_dir, tempfile.TemporaryDirectory() as cache_dir:
+            for part in range(2):
+                with open(os.path.join(log_dir, f'app{part}.log'), 'w') as log_file:
+                    for i in range(300):
+                        device = i % 3 if i % 2 else i % 40
+                        log_file.write(f"2025-06-01T14:{i // 60:02d}:{i % 60:02d} WARNING DEVICE "
+                                       f"high temperature of device d{device}: {i}C\n")
+            events_file = os.path.join(log_dir, 'events.txt')
+            with open(events_file, 'w') as events:
+                events.write("DEVICE --pattern ^high temperature of device\\s(?P<device>\\w+): "
+                             "--top 3 --group-by device --distinct device\n")
+            
+            expected_top = [('d0', 116, 0), ('d2', 116, 0), ('d1', 100, 0)]
+            for options in ({}, {'binary': True}, {'workers': 2}, {'cache_dir': cache_dir}):
+                with Analyzer(log_dir, events_file, **options).run() as result:
+                    self.assertEqual(result[0].matches, 600)
+                    self.assertEqual(list(result[0].lines()), [])
+                    self.assertEqual(result[0].top(), expected_top)
+                    self.assertEqual(result[0].distinct(), 21)
+            
+            with Analyzer(log_dir, events_file).run() as result:
+                document = json.loads(self._write(JsonWriter, result))
+                self.assertEqual(document['filters'][0]['top']['keys'][0],
+                                 {'key': 'd0', 'count': 116, 'error': 0})
+                self.assertEqual(document['filters'][0]['distinct']['estimate'], 21)
+                self.assertIn("Top 3 by device", self._write(TextWriter, result))
+    
+    def test_query_server(self):
+        import json
+        import socket
+        import tempfile
+        import threading
+        import urllib.error
+        import urllib.request
+        from parsers.log_index import LogIndex
+        from server import make_server
+        
+        log_index = LogIndex(LogParser(self.project_root), 1 << 20)
+        expected = self._cli_report(['--from', '2025-06-01T14:00:00'])
+        with open(self.events_file_path) as events:
+            events_text = events.read()
+        
+        server = make_server(log_index, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            for _ in range(2):
+                request = urllib.request.Request(url + "/query?from=2025-06-01T14:00:00",
+                                                 data=events_text.encode('utf-8'))
+                with urllib.request.urlopen(request) as response:
+                    self.assertEqual(response.read().decode('utf-8'), expected)
+            with urllib.request.urlopen(url + "/query?filter=GNMI+--level+ERROR+--count&output=json") as response:
+                document = json.loads(response.read())
+                self.assertEqual(document['filters'][0]['matches'],
+                                 sum(1 for entry in LogParser(self.project_root).parse_all_logs()
+                                     if entry.event_type == 'GNMI' and entry.level == 'ERROR'))
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(url + "/query?filter=GNMI")
+            self.assertEqual(raised.exception.code, 400)
+            with urllib.request.urlopen(url + "/status") as response:
+                self.assertEqual(json.loads(response.read())['result_hits'], 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            socket_path = os.path.join(temp_dir, 'query.sock')
+            server = make_server(log_index, socket_path=socket_path)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                with socket.socket(socket.AF_UNIX) as client:
+                    client.connect(socket_path)
+                    client.sendall(b"GET /status HTTP/1.0\r\n\r\n")
+                    response = b''.join(iter(lambda: client.recv(65536), b''))
+                self.assertTrue(response.startswith(b"HTTP/1.0 200"))
+                self.assertIn(b'"loaded_files"', response)
+            finally:
+                server.shutdown()
+                server.server_close()
+    
+    # The report main.py prints for the sample data, without the progress lines
+    def _cli_report(self, args):
+        import io
+        from contextlib import redirect_stdout
+        from analyzer import Analyzer
+        from cli import CLI
+        from writers import TextWriter
+        parsed = CLI().parse_args(['--log-dir', self.project_root, '--events-file',
+                                   self.events_file_path] + args)
+        output = io.StringIO()
+        with redirect_stdout(io.StringIO()):
+            result = Analyzer(self.project_root, self.events_file_path).run(parsed.from_time)
+        with result:
+            TextWriter(output).write(result)
+        return output.getvalue()
+    
+    def _write(self, writer_class, result):
+        import io
+        output = io.StringIO()
+        writer_class(output).write(result)
+        return output.getvalue()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
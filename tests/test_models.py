@@ -2,11 +2,21 @@ import unittest
 from datetime import datetime
 import sys
 import os
+import shutil
+import tempfile
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models.log_entry import LogEntry
 from models.event_filter import EventFilter
+from models.filter_set import FilterSet
+from models.histogram import Histogram
+from models.pattern_matcher import PatternMatcher, extract_bounded_literals, extract_literals
+from models.partial_result import PartialError, PartialResult
+from models.scan_result import ScanResult
+from models.sketches import BloomFilter, HyperLogLog, SpaceSaving
+from models.timestamp import parse_timestamp, to_epoch, from_epoch
+import re
 
 class TestLogEntry(unittest.TestCase):
     
@@ -33,6 +43,48 @@ class TestLogEntry(unittest.TestCase):
         entry = LogEntry.from_line("")
         self.assertIsNone(entry)
 
+    def test_timestamp_text_is_reused_for_output(self):
+        entry = LogEntry.from_line("2025-06-01T14:03:05.250 INFO TELEMETRY Iteration time: 1.2 sec")
+        self.assertEqual(entry.format_line(), "2025-06-01T14:03:05.250 INFO TELEMETRY Iteration time: 1.2 sec")
+        self.assertEqual(entry.timestamp, datetime(2025, 6, 1, 14, 3, 5, 250000))
+
+    def test_event_type_prefilter(self):
+        line = "2025-06-01T14:03:05 INFO TELEMETRY Iteration time: 1.2 sec"
+        self.assertIsNone(LogEntry.from_line(line, {"DEVICE"}))
+        self.assertIsNotNone(LogEntry.from_line(line, {"TELEMETRY"}))
+        
+        # Rejected before the timestamp is even looked at
+        self.assertIsNone(LogEntry.from_line("not-a-date INFO DEVICE x", {"TELEMETRY"}))
+    
+    def test_compact_representation(self):
+        first = LogEntry.from_line("2025-06-01T14:03:05 INFO TELEMETRY  two  spaces ")
+        second = LogEntry.from_line("2025-06-01T14:03:06 INFO TELEMETRY other")
+        
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertIs(first.level, second.level)
+        self.assertIs(first.event_type, second.event_type)
+        self.assertEqual(first.message, " two  spaces")
+        self.assertEqual(first, LogEntry(datetime(2025, 6, 1, 14, 3, 5), "INFO", "TELEMETRY", " two  spaces"))
+
+class TestTimestamp(unittest.TestCase):
+    
+    def test_fast_path_agrees_with_fromisoformat(self):
+        for text in ["1970-01-01T00:00:00", "2025-06-01T14:03:05", "2024-02-29T23:59:59",
+                     "2025-12-31T00:00:01", "2025-06-01T14:03:05.5", "2025-06-01"]:
+            expected = to_epoch(datetime.fromisoformat(text))
+            self.assertEqual(parse_timestamp(text), expected, text)
+            self.assertEqual(from_epoch(expected), datetime.fromisoformat(text))
+        
+        self.assertEqual(parse_timestamp("2025-06-01T14:03:05+01:00"),
+                         parse_timestamp("2025-06-01T13:03:05"))
+    
+    def test_invalid_timestamps_raise(self):
+        for text in ["2025-13-01T14:03:05", "2025-02-30T14:03:05", "2025-06-01T24:00:00",
+                     "2025-06-01T14:60:05", "2025-06-01T1a:03:05", "2025-06-01T14:03:5x",
+                     "invalid-date"]:
+            with self.assertRaises(ValueError, msg=text):
+                parse_timestamp(text)
+
 class TestEventFilter(unittest.TestCase):
     
     def test_count_filter_parsing(self):
@@ -72,6 +124,389 @@ class TestEventFilter(unittest.TestCase):
         # Test non-matching level
         filter_obj = EventFilter.from_line("TELEMETRY --level ERROR")
         self.assertFalse(filter_obj.matches(entry))
+    
+    def test_top_and_distinct_parsing(self):
+        filter_obj = EventFilter.from_line(
+            "DEVICE --top 5 --group-by device --pattern ^device\\s(?P<device>\\S+):\\s(\\d+)C$ --distinct 2")
+        self.assertEqual((filter_obj.top, filter_obj.group_by, filter_obj.distinct), (5, "device", "2"))
+        self.assertTrue(filter_obj.aggregated)
+        self.assertEqual(filter_obj.pattern.pattern, "^device\\s(?P<device>\\S+):\\s(\\d+)C$")
+        self.assertEqual(EventFilter.from_line("DEVICE --pattern (x) --group-by 1").top, 10)
+        
+        # --top needs --group-by, and groups must exist in the pattern
+        self.assertIsNone(EventFilter.from_line("DEVICE --pattern (x) --top 5"))
+        self.assertIsNone(EventFilter.from_line("DEVICE --pattern (x) --distinct 2"))
+        self.assertIsNone(EventFilter.from_line("DEVICE --level WARNING --distinct 1"))
+        self.assertIsNone(EventFilter.from_line("DEVICE --pattern (x) --top 0 --group-by 1"))
+        self.assertFalse(EventFilter.from_line("DEVICE --pattern (x)").aggregated)
+
+class TestFilterSet(unittest.TestCase):
+    
+    def setUp(self):
+        self.filters = [
+            EventFilter.from_line("TELEMETRY --count --pattern ^Iteration time:"),
+            EventFilter.from_line("DEVICE --level WARNING"),
+            EventFilter.from_line("DEVICE --count"),
+            EventFilter.from_line("DEVICE --level ERROR --pattern disk"),
+        ]
+        self.filter_set = FilterSet(self.filters)
+    
+    def _entry(self, level, event_type, message):
+        return LogEntry(datetime(2025, 6, 1, 14, 3, 5), level, event_type, message)
+    
+    def test_filter_ids_are_stable(self):
+        self.assertEqual(self.filter_set.filter_ids,
+                         ["TELEMETRY_0", "DEVICE_1", "DEVICE_2", "DEVICE_3"])
+        self.assertEqual(FilterSet(self.filters).filter_ids, self.filter_set.filter_ids)
+    
+    def test_match_agrees_with_event_filter(self):
+        entries = [
+            self._entry("INFO", "TELEMETRY", "Iteration time: 1.2 sec"),
+            self._entry("INFO", "TELEMETRY", "something else"),
+            self._entry("WARNING", "DEVICE", "disk space low"),
+            self._entry("ERROR", "DEVICE", "disk failure"),
+            self._entry("ERROR", "DEVICE", "fan failure"),
+            self._entry("ERROR", "GNMI", "disk failure"),
+        ]
+        for entry in entries:
+            expected = [i for i, f in enumerate(self.filters) if f.matches(entry)]
+            self.assertEqual(sorted(self.filter_set.match(entry)), expected)
+    
+    def test_fingerprint_changes_with_filters(self):
+        self.assertEqual(FilterSet(self.filters).fingerprint, self.filter_set.fingerprint)
+        changed = self.filters[:-1] + [EventFilter.from_line("DEVICE --level ERROR --pattern Disk")]
+        self.assertNotEqual(FilterSet(changed).fingerprint, self.filter_set.fingerprint)
+    
+    def test_unknown_event_type_matches_nothing(self):
+        self.assertEqual(self.filter_set.match(self._entry("INFO", "OTHER", "x")), [])
+    
+    def test_match_bytes_agrees_with_match(self):
+        filters = self.filters + [
+            EventFilter.from_line(r"GNMI --pattern ^timeout\sat\S+$"),
+            EventFilter.from_line(r"GNMI --pattern [^\S]x"),
+            EventFilter.from_line("GNMI --pattern température"),
+        ]
+        filter_set = FilterSet(filters)
+        messages = ["timeout at:9001", "timeout\x1cat:9001", "timeout at\x1f",
+                    "a\x1dx", "température haute", "timeout\u00a0at:9001", "disk full"]
+        for event_type in ("GNMI", "DEVICE", "OTHER"):
+            for message in messages:
+                entry = self._entry("ERROR", event_type, message)
+                self.assertEqual(
+                    sorted(filter_set.match_bytes(event_type.encode(), b"ERROR",
+                                                  message.encode('utf-8'))),
+                    sorted(filter_set.match(entry)), (event_type, message))
+
+class TestPatternMatcher(unittest.TestCase):
+    
+    PATTERNS = [
+        r"^Iteration time:\s\d+\.\d+\ssec$",
+        r"^Iteration count",
+        r"^disk space low:\s\d+%\sfull$",
+        r"UNIQUE_COMPRESSED_ENTRY",
+        r"endpoint\s.+:9001",
+        r"(?i)TIMEOUT",
+        r"(\d)\1",
+        r"a|b",
+        r"",
+        r"host\d+\.example",
+        r"example\.com",
+        r"ample",
+    ]
+    
+    MESSAGES = [
+        "Iteration time: 1.2 sec",
+        "Iteration time: slow",
+        "Iteration count 3",
+        "disk space low: 91% full",
+        "prefix UNIQUE_COMPRESSED_ENTRY suffix",
+        "unresponsive telemetry at endpoint http://192.168.1.10:9001/x",
+        "connection timeout",
+        "retry 11 times",
+        "lookup host12.example.com failed",
+        "sample rate",
+        "",
+        "xyz",
+    ]
+    
+    def test_extract_literals(self):
+        prefix, literals = extract_literals(re.compile(self.PATTERNS[0]))
+        self.assertEqual(prefix, "Iteration time:")
+        self.assertIn("sec", literals)
+        
+        prefix, literals = extract_literals(re.compile("UNIQUE_COMPRESSED_ENTRY"))
+        self.assertEqual(prefix, "")
+        self.assertEqual(literals, ["UNIQUE_COMPRESSED_ENTRY"])
+        
+        # Case-insensitive patterns cannot be screened on literals
+        self.assertEqual(extract_literals(re.compile("(?i)timeout")), ("", []))
+    
+    def test_extract_bounded_literals(self):
+        self.assertEqual(extract_bounded_literals(re.compile(r"\bid=(\d+) from 10\.0\.0\.1$")),
+                         [("id=", "boundary", ""), (" from 10.0.0.1", "", "edge")])
+        self.assertEqual(extract_bounded_literals(re.compile(r"^user (login|logout)\B")),
+                         [("user ", "edge", ""), ("log", "", "")])
+        self.assertEqual(extract_bounded_literals(re.compile(r"(?i)timeout\b")), [])
+        # ASCII word boundaries fall inside Unicode words like "éfoo"
+        self.assertEqual(extract_bounded_literals(re.compile(r"(?a)\bfoo\b")), [])
+    
+    def test_matches_agree_with_re(self):
+        compiled = [re.compile(pattern) for pattern in self.PATTERNS]
+        matcher = PatternMatcher(list(enumerate(compiled)))
+        
+        for message in self.MESSAGES:
+            expected = [i for i, pattern in enumerate(compiled) if pattern.search(message)]
+            self.assertEqual(sorted(matcher.match(message)), expected, message)
+
+    def test_bytes_patterns(self):
+        self.assertEqual(extract_literals(re.compile(rb"^Iteration time:\s\d+ sec")),
+                         (b"Iteration time:", [b" sec"]))
+        compiled = [re.compile(pattern.encode('ascii')) for pattern in self.PATTERNS]
+        matcher = PatternMatcher(list(enumerate(compiled)))
+        
+        for message in self.MESSAGES:
+            data = message.encode('ascii')
+            expected = [i for i, pattern in enumerate(compiled) if pattern.search(data)]
+            self.assertEqual(sorted(matcher.match(data)), expected, message)
+
+class TestScanResult(unittest.TestCase):
+    
+    def setUp(self):
+        self.filter_set = FilterSet([
+            EventFilter.from_line("DEVICE --count"),
+            EventFilter.from_line("DEVICE --level WARNING"),
+        ])
+    
+    def _fill(self, scan_result):
+        for i in range(5):
+            scan_result.add_match(0)
+            scan_result.add_match(1, f"line {i}\twith tab\r")
+    
+    def test_in_memory_collection(self):
+        with ScanResult(self.filter_set) as scan_result:
+            self._fill(scan_result)
+            self.assertEqual(scan_result.counts, [5, 5])
+            self.assertEqual(list(scan_result.matches(0)), [])
+            self.assertEqual(len(list(scan_result.matches(1))), 5)
+    
+    def test_spilled_lines_round_trip(self):
+        with ScanResult(self.filter_set) as memory, ScanResult(self.filter_set, stream=True) as spilled:
+            self._fill(memory)
+            self._fill(spilled)
+            self.assertEqual(list(spilled.matches(1)), list(memory.matches(1)))
+            # Reading back twice gives the same lines
+            self.assertEqual(list(spilled.matches(1)), list(memory.matches(1)))
+    
+    def test_max_lines_stops_collecting_but_keeps_counting(self):
+        with ScanResult(self.filter_set, max_lines=2, stream=True) as scan_result:
+            self._fill(scan_result)
+            self.assertEqual(scan_result.counts[1], 5)
+            self.assertEqual(list(scan_result.matches(1)), ["line 0\twith tab\r", "line 1\twith tab\r"])
+            self.assertFalse(scan_result.wants_lines(1))
+    
+    def test_bucket_histogram_merges_across_partials(self):
+        with ScanResult(self.filter_set, bucket=60) as whole, \
+                ScanResult(self.filter_set, bucket=60) as part:
+            for epoch in (0, 59, 60, 3600):
+                whole.add_match(1, "line", epoch)
+            whole.add_count(0, 3, 61)
+            part.add_match(1, "line", 59)
+            part.add_count(0, 3, 61)
+            with ScanResult(self.filter_set, bucket=60) as merged:
+                merged.merge_partial(part.export_partial())
+                for epoch in (0, 60, 3600):
+                    merged.add_match(1, "line", epoch)
+                self.assertEqual(merged.counts, whole.counts)
+                self.assertEqual(merged.histogram.series(0), [(60, 3)])
+                self.assertEqual(merged.histogram.series(1), whole.histogram.series(1))
+                self.assertEqual(whole.histogram.series(1), [(0, 2), (60, 1), (3600, 1)])
+
+    def test_sketches_merge_across_partials(self):
+        filter_set = FilterSet([EventFilter.from_line(
+            "DEVICE --pattern ^key\\s(\\w+)$ --top 2 --group-by 1 --distinct 1")])
+        messages = [f"key k{i % 7 if i % 2 else 0}" for i in range(100)]
+        with ScanResult(filter_set) as whole, ScanResult(filter_set) as part, \
+                ScanResult(filter_set) as merged:
+            for message in messages:
+                whole.add_match(0, f"2025-06-01T14:00:00 INFO DEVICE {message}", message=message)
+            for message in messages[:40]:
+                part.add_match(0, message=message)
+            merged.merge_partial(part.export_partial())
+            for message in messages[40:]:
+                merged.add_match(0, message=message)
+            # Sketches replace kept lines
+            self.assertEqual(list(whole.matches(0)), [])
+            for result in (whole, merged):
+                self.assertEqual(result.counts, [100])
+                self.assertEqual(result.sketches[0].top.top(2), [("k0", 57, 0), ("k1", 8, 0)])
+                self.assertEqual(result.sketches[0].distinct.estimate(), 7)
+
+class TestPartialResult(unittest.TestCase):
+    
+    def setUp(self):
+        self.filter_set = FilterSet([
+            EventFilter.from_line("DEVICE --count"),
+            EventFilter.from_line("DEVICE --level WARNING"),
+            EventFilter.from_line("DEVICE --pattern ^key\\s(\\w+)$ --group-by 1 --distinct 1"),
+        ])
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    # A partial with matches at minutes start..start+count of 14:00
+    def _partial(self, start, count, filter_set=None):
+        with ScanResult(filter_set or self.filter_set, bucket=60) as scan_result:
+            for minute in range(start, start + count):
+                message = f"key k{minute % 3}"
+                line = f"2025-06-01T14:{minute:02d}:00 WARNING DEVICE {message}"
+                epoch = to_epoch(datetime(2025, 6, 1, 14, minute))
+                for index in range(len(scan_result.filter_set)):
+                    scan_result.add_match(index, line, epoch, message)
+                scan_result.total_entries += 1
+            return PartialResult.from_scan_result(scan_result)
+    
+    def _report(self, partial):
+        with partial.to_scan_result() as scan_result:
+            return (scan_result.total_entries, scan_result.counts, list(scan_result.matches(1)),
+                    scan_result.histogram.series(0), scan_result.sketches[2].top.top(3),
+                    scan_result.sketches[2].distinct.estimate())
+    
+    def test_file_round_trip(self):
+        partial = self._partial(0, 10)
+        path = os.path.join(self.temp_dir, 'host1.bin')
+        partial.write(path)
+        read = PartialResult.read(path)
+        self.assertEqual(read.fingerprint, self.filter_set.fingerprint)
+        self.assertEqual(read.bucket_seconds, 60)
+        self.assertEqual(self._report(read), self._report(partial))
+        self.assertEqual(self._report(read)[4], [("k0", 4, 0), ("k1", 3, 0), ("k2", 3, 0)])
+    
+    def test_merge_is_associative_and_order_independent(self):
+        first, second, third = self._partial(0, 10), self._partial(10, 25), self._partial(35, 5)
+        whole = self._report(self._partial(0, 40))
+        merge = PartialResult.merge
+        self.assertEqual(self._report(merge([first, second, third])), whole)
+        self.assertEqual(self._report(merge([third, first, second])), whole)
+        self.assertEqual(self._report(merge([merge([third, second]), first])), whole)
+    
+    def test_merge_keeps_scan_order_of_lines(self):
+        lines = ["2025-06-01T14:00:00 WARNING DEVICE zeta", "2025-06-01T14:00:00 WARNING DEVICE alpha",
+                 "2025-06-01T13:59:00 WARNING DEVICE late", "2025-06-01T14:01:00 WARNING DEVICE beta"]
+        partials = []
+        for part in (lines, ["2025-06-01T14:00:00 WARNING DEVICE other"]):
+            with ScanResult(self.filter_set) as scan_result:
+                for line in part:
+                    scan_result.add_match(1, line)
+                partials.append(PartialResult.from_scan_result(scan_result))
+        
+        with PartialResult.merge(partials[:1]).to_scan_result() as merged:
+            self.assertEqual(list(merged.matches(1)), lines)
+        with PartialResult.merge(partials).to_scan_result() as merged:
+            self.assertEqual(list(merged.matches(1)), lines[:3] + ["2025-06-01T14:00:00 WARNING DEVICE other"]
+                             + lines[3:])
+    
+    def test_mismatched_and_corrupt_partials_are_rejected(self):
+        other_filters = FilterSet([EventFilter.from_line("DEVICE --count")])
+        with self.assertRaises(PartialError):
+            PartialResult.merge([self._partial(0, 5), self._partial(5, 5, other_filters)])
+        
+        path = os.path.join(self.temp_dir, 'bad.bin')
+        with open(path, 'wb') as bad_file:
+            bad_file.write(b'not a partial result')
+        with self.assertRaises(PartialError):
+            PartialResult.read(path)
+        with open(path, 'wb') as bad_file:
+            bad_file.write(b'LOGPART\0\x00\x01garbage')
+        with self.assertRaises(PartialError):
+            PartialResult.read(path)
+
+class TestSketches(unittest.TestCase):
+    
+    # Skewed keys: a few frequent ones and many rare ones
+    def _zipf_keys(self, count):
+        return [f"key{count // (1 + (i * 7919) % count)}" for i in range(count)]
+    
+    def test_space_saving_bounds(self):
+        keys = self._zipf_keys(20000)
+        exact = {}
+        for key in keys:
+            exact[key] = exact.get(key, 0) + 1
+        
+        whole = SpaceSaving(50)
+        for key in keys:
+            whole.add(key)
+        halves = SpaceSaving(50), SpaceSaving(50)
+        for position, key in enumerate(keys):
+            halves[position % 2].add(key)
+        halves[0].merge(halves[1])
+        
+        for summary in (whole, halves[0]):
+            self.assertEqual(summary.total, len(keys))
+            self.assertLessEqual(len(summary.counts), 50)
+            for key, count, error in summary.top(10):
+                self.assertLessEqual(error, summary.max_error)
+                self.assertGreaterEqual(count, exact.get(key, 0))
+                self.assertLessEqual(count - error, exact.get(key, 0))
+            # Every key more frequent than the error bound is tracked
+            for key, count in exact.items():
+                if count > summary.max_error:
+                    self.assertIn(key, summary.counts)
+        
+        exported = SpaceSaving.from_export(whole.export())
+        self.assertEqual(exported.top(10), whole.top(10))
+    
+    def test_hyperloglog_estimate_and_merge(self):
+        first, second, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for i in range(60000):
+            (first if i < 40000 else second).add(f"device-{i}")
+            union.add(f"device-{i}")
+        # Duplicates do not count
+        for i in range(1000):
+            first.add(f"device-{i}")
+        first.merge(HyperLogLog.from_export(second.export()))
+        self.assertEqual(first.registers, union.registers)
+        self.assertLess(abs(union.estimate() - 60000), 60000 * 4 * union.relative_error)
+        
+        small = HyperLogLog()
+        for i in range(100):
+            small.add(str(i))
+        self.assertEqual(small.estimate(), 100)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter.for_keys(2000)
+        for i in range(2000):
+            bloom.add(f"token-{i}")
+        self.assertTrue(all(f"token-{i}" in bloom for i in range(2000)))
+        false_positives = sum(f"other-{i}" in bloom for i in range(20000))
+        self.assertLess(false_positives, 20000 * 0.02)
+        
+        exported = BloomFilter.from_export(bloom.export(), bloom.bits, bloom.hashes)
+        self.assertTrue(all(f"token-{i}" in exported for i in range(2000)))
+        self.assertEqual(sum(f"other-{i}" in exported for i in range(20000)), false_positives)
+
+class TestHistogram(unittest.TestCase):
+    
+    def test_batches_match_naive_binning(self):
+        epochs = [1748786400 + (i * 37) % 7200 + (0.5 if i % 3 else 0) for i in range(3 * Histogram.BATCH_SIZE + 5)]
+        histogram = Histogram(2, 300)
+        for epoch in epochs:
+            histogram.add(1, epoch)
+        histogram.add_many(0, epochs[:100])
+        
+        expected = {}
+        for epoch in epochs:
+            start = int(epoch // 300) * 300
+            expected[start] = expected.get(start, 0) + 1
+        self.assertEqual(histogram.series(1), sorted(expected.items()))
+        self.assertEqual(sum(count for _, count in histogram.series(0)), 100)
+    
+    def test_buckets_are_aligned_to_the_epoch(self):
+        histogram = Histogram(1, 3600)
+        histogram.add(0, to_epoch(datetime(2025, 6, 1, 14, 59, 59)))
+        histogram.add(0, to_epoch(datetime(2025, 6, 1, 15, 0, 0)))
+        self.assertEqual([(from_epoch(start), count) for start, count in histogram.series(0)],
+                         [(datetime(2025, 6, 1, 14), 1), (datetime(2025, 6, 1, 15), 1)])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
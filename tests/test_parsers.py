@@ -8,6 +8,12 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from parsers.log_parser import LogParser
 from parsers.events_parser import EventsParser
+from models.event_filter import EventFilter
+from models.filter_set import FilterSet
+
+# One ERROR log line at the given minute of 2025-06-01T14
+def log_line(minute, event_type="GNMI", message="disk failure"):
+    return f"2025-06-01T14:{minute:02d}:00 ERROR {event_type} {message}\n"
 
 class TestLogParser(unittest.TestCase):
     
@@ -50,6 +56,987 @@ class TestLogParser(unittest.TestCase):
         finally:
             os.unlink(temp_gz_path)
 
+    def test_chunked_ranges_match_whole_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_path = os.path.join(temp_dir, 'server.log')
+            with open(log_path, 'w', encoding='utf-8', newline='') as f:
+                for i in range(200):
+                    f.write(f"2025-06-01T14:{i // 60:02d}:{i % 60:02d} INFO TELEMETRY température {i}\r\n")
+                f.write("not a log line\n")
+                f.write("2025-06-01T15:00:00 ERROR GNMI last line without newline")
+            
+            log_parser = LogParser(temp_dir)
+            whole = list(log_parser._parse_single_file(log_path))
+            
+            for chunk_size in (1, 37, 1000, 10 ** 6):
+                ranges = log_parser._split_file(log_path, chunk_size)
+                self.assertEqual(ranges[0][0], 0)
+                self.assertEqual(ranges[-1][1], os.path.getsize(log_path))
+                chunked = [entry for start, end in ranges
+                           for entry in log_parser._parse_file_range(log_path, start, end)]
+                self.assertEqual(chunked, whole)
+
+    def _write_minutes(self, log_path, minutes):
+        with open(log_path, 'w') as f:
+            f.write("garbage header line\n")
+            for minute in minutes:
+                f.write(f"2025-06-01T{10 + minute // 60:02d}:{minute % 60:02d}:00 INFO TELEMETRY m{minute}\n")
+    
+    def test_seek_narrows_ordered_file(self):
+        from datetime import datetime
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_path = os.path.join(temp_dir, 'server.log')
+            self._write_minutes(log_path, [m for m in range(300) for _ in range(3)])
+            from_time = datetime(2025, 6, 1, 11, 0, 0)
+            to_time = datetime(2025, 6, 1, 11, 30, 0)
+            
+            seeking = LogParser(temp_dir, seek=True)
+            start, end = seeking._get_time_range(log_path, from_time, to_time)
+            in_range = list(seeking._parse_file_range(log_path, start, end))
+            self.assertEqual(in_range[0].timestamp, from_time)
+            self.assertEqual(in_range[-1].timestamp, to_time)
+            
+            expected = list(LogParser(temp_dir).parse_all_logs(from_time, to_time))
+            self.assertEqual(in_range, expected)
+            self.assertEqual(list(seeking.parse_all_logs(from_time, to_time)), expected)
+            
+            # Window entirely outside the file
+            start, end = seeking._get_time_range(log_path, datetime(2025, 6, 2), None)
+            self.assertEqual(start, end)
+    
+    def test_seek_falls_back_on_unordered_file(self):
+        from datetime import datetime
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_path = os.path.join(temp_dir, 'server.log')
+            self._write_minutes(log_path, list(range(150, 300)) + list(range(150)))
+            from_time = datetime(2025, 6, 1, 11, 0, 0)
+            
+            seeking = LogParser(temp_dir, seek=True)
+            self.assertIsNone(seeking._get_time_range(log_path, from_time, None))
+            self.assertEqual(list(seeking.parse_all_logs(from_time)),
+                             list(LogParser(temp_dir).parse_all_logs(from_time)))
+    
+    def test_seek_detects_local_disorder(self):
+        from datetime import datetime
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_path = os.path.join(temp_dir, 'server.log')
+            from_time = datetime(2025, 6, 1, 11, 0, 0)
+            to_time = datetime(2025, 6, 1, 11, 30, 0)
+            seeking = LogParser(temp_dir, seek=True)
+            
+            # A line of the window just before the range found by bisection
+            minutes = [minute for minute in range(300) for _ in range(40)]
+            minutes[2390] = 61
+            self._write_minutes(log_path, minutes)
+            self.assertIsNone(seeking._get_time_range(log_path, from_time, to_time))
+            
+            # A line of the window far from the range, between the order
+            # probes, is found once the range turns out to be out of order,
+            # and the whole file is then read in file order
+            minutes = [minute for minute in range(300) for _ in range(40)]
+            minutes[380] = 70
+            minutes[3000], minutes[3001] = 76, 75
+            self._write_minutes(log_path, minutes)
+            self.assertIsNone(seeking._get_time_range(log_path, from_time, to_time))
+            self.assertEqual(list(seeking.parse_all_logs(from_time, to_time)),
+                             list(LogParser(temp_dir).parse_all_logs(from_time, to_time)))
+    
+    def test_seek_disorder_falls_back_on_every_scanner(self):
+        from datetime import datetime
+        from analyzer import Analyzer
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Ordered but for a line of the window far before it and an
+            # early timestamp inside the seeked range
+            minutes = [minute for minute in range(300) for _ in range(40)]
+            minutes[380] = 70
+            minutes[3000], minutes[3001] = 76, 75
+            with open(os.path.join(temp_dir, 'server.log'), 'w') as f:
+                for line_number, minute in enumerate(minutes):
+                    f.write(f"2025-06-01T{10 + minute // 60:02d}:{minute % 60:02d}:00 "
+                            f"INFO TELEMETRY line {line_number}\n")
+            filters = [EventFilter('TELEMETRY')]
+            from_time = datetime(2025, 6, 1, 11, 0, 0)
+            to_time = datetime(2025, 6, 1, 11, 30, 0)
+            
+            with Analyzer(temp_dir, filters).run(from_time, to_time) as result:
+                expected = list(result[0].lines())
+            self.assertEqual(expected[0], "2025-06-01T11:10:00 INFO TELEMETRY line 380")
+            for options in ({}, {'binary': True}, {'workers': 2, 'chunk_size': 4096},
+                            {'read_ahead': 2, 'block_size': 4096}):
+                with Analyzer(temp_dir, filters, seek=True, **options).run(from_time, to_time) as result:
+                    self.assertEqual(list(result[0].lines()), expected, options)
+    
+    def test_read_ahead_matches_serial_parse(self):
+        from datetime import datetime
+        from parsers.gzip_index import GzipIndex
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self._write_minutes(os.path.join(temp_dir, 'a.log'), range(300))
+            open(os.path.join(temp_dir, 'b.log'), 'w').close()
+            with open(os.path.join(temp_dir, 'c.log.gz'), 'wb') as f:
+                for hour in range(3):
+                    lines = "".join(f"2025-06-01T{12 + hour:02d}:{minute:02d}:30 INFO TELEMETRY g{minute}\r\n"
+                                    for minute in range(60))
+                    f.write(gzip.compress(lines.encode('utf-8')))
+            from_time = datetime(2025, 6, 1, 12, 30, 0)
+            
+            for options in ({}, {'seek': True}, {'gz_index': True, 'gz_checkpoint_every': 1}):
+                expected = list(LogParser(temp_dir, **options).parse_all_logs(from_time))
+                for read_ahead, block_size in ((1, 7), (4, 100), (16, 1 << 20)):
+                    reading_ahead = LogParser(temp_dir, read_ahead=read_ahead, block_size=block_size,
+                                              **options)
+                    self.assertEqual(list(reading_ahead.parse_all_logs(from_time)), expected)
+            self.assertIsNotNone(GzipIndex.load(os.path.join(temp_dir, 'c.log.gz')))
+            
+            # Every file is listed, even empty ones, and unread blocks are skipped
+            log_parser = LogParser(temp_dir, read_ahead=2, block_size=64)
+            log_files = log_parser.select_files()
+            listed = []
+            for file_path, blocks in log_parser.iter_file_blocks(log_files):
+                listed.append((os.path.basename(file_path), next(blocks, b'')[:4]))
+            self.assertEqual(listed, [('a.log', b'garb'), ('b.log', b''), ('c.log.gz', b'2025')])
+    
+    def test_recursive_discovery_with_globs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for relative in ('top.log', 'notes.md', '2025-06-01/app.log', '2025-06-01/app.log.gz',
+                             '2025-06-02/app.txt', '2025-06-02/deep/app.log', 'tmp/scratch.log'):
+                path = os.path.join(temp_dir, *relative.split('/'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                open(path, 'wb').close()
+            
+            def found(**options):
+                return [os.path.relpath(path, temp_dir).replace(os.sep, '/')
+                        for path in LogParser(temp_dir, **options)._get_log_files()]
+            
+            self.assertEqual(found(), ['top.log'])
+            self.assertEqual(found(recursive=True),
+                             ['2025-06-01/app.log', '2025-06-01/app.log.gz', '2025-06-02/app.txt',
+                              '2025-06-02/deep/app.log', 'tmp/scratch.log', 'top.log'])
+            self.assertEqual(found(recursive=True, exclude=['tmp', '*.txt']),
+                             ['2025-06-01/app.log', '2025-06-01/app.log.gz',
+                              '2025-06-02/deep/app.log', 'top.log'])
+            self.assertEqual(found(recursive=True, include=['2025-06-0[12]/*.log']),
+                             ['2025-06-01/app.log', '2025-06-02/deep/app.log'])
+            self.assertEqual(found(recursive=True, include=['app.log*']),
+                             ['2025-06-01/app.log', '2025-06-01/app.log.gz', '2025-06-02/deep/app.log'])
+    
+    def test_prune_skips_files_outside_window(self):
+        from datetime import datetime
+        from parsers.span_manifest import manifest_path_for
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Hours 10-14, 15-19, 20-24 compressed, and 10-14 out of order
+            self._write_minutes(os.path.join(temp_dir, 'a.log'), range(300))
+            self._write_minutes(os.path.join(temp_dir, 'b.log'), range(300, 600))
+            self._write_minutes(os.path.join(temp_dir, 'c.txt'), range(600, 900))
+            with open(os.path.join(temp_dir, 'c.txt'), 'rb') as f:
+                data = f.read()
+            os.unlink(os.path.join(temp_dir, 'c.txt'))
+            with open(os.path.join(temp_dir, 'c.log.gz'), 'wb') as f:
+                f.write(gzip.compress(data))
+            # Out of order, so its first and last lines say nothing
+            self._write_minutes(os.path.join(temp_dir, 'd.log'), list(range(150, 300)) + list(range(150)))
+            from_time = datetime(2025, 6, 1, 16, 0, 0)
+            to_time = datetime(2025, 6, 1, 17, 0, 0)
+            expected = list(LogParser(temp_dir).parse_all_logs(from_time, to_time))
+            
+            pruning = LogParser(temp_dir, prune=True)
+            self.assertEqual(list(pruning.parse_all_logs(from_time, to_time)), expected)
+            self.assertEqual(pruning.pruned_files, 1)
+            self.assertEqual(len(pruning.select_files()), 4)
+            self.assertEqual(pruning.pruned_files, 0)
+            
+            # The manifest knows the spans of compressed and unordered files too
+            self.assertEqual(pruning.build_span_manifest(), 4)
+            self.assertTrue(os.path.exists(manifest_path_for(temp_dir)))
+            self.assertEqual(pruning.build_span_manifest(), 0)
+            self.assertEqual(list(pruning.parse_all_logs(from_time, to_time)), expected)
+            self.assertEqual(pruning.pruned_files, 3)
+            
+            # A changed file is no longer pruned by its stale span
+            self._write_minutes(os.path.join(temp_dir, 'a.log'), range(360, 420))
+            os.utime(os.path.join(temp_dir, 'a.log'), ns=(0, 0))
+            self.assertEqual(pruning.select_files(from_time, to_time),
+                             [os.path.join(temp_dir, 'a.log'), os.path.join(temp_dir, 'b.log')])
+    
+    def test_merge_by_time_interleaves_files(self):
+        from datetime import datetime
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Even and odd minutes in two files, a third compressed and a
+            # fourth with pairs of lines swapped
+            self._write_minutes(os.path.join(temp_dir, 'a.log'), range(0, 120, 2))
+            self._write_minutes(os.path.join(temp_dir, 'b.log'), range(1, 120, 2))
+            with open(os.path.join(temp_dir, 'c.log.gz'), 'wb') as f:
+                f.write(gzip.compress("".join(f"2025-06-01T10:{minute:02d}:00 INFO TELEMETRY c{minute}\n"
+                                              for minute in range(0, 60, 5)).encode('utf-8')))
+            self._write_minutes(os.path.join(temp_dir, 'd.log'),
+                                [minute ^ 1 for minute in range(30, 90)])
+            entries = list(LogParser(temp_dir).parse_all_logs())
+            
+            merged = list(LogParser(temp_dir, merge_by_time=True).parse_all_logs())
+            self.assertEqual(sorted(merged, key=lambda entry: entry.message),
+                             sorted(entries, key=lambda entry: entry.message))
+            # Only d.log's swapped pairs are out of order without a window
+            descents = sum(1 for before, after in zip(merged, merged[1:]) if after.epoch < before.epoch)
+            self.assertEqual(descents, 30)
+            
+            # Equal timestamps keep file name order
+            reordered = list(LogParser(temp_dir, merge_by_time=True, reorder_window=1).parse_all_logs())
+            self.assertEqual(reordered, sorted(entries, key=lambda entry: entry.epoch))
+            self.assertEqual([entry.message for entry in reordered[:3]], ['m0', 'c0', 'm1'])
+            
+            from_time = datetime(2025, 6, 1, 10, 40, 0)
+            to_time = datetime(2025, 6, 1, 11, 10, 0)
+            windowed = LogParser(temp_dir, merge_by_time=True, reorder_window=4)
+            self.assertEqual(list(windowed.parse_all_logs(from_time, to_time)),
+                             [entry for entry in reordered if from_time <= entry.timestamp <= to_time])
+    
+    def test_merge_by_time_batches_and_read_errors(self):
+        from parsers.log_parser import LogReadError, merge_sorted
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Seven files merged two at a time through temporary runs keep
+            # the order of a single merge, ties in file name order
+            for index in range(7):
+                self._write_minutes(os.path.join(temp_dir, f'{index}.log'), range(index % 3, 60, 3))
+            log_parser = LogParser(temp_dir, merge_by_time=True)
+            streams = [log_parser._parse_file(file_path, None, None)
+                       for file_path in log_parser.select_files()]
+            self.assertEqual(list(merge_sorted(streams, fan_in=2)), list(log_parser.parse_all_logs()))
+            
+            # A file that cannot be read fails the merge instead of being skipped
+            with open(os.path.join(temp_dir, 'corrupt.log.gz'), 'wb') as f:
+                f.write(b'not gzip data')
+            self.assertEqual(len(list(LogParser(temp_dir).parse_all_logs())), 140)
+            with self.assertRaises(LogReadError):
+                list(LogParser(temp_dir, merge_by_time=True).parse_all_logs())
+
+
+class TestGzipIndex(unittest.TestCase):
+    
+    def _write_multi_member(self, gz_path, hours):
+        # One gzip member per hour, as written by a log shipper
+        with open(gz_path, 'wb') as f:
+            for hour in hours:
+                lines = "".join(f"2025-06-01T{hour:02d}:{minute:02d}:00 INFO TELEMETRY m{minute}\r\n"
+                                for minute in range(60))
+                f.write(gzip.compress(lines.encode('utf-8')))
+    
+    def test_index_skips_segments_and_matches_full_scan(self):
+        from datetime import datetime
+        from parsers.gzip_index import GzipIndex, index_path_for
+        with tempfile.TemporaryDirectory() as temp_dir:
+            gz_path = os.path.join(temp_dir, 'archive.log.gz')
+            self._write_multi_member(gz_path, range(24))
+            from_time = datetime(2025, 6, 1, 10, 30, 0)
+            to_time = datetime(2025, 6, 1, 12, 15, 0)
+            expected = list(LogParser(temp_dir).parse_all_logs(from_time, to_time))
+            
+            indexed = LogParser(temp_dir, gz_index=True, gz_checkpoint_every=1)
+            self.assertEqual(list(indexed.parse_all_logs()), list(LogParser(temp_dir).parse_all_logs()))
+            
+            index = GzipIndex.load(gz_path)
+            self.assertIsNotNone(index)
+            self.assertEqual(len(index.segments), 24)
+            ranges = index.ranges_for(from_time, to_time)
+            self.assertEqual(len(ranges), 1)
+            self.assertEqual(ranges[0][0], index.segments[10][0])
+            self.assertEqual(ranges[0][1], index.segments[13][0])
+            self.assertEqual(list(indexed.parse_all_logs(from_time, to_time)), expected)
+            
+            # Rewriting the file invalidates the index
+            self._write_multi_member(gz_path, range(12))
+            os.utime(gz_path, ns=(0, 0))
+            self.assertIsNone(GzipIndex.load(gz_path))
+            self.assertTrue(os.path.exists(index_path_for(gz_path)))
+    
+    def test_build_gzip_indexes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self._write_multi_member(os.path.join(temp_dir, 'a.log.gz'), range(3))
+            with open(os.path.join(temp_dir, 'b.log'), 'w') as f:
+                f.write("2025-06-01T14:03:05 INFO TELEMETRY plain\n")
+            
+            log_parser = LogParser(temp_dir, gz_index=True)
+            self.assertEqual(log_parser.build_gzip_indexes(), 1)
+            self.assertEqual(log_parser.build_gzip_indexes(), 0)
+            self.assertEqual(log_parser.build_gzip_indexes(force=True), 1)
+
+class TestBlockIndex(unittest.TestCase):
+    
+    EVENTS = [
+        "AUTH --pattern \\bid=4242\\b",
+        "GNMI --level ERROR --pattern timeout at endpoint 10\\.0\\.0\\.7 port",
+        "DEVICE --count",
+        "SYS --level CRITICAL",
+        "AUTH --count --pattern (?i)LOGIN",
+    ]
+    
+    # 1000 lines a minute apart: logins, a few GNMI errors, and one SYS
+    # CRITICAL line; id=4242 only in lines 250 and 920
+    def _lines(self, offset=0):
+        from datetime import datetime, timedelta
+        lines = []
+        for i in range(1000):
+            timestamp = (datetime(2025, 6, 1, 10) + timedelta(minutes=i + offset)).isoformat()
+            if i % 100 == 7:
+                lines.append(f"{timestamp} ERROR GNMI timeout at endpoint 10.0.0.{i // 100} port 22\n")
+            elif i == 555:
+                lines.append(f"{timestamp} CRITICAL SYS kernel panic\n")
+            elif i % 3:
+                user_id = 4242 if i in (250, 920) else 1000 + i
+                lines.append(f"{timestamp} INFO AUTH user login id={user_id}\n")
+            else:
+                lines.append(f"{timestamp} INFO DEVICE heartbeat ok {i}\n")
+        return lines
+    
+    def _scan(self, log_dir, events_path, from_time=None, to_time=None, block_index=False):
+        from analyzer import Analyzer
+        analyzer = Analyzer(log_dir, events_path, block_index=block_index)
+        with analyzer.run(from_time, to_time) as result:
+            return (result.total_entries, result.scan_result.counts,
+                    [list(filter_result.lines()) for filter_result in result])
+    
+    def test_skips_blocks_with_same_results(self):
+        from datetime import datetime
+        from parsers.block_index import BlockIndex, block_index_path_for
+        from parsers.block_scanner import BlockIndexScanner
+        from models.scan_result import ScanResult
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, 'a.log'), 'w') as f:
+                f.writelines(self._lines())
+            with gzip.open(os.path.join(temp_dir, 'b.log.gz'), 'wt') as f:
+                f.writelines(self._lines(offset=1000))
+            events_path = os.path.join(temp_dir, 'events.conf')
+            with open(events_path, 'w') as f:
+                f.write("\n".join(self.EVENTS))
+            
+            log_parser = LogParser(temp_dir)
+            for name in ('a.log', 'b.log.gz'):
+                index = log_parser.build_block_index(os.path.join(temp_dir, name), block_lines=100)
+                self.assertEqual(len(index.blocks), 10)
+                self.assertIsNotNone(BlockIndex.load(os.path.join(temp_dir, name)))
+            
+            for from_time, to_time in ((None, None), (datetime(2025, 6, 1, 12, 30), None),
+                                       (datetime(2025, 6, 1, 11, 0), datetime(2025, 6, 1, 22, 15))):
+                self.assertEqual(self._scan(temp_dir, events_path, from_time, to_time, block_index=True),
+                                 self._scan(temp_dir, events_path, from_time, to_time))
+            
+            # Only the blocks holding id=4242 or the SYS line are read
+            filter_set = EventsParser(events_path).parse_filter_set()
+            scanner = BlockIndexScanner(LogParser(temp_dir, event_types=filter_set.event_types),
+                                        FilterSet(filter_set.filters[:1] + filter_set.filters[3:4]))
+            with ScanResult(scanner.filter_set) as scan_result:
+                scanner.scan(scan_result)
+                self.assertEqual(scan_result.counts, [4, 2])
+            self.assertEqual((scanner.blocks, scanner.skipped_blocks), (20, 14))
+            
+            # A changed file gets a new index of default-sized blocks
+            with open(os.path.join(temp_dir, 'a.log'), 'a') as f:
+                f.write("2025-06-03T00:00:00 INFO AUTH user login id=4242\n")
+            self.assertIsNone(BlockIndex.load(os.path.join(temp_dir, 'a.log')))
+            self.assertEqual(self._scan(temp_dir, events_path, block_index=True),
+                             self._scan(temp_dir, events_path))
+            self.assertEqual(len(BlockIndex.load(os.path.join(temp_dir, 'a.log')).blocks), 1)
+            self.assertTrue(os.path.exists(block_index_path_for(os.path.join(temp_dir, 'b.log.gz'))))
+    
+    def test_ascii_word_boundaries_are_not_screened(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # An ASCII \b matches inside "éfoo", which holds no "foo" token
+            with open(os.path.join(temp_dir, 'a.log'), 'w', encoding='utf-8') as f:
+                f.write("2025-06-01T10:00:00 INFO DEVICE éfoo bar\n")
+            events_path = os.path.join(temp_dir, 'events.conf')
+            with open(events_path, 'w') as f:
+                f.write("DEVICE --count --pattern (?a)\\bfoo\\b\n")
+            self.assertEqual(self._scan(temp_dir, events_path)[1], [1])
+            self.assertEqual(self._scan(temp_dir, events_path, block_index=True)[1], [1])
+
+class TestCodecs(unittest.TestCase):
+
+    LINES = "".join(f"2025-06-01T14:{minute:02d}:00 INFO TELEMETRY m{minute}\r\n" for minute in range(60))
+
+    def test_bz2_and_xz_parse_like_plain_files(self):
+        import bz2
+        import lzma
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, 'plain.log'), 'w', encoding='utf-8', newline='') as f:
+                f.write(self.LINES)
+            expected = list(LogParser(temp_dir).parse_all_logs())
+            os.unlink(os.path.join(temp_dir, 'plain.log'))
+
+            for suffix, compress in (('.bz2', bz2.compress), ('.xz', lzma.compress)):
+                log_path = os.path.join(temp_dir, 'app.log' + suffix)
+                with open(log_path, 'wb') as f:
+                    f.write(compress(self.LINES.encode('utf-8')))
+                for threads in (0, 1):
+                    log_parser = LogParser(temp_dir, decompress_threads=threads)
+                    self.assertEqual(list(log_parser.parse_all_logs()), expected)
+                    self.assertEqual(list(log_parser._read_raw_lines(log_path)),
+                                     [line.encode('utf-8') for line in self.LINES.splitlines()])
+                os.unlink(log_path)
+
+    def test_missing_codec_module_warns(self):
+        import io
+        from contextlib import redirect_stdout
+        from parsers.codec_registry import CODECS, register_codec
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, 'app.log.test'), 'wb') as f:
+                f.write(b'\x00')
+            register_codec('.test', None, 'testcodec')
+            try:
+                output = io.StringIO()
+                with redirect_stdout(output):
+                    self.assertEqual(list(LogParser(temp_dir).parse_all_logs()), [])
+                self.assertIn("needs the testcodec module", output.getvalue())
+            finally:
+                del CODECS['.test']
+
+    def test_parallel_gzip_matches_serial(self):
+        from parsers.gzip_index import iter_gzip_blocks, iter_gzip_blocks_parallel
+        with tempfile.TemporaryDirectory() as temp_dir:
+            gz_path = os.path.join(temp_dir, 'app.log.gz')
+            # Many members, and stored data holding a member header signature
+            data = [self.LINES.encode('utf-8') * (index + 1) for index in range(20)]
+            data[5] = b'x' * 3000 + b'\x1f\x8b\x08' + b'y' * 3000 + b'\n'
+            with open(gz_path, 'wb') as f:
+                for index, member in enumerate(data):
+                    f.write(gzip.compress(member, compresslevel=0 if index == 5 else 6))
+
+            with open(gz_path, 'rb') as f:
+                expected = b''.join(iter_gzip_blocks(f))
+            self.assertEqual(expected, b''.join(data))
+            for threads in (1, 2, 4):
+                for split_size in (100, 1000, 1 << 20):
+                    self.assertEqual(b''.join(iter_gzip_blocks_parallel(gz_path, threads, split_size)),
+                                     expected)
+
+            # A single member is decoded whole
+            with open(gz_path, 'wb') as f:
+                f.write(gzip.compress(b''.join(data)))
+            self.assertEqual(b''.join(iter_gzip_blocks_parallel(gz_path, 4, 100)), expected)
+
+    def test_background_iterator(self):
+        from parsers.background import BackgroundIterator
+
+        def numbers():
+            yield from range(100)
+            return 'done'
+
+        items = BackgroundIterator(numbers, depth=2)
+        self.assertEqual(list(items), list(range(100)))
+        self.assertEqual(items.result, 'done')
+
+        def failing():
+            yield 1
+            raise ValueError('broken')
+
+        items = BackgroundIterator(failing)
+        self.assertEqual(next(items), 1)
+        with self.assertRaises(ValueError):
+            next(items)
+
+        # Closing early stops the producer
+        items = BackgroundIterator(lambda: iter(range(10 ** 9)), depth=1)
+        self.assertEqual(next(items), 0)
+        items.close()
+        items._thread.join(5)
+        self.assertFalse(items._thread.is_alive())
+
+class TestBinaryScanner(unittest.TestCase):
+    
+    LINES = [
+        b"2025-06-01T14:03:05 INFO TELEMETRY Iteration time: 1.2 sec\r\n",
+        b"2025-06-01T14:03:06 ERROR GNMI timeout at endpoint a\rb\n",
+        b"2025-06-01T14:03:07 ERROR GNMI unresponsive telemetry at endpoint \xc3\xa9\xc2\xa0\n",
+        b"\x1c2025-06-01T14:03:08 WARNING DEVICE disk space low: 91%\x1cfull\n",
+        b"2025-06-01T14:03:09 ERROR GNMI bad \xff byte\n",
+        b"2025-06-01T14:03:0x ERROR GNMI bad timestamp\n",
+        b"\n",
+        b"2025-06-01T16:00:00 ERROR GNMI connection timeout at endpoint z",
+    ]
+    
+    EVENTS = [
+        "TELEMETRY --pattern ^Iteration time:\\s\\d+\\.\\d+\\ssec$",
+        "GNMI --level ERROR",
+        "GNMI --pattern endpoint\\s\\S+$",
+        "DEVICE --count --pattern full$",
+        "DEVICE --pattern low:\\s\\d+%\\sfull$",
+    ]
+    
+    def _scan(self, scan, log_dir, events_path, **kwargs):
+        from models.scan_result import ScanResult
+        filter_set = EventsParser(events_path).parse_filter_set()
+        with ScanResult(filter_set) as scan_result:
+            scan(LogParser(log_dir, event_types=filter_set.event_types, **kwargs),
+                 filter_set, scan_result)
+            return (scan_result.total_entries, scan_result.counts,
+                    [list(scan_result.matches(i)) for i in range(len(filter_set))])
+    
+    def test_matches_text_scan(self):
+        from datetime import datetime
+        from parsers.binary_scanner import BinaryScanner
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, 'a.log'), 'wb') as f:
+                f.writelines(line for line in self.LINES if b'\xff' not in line)
+            with gzip.open(os.path.join(temp_dir, 'b.log.gz'), 'wb') as f:
+                f.writelines(self.LINES[:4])
+            events_path = os.path.join(temp_dir, 'events.txt')
+            with open(events_path, 'w') as f:
+                f.write("\n".join(self.EVENTS))
+            
+            for from_time, to_time in ((None, None), (datetime(2025, 6, 1, 14, 3, 6), None)):
+                binary = self._scan(lambda parser, filters, result: BinaryScanner(parser, filters)
+                                    .scan(result, from_time, to_time), temp_dir, events_path)
+                text = self._scan(lambda parser, filters, result: result.collect(
+                    parser.parse_all_logs(from_time, to_time)), temp_dir, events_path)
+                self.assertEqual(binary, text)
+                self.assertGreater(binary[0], 0)
+    
+    def test_undecodable_bytes_are_replaced(self):
+        from parsers.binary_scanner import BinaryScanner
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, 'a.log'), 'wb') as f:
+                f.writelines(self.LINES)
+            events_path = os.path.join(temp_dir, 'events.txt')
+            with open(events_path, 'w') as f:
+                f.write("GNMI --pattern bad")
+            
+            total, counts, lines = self._scan(
+                lambda parser, filters, result: BinaryScanner(parser, filters).scan(result),
+                temp_dir, events_path)
+            self.assertEqual(counts, [1])
+            self.assertEqual(lines, [["2025-06-01T14:03:09 ERROR GNMI bad \ufffd byte"]])
+
+class TestStatsScanner(unittest.TestCase):
+    
+    def test_matches_text_scan_and_counts_lines(self):
+        from datetime import datetime
+        from models.run_stats import RunStats
+        from parsers.stats_scanner import StatsScanner
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, 'a.log'), 'wb') as f:
+                f.write(b"2025-06-01T14:03:10 INFO AUDIT not asked for\n")
+                f.writelines(line for line in TestBinaryScanner.LINES if b'\xff' not in line)
+            with gzip.open(os.path.join(temp_dir, 'b.log.gz'), 'wb') as f:
+                f.writelines(TestBinaryScanner.LINES[:4])
+            events_path = os.path.join(temp_dir, 'events.txt')
+            with open(events_path, 'w') as f:
+                f.write("\n".join(TestBinaryScanner.EVENTS))
+            
+            from_time = datetime(2025, 6, 1, 14, 3, 6)
+            stats = RunStats(len(TestBinaryScanner.EVENTS))
+            scanned = TestBinaryScanner._scan(
+                None, lambda parser, filters, result: StatsScanner(parser, filters, stats)
+                .scan(result, from_time), temp_dir, events_path)
+            text = TestBinaryScanner._scan(
+                None, lambda parser, filters, result: result.collect(parser.parse_all_logs(from_time)),
+                temp_dir, events_path)
+            self.assertEqual(scanned, text)
+            
+            a_log, b_log = stats.files[0].to_dict(), stats.files[1].to_dict()
+            self.assertEqual(a_log['path'], os.path.join(temp_dir, 'a.log'))
+            # "...endpoint a\rb" is two lines; "b" and the bad timestamp are rejected
+            self.assertEqual((a_log['lines'], a_log['rejected'], a_log['skipped'], a_log['out_of_range']),
+                             (9, 2, 1, 1))
+            self.assertEqual(a_log['bytes'], a_log['size'])
+            self.assertGreater(b_log['bytes'], b_log['size'] - 40)
+            self.assertEqual(stats.entries, scanned[0])
+            
+            filters = [filter_stats.to_dict() for filter_stats in stats.filters]
+            self.assertEqual([f['matches'] for f in filters], scanned[1])
+            # GNMI --level ERROR is tested on every GNMI ERROR entry in the window
+            self.assertEqual(filters[1]['evaluations'], 5)
+            self.assertTrue(all(f['evaluations'] >= f['matches'] for f in filters))
+            self.assertEqual(set(stats.stages), {'read', 'parse', 'match', 'collect'})
+            # Filters are only timed on the entries they apply to
+            self.assertTrue(all((f['seconds'] > 0) == (f['evaluations'] > 0) for f in filters))
+            
+            # --stats with --binary keeps the binary pipeline
+            from analyzer import Analyzer
+            from parsers.binary_scanner import BinaryScanner
+            analyzer = Analyzer(temp_dir, events_path, binary=True, stats=RunStats())
+            self.assertIsInstance(analyzer._scanner(), BinaryScanner)
+
+class TestScanCache(unittest.TestCase):
+    
+    EVENTS = "TELEMETRY --count\nGNMI --level ERROR\nDEVICE --pattern disk\n"
+    
+    def _scan(self, temp_dir, cache_dir=None, from_time=None, log_parser=None, max_lines=None):
+        from models.scan_result import ScanResult
+        from parsers.scan_cache import CachedScanner
+        filter_set = EventsParser(os.path.join(temp_dir, 'events.txt')).parse_filter_set()
+        log_dir = os.path.join(temp_dir, 'logs')
+        log_parser = log_parser or LogParser(log_dir, event_types=filter_set.event_types)
+        with ScanResult(filter_set, max_lines) as scan_result:
+            if cache_dir is None:
+                scan_result.collect(log_parser.parse_all_logs(from_time))
+            else:
+                CachedScanner(log_parser, filter_set, cache_dir).scan(scan_result, from_time)
+            return (scan_result.total_entries, scan_result.counts,
+                    [list(scan_result.matches(i)) for i in range(len(filter_set))])
+    
+    def _assert_cached_scan_matches(self, temp_dir, cache_dir):
+        from datetime import datetime
+        for from_time in (None, datetime(2025, 6, 1, 14, 2, 0)):
+            self.assertEqual(self._scan(temp_dir, cache_dir, from_time),
+                             self._scan(temp_dir, None, from_time))
+    
+    def test_appends_rewrites_and_time_windows(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_dir = os.path.join(temp_dir, 'logs')
+            cache_dir = os.path.join(temp_dir, 'cache')
+            os.mkdir(log_dir)
+            with open(os.path.join(temp_dir, 'events.txt'), 'w') as f:
+                f.write(self.EVENTS)
+            log_path = os.path.join(log_dir, 'app.log')
+            with open(log_path, 'w') as f:
+                f.write(log_line(0) + log_line(1, "TELEMETRY") + log_line(2))
+            with gzip.open(os.path.join(log_dir, 'old.log.gz'), 'wt') as f:
+                f.write(log_line(3, "DEVICE", "disk space low"))
+            self._assert_cached_scan_matches(temp_dir, cache_dir)
+            
+            # Appended lines, the last one still being written
+            with open(log_path, 'a') as f:
+                f.write(log_line(4) + "2025-06-01T14:05:00 ERROR GNMI half")
+            self._assert_cached_scan_matches(temp_dir, cache_dir)
+            with open(log_path, 'a') as f:
+                f.write(" written\n" + log_line(6, "TELEMETRY"))
+            self._assert_cached_scan_matches(temp_dir, cache_dir)
+            
+            # Rewritten in place (rotation with copytruncate, then new lines)
+            with open(log_path, 'w') as f:
+                f.write(log_line(7, "DEVICE", "disk replaced") * 20)
+            self._assert_cached_scan_matches(temp_dir, cache_dir)
+            
+            # Files removed from the directory lose their checkpoints
+            os.unlink(os.path.join(log_dir, 'old.log.gz'))
+            self._assert_cached_scan_matches(temp_dir, cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+    
+    def test_unchanged_files_are_not_read(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_dir = os.path.join(temp_dir, 'logs')
+            cache_dir = os.path.join(temp_dir, 'cache')
+            os.mkdir(log_dir)
+            with open(os.path.join(temp_dir, 'events.txt'), 'w') as f:
+                f.write(self.EVENTS)
+            with open(os.path.join(log_dir, 'app.log'), 'w') as f:
+                f.write(log_line(0) + log_line(1))
+            expected = self._scan(temp_dir, cache_dir)
+            
+            log_parser = LogParser(log_dir)
+            def fail(*args):
+                raise AssertionError("file was read")
+            log_parser._parse_file_range = log_parser._parse_single_file = fail
+            log_parser._read_blocks = log_parser._decompressed_blocks = fail
+            self.assertEqual(self._scan(temp_dir, cache_dir, log_parser=log_parser), expected)
+    
+    def test_kept_lines_are_capped(self):
+        import json
+        from datetime import datetime
+        from parsers.scan_cache import CachedScanner
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_dir = os.path.join(temp_dir, 'logs')
+            cache_dir = os.path.join(temp_dir, 'cache')
+            os.mkdir(log_dir)
+            with open(os.path.join(temp_dir, 'events.txt'), 'w') as f:
+                f.write(self.EVENTS)
+            log_path = os.path.join(log_dir, 'app.log')
+            with open(log_path, 'w') as f:
+                f.writelines(log_line(minute) for minute in range(50))
+            
+            # Windows and limits past the kept lines read the file again
+            for max_lines in (5, 3):
+                for from_time in (None, datetime(2025, 6, 1, 14, 30, 0)):
+                    self.assertEqual(self._scan(temp_dir, cache_dir, from_time, max_lines=max_lines),
+                                     self._scan(temp_dir, None, from_time, max_lines=max_lines))
+            [name] = os.listdir(cache_dir)
+            with open(os.path.join(cache_dir, name)) as f:
+                checkpoint = json.load(f)
+            self.assertFalse(checkpoint['partial']['by_offset'])
+            self.assertEqual(len(checkpoint['partial']['lines'][1]), 5)
+            
+            # Without a limit, the offsets of all matches are kept instead of
+            # the lines, and serve any limit afterwards
+            for max_lines in (None, 3, 8):
+                for from_time in (None, datetime(2025, 6, 1, 14, 30, 0)):
+                    self.assertEqual(self._scan(temp_dir, cache_dir, from_time, max_lines=max_lines),
+                                     self._scan(temp_dir, None, from_time, max_lines=max_lines))
+            with open(os.path.join(cache_dir, name)) as f:
+                checkpoint = json.load(f)
+            self.assertTrue(checkpoint['partial']['by_offset'])
+            self.assertEqual(len(checkpoint['partial']['lines'][1]['deltas']), 50)
+            self.assertLess(os.path.getsize(os.path.join(cache_dir, name)),
+                            os.path.getsize(log_path))
+            
+            # An append keeps the first lines, not the latest ones
+            with open(log_path, 'a') as f:
+                f.write(log_line(55))
+            self.assertEqual(self._scan(temp_dir, cache_dir, max_lines=8),
+                             self._scan(temp_dir, None, max_lines=8))
+            
+            # No complete line was hashed, so growth is not trusted as an append
+            checkpoint.update(size=1, offset=0, head_size=0, head='')
+            scanner = CachedScanner(LogParser(log_dir), EventsParser(
+                os.path.join(temp_dir, 'events.txt')).parse_filter_set(), cache_dir)
+            self.assertFalse(scanner._is_valid(checkpoint, log_path, os.stat(log_path)))
+    
+    def test_located_entries_match_file_offsets(self):
+        from parsers.scan_cache import _located_raw_lines, located_entries
+        data = b"".join(log_line(minute).encode('ascii') for minute in range(20))
+        data = data.replace(b"\n", b"\r\n", 5).replace(b"\n", b"\r", 3)
+        expected = list(located_entries([data]))
+        self.assertEqual(len(expected), 20)
+        for offset, entry in expected:
+            self.assertTrue(data[offset:].startswith(entry.format_line().encode('ascii')))
+        # Offsets do not depend on where the blocks split the lines
+        for size in (1, 7, 64):
+            blocks = [data[start:start + size] for start in range(0, len(data), size)]
+            located = [(offset, entry.format_line()) for offset, entry in located_entries(blocks)]
+            self.assertEqual(located, [(offset, entry.format_line()) for offset, entry in expected])
+            offsets = [offset for offset, _ in _located_raw_lines(blocks)]
+            self.assertEqual(offsets, sorted(set(offsets)))
+    
+    def test_top_and_distinct_keep_sketches(self):
+        import json
+        from datetime import datetime
+        from models.scan_result import ScanResult
+        from parsers.scan_cache import CachedScanner
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_dir = os.path.join(temp_dir, 'logs')
+            cache_dir = os.path.join(temp_dir, 'cache')
+            os.mkdir(log_dir)
+            events_path = os.path.join(temp_dir, 'events.txt')
+            with open(events_path, 'w') as f:
+                f.write("GNMI --pattern disk (\\w+) --top 2 --group-by 1 --distinct 1\n")
+            filter_set = EventsParser(events_path).parse_filter_set()
+            with open(os.path.join(log_dir, 'a.log'), 'w') as f:
+                f.writelines(log_line(minute, message=f"disk d{minute % 7}") for minute in range(30))
+            with open(os.path.join(log_dir, 'b.log'), 'w') as f:
+                f.writelines(log_line(minute, message=f"disk e{minute % 3}") for minute in range(40, 50))
+            
+            def scan(from_time, log_parser=None, cached=True):
+                log_parser = log_parser or LogParser(log_dir, event_types=filter_set.event_types)
+                with ScanResult(filter_set) as scan_result:
+                    if cached:
+                        CachedScanner(log_parser, filter_set, cache_dir).scan(scan_result, from_time)
+                    else:
+                        scan_result.collect(log_parser.parse_all_logs(from_time))
+                    sketch = scan_result.sketches[0]
+                    return (scan_result.counts, sketch.top.top(2), sketch.distinct.estimate())
+            
+            windows = (None, datetime(2025, 6, 1, 14, 35), datetime(2025, 6, 1, 14, 20))
+            for from_time in windows:
+                self.assertEqual(scan(from_time), scan(from_time, cached=False))
+            with open(os.path.join(log_dir, 'a.log'), 'a') as f:
+                f.write(log_line(30, message="disk d9"))
+            for from_time in windows:
+                self.assertEqual(scan(from_time), scan(from_time, cached=False))
+            
+            # Checkpoints hold the sketch, not the matching lines
+            for name in os.listdir(cache_dir):
+                with open(os.path.join(cache_dir, name)) as f:
+                    partial = json.load(f)['partial']
+                self.assertEqual(partial['lines'], [None])
+                self.assertIsNotNone(partial['sketches'][0])
+            
+            # A window covering whole files needs no re-read
+            log_parser = LogParser(log_dir, event_types=filter_set.event_types)
+            def fail(*args):
+                raise AssertionError("file was read")
+            log_parser._parse_file_range = log_parser._parse_single_file = fail
+            log_parser._read_blocks = log_parser._decompressed_blocks = fail
+            self.assertEqual(scan(windows[1], log_parser), scan(windows[1], cached=False))
+
+class TestLogIndex(unittest.TestCase):
+    
+    EVENTS = "TELEMETRY --count\nGNMI --level ERROR\nDEVICE --pattern disk\n"
+    
+    def _result(self, scan_result):
+        return (scan_result.total_entries, scan_result.counts,
+                [list(scan_result.matches(i)) for i in range(len(scan_result.filter_set))])
+    
+    def _assert_query_matches_scan(self, log_index, log_dir, filter_set):
+        from datetime import datetime
+        from models.scan_result import ScanResult
+        for from_time in (None, datetime(2025, 6, 1, 14, 2, 0)):
+            with ScanResult(filter_set) as expected:
+                log_parser = LogParser(log_dir, event_types=filter_set.event_types)
+                expected.collect(log_parser.parse_all_logs(from_time))
+                with log_index.query(filter_set, from_time) as queried:
+                    self.assertEqual(self._result(queried), self._result(expected))
+    
+    def test_queries_follow_appends_and_rewrites(self):
+        from parsers.log_index import LogIndex
+        filter_set = FilterSet([EventFilter.from_line(line) for line in self.EVENTS.splitlines()])
+        with tempfile.TemporaryDirectory() as log_dir:
+            log_path = os.path.join(log_dir, 'app.log')
+            with open(log_path, 'w') as f:
+                f.write(log_line(0) + log_line(1, "TELEMETRY") + log_line(3) + log_line(2))
+            with gzip.open(os.path.join(log_dir, 'old.log.gz'), 'wt') as f:
+                f.write(log_line(3, "DEVICE", "disk space low"))
+            log_index = LogIndex(LogParser(log_dir), 1 << 20)
+            log_index.refresh(load=True)
+            self.assertEqual(log_index.status()['loaded_files'], 2)
+            self._assert_query_matches_scan(log_index, log_dir, filter_set)
+            
+            # Repeated queries are answered from the kept results
+            hits = log_index.result_hits
+            self._assert_query_matches_scan(log_index, log_dir, filter_set)
+            self.assertEqual(log_index.result_hits, hits + 2)
+            
+            # Appended lines, the last one still being written
+            with open(log_path, 'a') as f:
+                f.write(log_line(4) + "2025-06-01T14:05:00 ERROR GNMI half")
+            self._assert_query_matches_scan(log_index, log_dir, filter_set)
+            with open(log_path, 'a') as f:
+                f.write(" written\n" + log_line(6, "TELEMETRY"))
+            self._assert_query_matches_scan(log_index, log_dir, filter_set)
+            self.assertEqual(log_index.loads, 2)
+            
+            # Rewritten in place, and removed
+            with open(log_path, 'w') as f:
+                f.write(log_line(7, "DEVICE", "disk replaced") * 20)
+            self._assert_query_matches_scan(log_index, log_dir, filter_set)
+            os.unlink(os.path.join(log_dir, 'old.log.gz'))
+            self._assert_query_matches_scan(log_index, log_dir, filter_set)
+            self.assertEqual(log_index.status()['loaded_files'], 1)
+    
+    def test_least_recently_used_files_are_evicted(self):
+        from parsers.log_index import ENTRY_OVERHEAD, LogIndex
+        filter_set = FilterSet([EventFilter.from_line("GNMI --count")])
+        with tempfile.TemporaryDirectory() as log_dir:
+            for name in ('a.log', 'b.log', 'c.log'):
+                with open(os.path.join(log_dir, name), 'w') as f:
+                    f.write(log_line(0) * 10)
+            # Room for two of the three files
+            log_index = LogIndex(LogParser(log_dir), 25 * (ENTRY_OVERHEAD + len("disk failure")))
+            with log_index.query(filter_set) as queried:
+                self.assertEqual(queried.counts, [30])
+            status = log_index.status()
+            self.assertLessEqual(status['memory_bytes'], status['memory_limit_bytes'])
+            self.assertEqual(status['loaded_files'], 2)
+            self.assertEqual(status['evictions'], 1)
+
+class TestLogFollower(unittest.TestCase):
+    
+    def _poll(self, follower):
+        from models.scan_result import ScanResult
+        with ScanResult(follower.filter_set) as scan_result:
+            follower.poll(scan_result)
+            return scan_result.counts[0], list(scan_result.matches(1))
+    
+    def test_appends_rotation_and_truncation(self):
+        from parsers.log_follower import LogFollower
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filter_set = FilterSet([EventFilter.from_line("DEVICE --count"),
+                                    EventFilter.from_line("DEVICE --pattern disk")])
+            log_path = os.path.join(temp_dir, 'app.log')
+            with open(log_path, 'w') as f:
+                f.write(log_line(0, "DEVICE") + log_line(1, "DEVICE", "fan failure") + log_line(2, "DEVICE").strip())
+            with gzip.open(os.path.join(temp_dir, 'old.log.gz'), 'wt') as f:
+                f.write(log_line(59, "DEVICE"))
+            
+            follower = LogFollower(LogParser(temp_dir), filter_set)
+            try:
+                # The first poll reads the unterminated last line, like a batch run
+                self.assertEqual(self._poll(follower), (4, [log_line(0, "DEVICE").strip(), log_line(2, "DEVICE").strip(),
+                                                            log_line(59, "DEVICE").strip()]))
+                self.assertEqual(self._poll(follower), (0, []))
+                
+                # Later, an unfinished line is held back while the file grows,
+                # and read once it is completed or the file stops growing
+                with open(log_path, 'a') as f:
+                    f.write("\n2025-06-01T14:03:00 ERROR")
+                self.assertEqual(self._poll(follower), (0, []))
+                with open(log_path, 'a') as f:
+                    f.write(" DEVICE disk late\r\n" + log_line(4, "DEVICE") + log_line(5, "DEVICE", "disk idle").strip())
+                self.assertEqual(self._poll(follower), (2, ["2025-06-01T14:03:00 ERROR DEVICE disk late",
+                                                            log_line(4, "DEVICE").strip()]))
+                self.assertEqual(self._poll(follower), (1, [log_line(5, "DEVICE", "disk idle").strip()]))
+                
+                # Rotation: lines written to the old file before the rename
+                # are read before the new file
+                with open(log_path, 'a') as f:
+                    f.write("\n" + log_line(6, "DEVICE"))
+                os.rename(log_path, log_path + '.1')
+                with open(log_path, 'w') as f:
+                    f.write(log_line(7, "DEVICE"))
+                with gzip.open(os.path.join(temp_dir, 'app.log.1.log.gz'), 'wt') as f:
+                    f.write(log_line(6, "DEVICE"))
+                self.assertEqual(self._poll(follower), (2, [log_line(6, "DEVICE").strip(), log_line(7, "DEVICE").strip()]))
+                
+                # Truncation: read again from the start
+                with open(log_path, 'w') as f:
+                    f.write(log_line(8, "DEVICE", "fan"))
+                self.assertEqual(self._poll(follower), (1, []))
+                self.assertEqual(follower.totals, [10, 8])
+            finally:
+                follower.close()
+
+class TestCompactStore(unittest.TestCase):
+    
+    EVENTS = [
+        "DEVICE --count --level WARNING",
+        "GNMI --level ERROR",
+        "TELEMETRY --count",
+        "GNMI --pattern ^connection timeout at endpoint\\s.+$",
+        "DEVICE --pattern température\\s\\d+",
+        "OTHER --count",
+        "DEVICE --pattern endpoint e(\\d) --top 3 --group-by 1 --distinct 1",
+    ]
+    
+    def _backends(self):
+        from parsers import compact_store
+        return [False, True] if compact_store.numpy is not None else [False]
+    
+    def test_queries_match_text_scan(self):
+        from datetime import datetime
+        from models.scan_result import ScanResult
+        from parsers.compact_store import CompactScanner, CompactStore, CompactWriter
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_dir = os.path.join(temp_dir, 'logs')
+            store_dir = os.path.join(temp_dir, 'compact')
+            os.mkdir(log_dir)
+            with open(os.path.join(log_dir, 'a.log'), 'w', encoding='utf-8') as f:
+                for i in range(300):
+                    level = ("INFO", "WARNING", "ERROR")[i % 3]
+                    event_type = ("DEVICE", "GNMI", "TELEMETRY", "DEVICE")[i % 4]
+                    message = (f"connection timeout at endpoint e{i}" if i % 5 else
+                               f"température {i}")
+                    f.write(f"2025-06-01T14:{i // 60:02d}:{i % 60:02d} {level} {event_type} {message}\n")
+            with gzip.open(os.path.join(log_dir, 'b.log.gz'), 'wt') as f:
+                f.write("2025-06-01T13:00:00 ERROR GNMI connection timeout at endpoint gz\n")
+            
+            # An interrupted rewrite leaves no store behind
+            writer = CompactWriter(store_dir)
+            writer.add_all(LogParser(log_dir).parse_all_logs())
+            writer.close()
+            self.assertTrue(CompactStore.is_store(store_dir))
+            CompactWriter(store_dir).add_all(LogParser(log_dir).parse_all_logs())
+            self.assertFalse(CompactStore.is_store(store_dir))
+            
+            writer = CompactWriter(store_dir)
+            writer.add_all(LogParser(log_dir).parse_all_logs())
+            writer.close()
+            self.assertTrue(CompactStore.is_store(store_dir))
+            
+            filter_set = FilterSet([EventFilter.from_line(line) for line in self.EVENTS])
+            windows = [(None, None), (datetime(2025, 6, 1, 14, 1, 0), datetime(2025, 6, 1, 14, 3, 30))]
+            for from_time, to_time in windows:
+                for max_lines in (None, 2):
+                    with ScanResult(filter_set, max_lines) as expected:
+                        expected.collect(LogParser(log_dir).parse_all_logs(from_time, to_time))
+                        expected_lines = [list(expected.matches(i)) for i in range(len(filter_set))]
+                        for vectorized in self._backends():
+                            with CompactStore(store_dir, vectorized) as store, \
+                                    ScanResult(filter_set, max_lines) as scan_result:
+                                CompactScanner(store, filter_set).scan(scan_result, from_time, to_time)
+                                self.assertEqual(scan_result.counts, expected.counts)
+                                self.assertEqual([list(scan_result.matches(i)) for i in range(len(filter_set))],
+                                                 expected_lines)
+                                self.assertEqual(scan_result.sketches[-1].top.top(3),
+                                                 expected.sketches[-1].top.top(3))
+                                self.assertEqual(scan_result.sketches[-1].distinct.estimate(),
+                                                 expected.sketches[-1].distinct.estimate())
+                                self.assertGreater(scan_result.total_entries, 0)
+
 class TestEventsParser(unittest.TestCase):
     def test_events_file_parsing(self):
         # Create temporary events file
@@ -0,0 +1,153 @@
+from abc import ABC, abstractmethod
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, TextIO
+from json.encoder import encode_basestring_ascii
+import json
+from analyzer import AnalysisResult, FilterResult
+from models.event_filter import EventFilter
+from models.sketches import FilterSketch
+from models.timestamp import from_epoch
+
+# Lines joined into one write; large enough that per-write overhead vanishes
+CHUNK_LINES = 8192
+
+# The --top and --distinct report of a filter as text lines
+def sketch_lines(filter_obj: EventFilter, sketch: FilterSketch) -> List[str]:
+    lines = []
+    if sketch.top is not None:
+        lines.append(f"Top {filter_obj.top} by {filter_obj.group_by} "
+                     f"(counts may be up to {sketch.top.max_error} high):")
+        for key, count, error in sketch.top.top(filter_obj.top):
+            lines.append(f"{key} {count}" + (f" (at least {count - error})" if error else ''))
+    if sketch.distinct is not None:
+        lines.append(f"Distinct {filter_obj.distinct}: ~{sketch.distinct.estimate()} "
+                     f"(±{sketch.distinct.relative_error:.1%})")
+    return lines
+
+class ResultWriter(ABC):
+    """Writes an AnalysisResult to a text stream in large chunks instead of one print per line"""
+
+    def __init__(self, output: TextIO):
+        self.output = output
+
+    @abstractmethod
+    def write(self, result: AnalysisResult) -> None:
+        pass
+
+    # Write items separated by separator, CHUNK_LINES at a time
+    def _write_joined(self, items: Iterable[str], separator: str = '\n') -> int:
+        write = self.output.write
+        items = iter(items)
+        written = 0
+        while True:
+            chunk = list(islice(items, CHUNK_LINES))
+            if not chunk:
+                return written
+            if written:
+                write(separator)
+            write(separator.join(chunk))
+            written += len(chunk)
+
+class TextWriter(ResultWriter):
+    """The classic report: each filter's description, then its count or matching lines"""
+
+    def __init__(self, output: TextIO, series: bool = False):
+        super().__init__(output)
+        # Print each filter's time buckets under its result
+        self.series = series
+
+    def write(self, result: AnalysisResult) -> None:
+        write = self.output.write
+        for filter_result in result:
+            if filter_result.count_only:
+                write(f"{filter_result.description} count — matches: {filter_result.matches} entries\n")
+                if filter_result.sketch is not None:
+                    for line in sketch_lines(filter_result.filter, filter_result.sketch):
+                        write(line + '\n')
+            else:
+                write(f"{filter_result.description} — matching log lines:\n")
+                if self._write_joined(filter_result.lines()):
+                    write('\n')
+
+            if self.series:
+                write(f"Matches per {result.bucket_seconds}s bucket:\n")
+                if self._write_joined(f"{from_epoch(start).isoformat()} {count}"
+                                      for start, count in filter_result.series()):
+                    write('\n')
+
+            write('\n')  # Empty line between results
+
+# The fields of a kept matching line as JSON object members; strings are
+# encoded directly, which is several times faster than json.dumps per line
+def _line_members(line: str) -> str:
+    parts = line.split(' ', 3)
+    if len(parts) < 4:
+        parts += [''] * (4 - len(parts))
+    encode = encode_basestring_ascii
+    return '"timestamp": %s, "level": %s, "event_type": %s, "message": %s}' % (
+        encode(parts[0]), encode(parts[1]), encode(parts[2]), encode(parts[3]))
+
+def _series_json(filter_result: FilterResult) -> Iterator[str]:
+    return (f'[{json.dumps(from_epoch(start).isoformat())}, {count}]'
+            for start, count in filter_result.series())
+
+class JsonWriter(ResultWriter):
+    """One JSON document with the run totals and every filter's metadata, lines and series
+
+    Matching lines are split into timestamp, level, event_type and message.
+    They are written as they are read, so a spilled result is never held in
+    memory.
+    """
+
+    def write(self, result: AnalysisResult) -> None:
+        write = self.output.write
+        write(f'{{"total_entries": {result.total_entries}, '
+              f'"bucket_seconds": {json.dumps(result.bucket_seconds)}, "filters": [')
+        for position, filter_result in enumerate(result):
+            # The metadata object, left open for lines and series
+            write((',\n' if position else '\n') + json.dumps(filter_result.to_dict())[:-1])
+            if not filter_result.count_only:
+                write(', "lines": [')
+                self._write_joined(('{' + _line_members(line) for line in filter_result.lines()), ', ')
+                write(']')
+            if result.bucket_seconds is not None:
+                write(', "series": [')
+                self._write_joined(_series_json(filter_result), ', ')
+                write(']')
+            write('}')
+        write('\n]}\n')
+
+class NdjsonWriter(ResultWriter):
+    """One JSON object per line, for streaming into other tools
+
+    A "summary" record comes first. Each filter then gets a "filter" record
+    (its metadata and match count), a "line" record per kept matching line
+    and a "bucket" record per non-empty time bucket; all carry the filter's
+    index.
+    """
+
+    def write(self, result: AnalysisResult) -> None:
+        write = self.output.write
+        write(json.dumps({'type': 'summary', 'total_entries': result.total_entries,
+                          'bucket_seconds': result.bucket_seconds}) + '\n')
+        for filter_result in result:
+            record: Dict = {'type': 'filter'}
+            record.update(filter_result.to_dict())
+            write(json.dumps(record) + '\n')
+
+            line_prefix = f'{{"type": "line", "index": {filter_result.index}, '
+            if self._write_joined(line_prefix + _line_members(line) for line in filter_result.lines()):
+                write('\n')
+
+            bucket_prefix = f'{{"type": "bucket", "index": {filter_result.index}, '
+            if self._write_joined(f'{bucket_prefix}"start": {json.dumps(from_epoch(start).isoformat())}, '
+                                  f'"count": {count}}}'
+                                  for start, count in filter_result.series()):
+                write('\n')
+
+# --output format -> writer class
+WRITERS = {
+    'text': TextWriter,
+    'json': JsonWriter,
+    'ndjson': NdjsonWriter,
+}